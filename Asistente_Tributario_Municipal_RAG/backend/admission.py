@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, Optional
+
+from metrics import metrics
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("ADMISSION")
+# ---------------------------------------------------------
+
+# Carriles de prioridad: el interactivo (Streamlit) se atiende antes que las integraciones batch
+LANES = ("interactive", "batch")
+
+
+class AdmissionRejected(Exception):
+    """
+    No hubo lugar para la etapa LLM: la cola del carril estaba llena o venció
+    la espera máxima. El llamador responde degradado en vez de esperar o fallar.
+    """
+
+    def __init__(self, lane: str, reason: str, waited: float):
+        super().__init__(f"Request {lane} rechazado por {reason} tras {waited * 1000:.0f} ms")
+        self.lane = lane
+        self.reason = reason
+        self.waited = waited
+
+
+class _Waiter:
+    __slots__ = ("lane", "notify", "granted")
+
+    def __init__(self, lane: str, notify: Callable[[], Any]):
+        self.lane = lane
+        self.notify = notify
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Control de admisión de la etapa LLM del pipeline RAG:
+
+    - max_concurrent llamados al LLM a la vez; el resto espera en la cola
+      de su carril (acotada por queue_limits) hasta max_wait_ms.
+    - al liberarse un lugar se atiende primero la cola interactiva; los
+      requests batch ocupan como mucho batch_max_share de los lugares, así
+      un pico batch no deja sin lugar a los interactivos.
+    - cola llena o espera vencida → AdmissionRejected (el llamador degrada).
+
+    Sirve desde hilos y desde el event loop: el estado se protege con un
+    lock y cada espera se despierta con un Event o un Future según el caso.
+    """
+
+    def __init__(self, max_concurrent: int, queue_limits: Dict[str, int], max_wait_ms: Dict[str, float],
+                 batch_max_share: float = 0.75):
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_limits = dict(queue_limits)
+        self.max_wait = {lane: ms / 1000 for lane, ms in max_wait_ms.items()}
+        self.batch_limit = max(1, int(self.max_concurrent * batch_max_share))
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._in_flight = {lane: 0 for lane in LANES}
+        self._admitted = {lane: 0 for lane in LANES}
+        self._shed = {lane: {"queue_full": 0, "timeout": 0} for lane in LANES}
+
+    # --------- API ---------
+
+    @contextmanager
+    def slot(self, lane: str):
+        """
+        Ocupa un lugar durante el bloque (llamado sync); devuelve los
+        segundos esperados en la cola.
+        """
+        t0 = time.monotonic()
+        event = threading.Event()
+        waiter = self._enter(lane, event.set, t0)
+        if waiter is not None and not event.wait(self.max_wait[lane]):
+            if not self._abandon(waiter):
+                self._reject(lane, "timeout", t0)
+        try:
+            yield self._admit(lane, t0, queued=waiter is not None)
+        finally:
+            self._release(lane)
+
+    @asynccontextmanager
+    async def slot_async(self, lane: str):
+        """
+        Igual que slot pero esperando en el event loop. Si el request se
+        cancela (cliente desconectado) sale de la cola o devuelve el lugar.
+        """
+        t0 = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enter(lane, lambda: loop.call_soon_threadsafe(_resolve, future), t0)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, self.max_wait[lane])
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    self._reject(lane, "timeout", t0)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release(lane)
+                raise
+        try:
+            yield self._admit(lane, t0, queued=waiter is not None)
+        finally:
+            self._release(lane)
+
+    # --------- Cola ---------
+
+    def _enter(self, lane: str, notify: Callable[[], Any], t0: float) -> Optional[_Waiter]:
+        """
+        Toma un lugar libre (devuelve None) o encola al request (devuelve su
+        _Waiter); con la cola del carril llena lo rechaza.
+        """
+        if lane not in LANES:
+            raise ValueError(f"Carril de admisión desconocido: {lane} (opciones: {LANES})")
+        with self._lock:
+            if self._can_start_locked(lane) and not self._queues[lane]:
+                self._in_flight[lane] += 1
+                return None
+            if len(self._queues[lane]) < self.queue_limits[lane]:
+                waiter = _Waiter(lane, notify)
+                self._queues[lane].append(waiter)
+                return waiter
+        self._reject(lane, "queue_full", t0)
+
+    def _can_start_locked(self, lane: str) -> bool:
+        if sum(self._in_flight.values()) >= self.max_concurrent:
+            return False
+        if lane == "batch":
+            return self._in_flight["batch"] < self.batch_limit and not self._queues["interactive"]
+        return True
+
+    def _release(self, lane: str):
+        with self._lock:
+            self._in_flight[lane] -= 1
+            # El lugar pasa directo al próximo en espera, primero el carril interactivo
+            while sum(self._in_flight.values()) < self.max_concurrent:
+                if self._queues["interactive"]:
+                    waiter = self._queues["interactive"].popleft()
+                elif self._queues["batch"] and self._in_flight["batch"] < self.batch_limit:
+                    waiter = self._queues["batch"].popleft()
+                else:
+                    break
+                waiter.granted = True
+                self._in_flight[waiter.lane] += 1
+                waiter.notify()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """
+        Saca de la cola a un request que dejó de esperar. Devuelve True si el
+        lugar ya le había sido asignado (y entonces es suyo).
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queues[waiter.lane].remove(waiter)
+            return False
+
+    def _admit(self, lane: str, t0: float, queued: bool) -> float:
+        waited = time.monotonic() - t0
+        with self._lock:
+            self._admitted[lane] += 1
+        metrics.observe("admission_wait", waited)
+        if queued:
+            logger.info(f"[ADMISSION] Request {lane} admitido tras {waited * 1000:.0f} ms en cola")
+        return waited
+
+    def _reject(self, lane: str, reason: str, t0: float):
+        waited = time.monotonic() - t0
+        with self._lock:
+            self._shed[lane][reason] += 1
+        metrics.observe("admission_wait", waited)
+        metrics.inc("rag_admission_shed_total", {"lane": lane, "reason": reason},
+                    help="Requests que no entraron a la etapa LLM y se respondieron degradados")
+        logger.warning(f"[ADMISSION] Request {lane} rechazado por {reason} tras {waited * 1000:.0f} ms")
+        raise AdmissionRejected(lane, reason, waited)
+
+    # --------- Estado ---------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "batch_limit": self.batch_limit,
+                "in_flight": dict(self._in_flight),
+                "queued": {lane: len(queue) for lane, queue in self._queues.items()},
+                "admitted": dict(self._admitted),
+                "shed": {lane: dict(reasons) for lane, reasons in self._shed.items()},
+            }
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,156 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("ANSWER_CACHE")
+# ---------------------------------------------------------
+
+
+class SemanticAnswerCache:
+    """
+    Cache semántica de respuestas de /query.
+
+    Cada entrada guarda el embedding normalizado de la pregunta, el resultado
+    de rag_answer, los chunk_ids sobre los que se fundamentó y su scope (modo
+    de recuperación y filtro de intención con que se respondió). La búsqueda
+    es un producto punto vectorizado contra las entradas vigentes del mismo
+    scope: si la similitud coseno supera el umbral se devuelve la respuesta
+    almacenada sin llamar al LLM.
+
+    Las entradas expiran por TTL y se invalidan cuando una nueva generación
+    de embeddings toca alguno de sus chunks.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None      # (max_entries, dim)
+        self._expires = np.zeros(max_entries, dtype=np.float64)  # 0 = slot libre
+        self._entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        # Scope de cada slot como entero (-1 = slot libre)
+        self._scopes = np.full(max_entries, -1, dtype=np.int32)
+        self._scope_ids: Dict[str, int] = {}
+        self._by_chunk: Dict[str, Set[int]] = {}
+        self._next_slot = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # --------- Lectura ---------
+
+    def lookup(self, query_emb: np.ndarray, scope: str = "") -> Optional[Dict[str, Any]]:
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if self._vectors is None or scope_id is None:
+                self.misses += 1
+                return None
+
+            q = _normalizar(query_emb)
+            sims = self._vectors @ q
+            sims[(self._expires <= time.time()) | (self._scopes != scope_id)] = -1.0
+
+            slot = int(np.argmax(sims))
+            if sims[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry = self._entries[slot]
+            logger.info(
+                f"[ANSWER_CACHE] Hit | similitud={sims[slot]:.3f} | "
+                f"pregunta original='{entry['question'][:60]}'"
+            )
+            return dict(entry["result"])
+
+    # --------- Escritura ---------
+
+    def store(self, question: str, query_emb: np.ndarray, result: Dict[str, Any], chunk_ids: Iterable[str],
+              scope: str = ""):
+        q = _normalizar(query_emb)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+
+            slot = self._pick_slot()
+            self._release(slot)
+
+            chunk_ids = list(chunk_ids)
+            self._vectors[slot] = q
+            self._expires[slot] = time.time() + self.ttl_seconds
+            self._scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._entries[slot] = {"question": question, "result": dict(result), "chunk_ids": chunk_ids}
+            for chunk_id in chunk_ids:
+                self._by_chunk.setdefault(chunk_id, set()).add(slot)
+
+    def _pick_slot(self) -> int:
+        # Reutiliza primero un slot libre o vencido; si no hay, rota circularmente
+        free = np.flatnonzero(self._expires <= time.time())
+        if free.size:
+            return int(free[0])
+        slot = self._next_slot
+        self._next_slot = (self._next_slot + 1) % self.max_entries
+        return slot
+
+    def _release(self, slot: int):
+        entry = self._entries[slot]
+        if entry is not None:
+            for chunk_id in entry["chunk_ids"]:
+                slots = self._by_chunk.get(chunk_id)
+                if slots:
+                    slots.discard(slot)
+                    if not slots:
+                        del self._by_chunk[chunk_id]
+        self._entries[slot] = None
+        self._expires[slot] = 0.0
+        self._scopes[slot] = -1
+        if self._vectors is not None:
+            self._vectors[slot] = 0.0
+
+    # --------- Invalidación ---------
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str]) -> int:
+        """
+        Invalida todas las entradas fundamentadas en alguno de los chunk_ids.
+        Devuelve la cantidad de entradas invalidadas.
+        """
+        with self._lock:
+            slots: Set[int] = set()
+            for chunk_id in chunk_ids:
+                slots |= self._by_chunk.get(chunk_id, set())
+
+            for slot in slots:
+                self._release(slot)
+
+            self.invalidations += len(slots)
+
+        if slots:
+            logger.info(f"[ANSWER_CACHE] Invalidadas {len(slots)} respuestas por re-indexación")
+        return len(slots)
+
+    # --------- Métricas ---------
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": int(np.count_nonzero(self._expires > time.time())),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def _normalizar(vec: np.ndarray) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
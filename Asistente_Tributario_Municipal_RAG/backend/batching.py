@@ -0,0 +1,94 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("BATCHING")
+# ---------------------------------------------------------
+
+
+class MicroBatcher:
+    """
+    Agrupa llamados concurrentes que llegan dentro de max_wait_ms en un único
+    llamado a process(items) -> resultados (uno por item, en el mismo orden).
+
+    - El lote se despacha al llegar a max_batch items o al vencer la espera.
+    - Si process falla, todos los llamadores del lote reciben la excepción.
+    - max_wait_ms <= 0 desactiva la agrupación (cada item va solo).
+
+    Debe usarse desde el event loop (los handlers async de FastAPI).
+    """
+
+    def __init__(self, name: str, process: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch: int = 96, max_wait_ms: float = 5.0):
+        self.name = name
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: "asyncio.TimerHandle | None" = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+
+    async def submit(self, item: Any) -> Any:
+        if self.max_wait <= 0:
+            self._count(1)
+            return (await self.process([item]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # Se guarda la referencia para que la tarea no sea recolectada antes de terminar
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        self._count(len(batch))
+        try:
+            results = await self.process([item for item, _ in batch])
+        except Exception as e:
+            logger.warning(f"[BATCHING] Falló el lote '{self.name}' de {len(batch)} items: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # Un llamador cancelado deja su future cerrado
+            if not future.done():
+                future.set_result(result)
+
+    def _count(self, size: int):
+        self.batches += 1
+        self.items += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+        }
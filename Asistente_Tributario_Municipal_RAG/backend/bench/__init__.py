@@ -0,0 +1,6 @@
+"""
+Herramientas de benchmark del backend.
+Se ejecutan desde la carpeta backend, por ejemplo:
+
+    python -m bench.bench_async
+"""
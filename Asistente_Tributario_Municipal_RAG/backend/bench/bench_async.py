@@ -0,0 +1,81 @@
+"""
+Compara el camino sync (rag_answer en un threadpool, como los handlers
+`def` de Starlette) contra el camino async (rag_answer_async en el event
+loop) usando el servidor Cohere simulado.
+
+    python -m bench.bench_async --requests 200 --concurrency 100 --chat-latency-ms 800
+"""
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.common import (BASE_QUESTIONS, setup_bench_env, synthetic_chunks,
+                          percentiles, format_ms)
+
+
+async def run_sync(rag_ppal, questions, concurrency, threadpool_size):
+    """
+    Simula los handlers `def`: cada request espera un worker del threadpool.
+    La latencia incluye la espera en cola.
+    """
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=threadpool_size)
+    try:
+        return await _drive(questions, concurrency,
+                            lambda q: loop.run_in_executor(pool, rag_ppal.rag_answer, q))
+    finally:
+        pool.shutdown()
+
+
+async def run_async(rag_ppal, questions, concurrency):
+    return await _drive(questions, concurrency, rag_ppal.rag_answer_async)
+
+
+async def _drive(questions, concurrency, call):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with sem:
+            t0 = time.perf_counter()
+            await call(q)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one(q) for q in questions])
+    return time.perf_counter() - t0, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="Requests simultáneos del cliente")
+    parser.add_argument("--threadpool", type=int, default=40,
+                        help="Tamaño del threadpool del camino sync (default de Starlette: 40)")
+    parser.add_argument("--embed-latency-ms", type=float, default=60.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=800.0)
+    args = parser.parse_args()
+
+    setup_bench_env(args.embed_latency_ms, args.chat_latency_ms)
+    logging.disable(logging.INFO)
+
+    import rag_ppal
+
+    rag_ppal.generate_embeddings_for_document("bench-doc", "guia_bench", synthetic_chunks())
+
+    # Preguntas únicas para que la cache de embeddings no oculte la latencia de red
+    def questions(tag):
+        return [f"{BASE_QUESTIONS[i % len(BASE_QUESTIONS)]} ({tag} {i})" for i in range(args.requests)]
+
+    elapsed, lat = asyncio.run(run_sync(rag_ppal, questions("sync"), args.concurrency, args.threadpool))
+    print(f"[SYNC ] {args.requests / elapsed:7.1f} req/s | {format_ms(percentiles(lat))}")
+
+    elapsed, lat = asyncio.run(run_async(rag_ppal, questions("async"), args.concurrency))
+    print(f"[ASYNC] {args.requests / elapsed:7.1f} req/s | {format_ms(percentiles(lat))}")
+
+
+if __name__ == "__main__":
+    main()
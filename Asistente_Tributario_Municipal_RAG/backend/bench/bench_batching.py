@@ -0,0 +1,93 @@
+"""
+Compara el camino por request (cada pregunta hace su propio embed y su
+propia consulta al vector store) contra la agrupación en micro-lotes,
+tanto para preguntas sueltas concurrentes como para /query/batch.
+
+    python -m bench.bench_batching --requests 300 --concurrency 100 --embed-latency-ms 60
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from bench.common import (BASE_QUESTIONS, setup_bench_env, synthetic_chunks,
+                          percentiles, format_ms)
+
+
+async def run_singles(rag_ppal, questions, concurrency):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with sem:
+            t0 = time.perf_counter()
+            await rag_ppal.rag_answer_async(q)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one(q) for q in questions])
+    return time.perf_counter() - t0, latencies
+
+
+async def run_batches(rag_ppal, questions, batch_size):
+    latencies = []
+
+    async def one(batch):
+        t0 = time.perf_counter()
+        await rag_ppal.rag_answer_batch(batch)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one(questions[i:i + batch_size]) for i in range(0, len(questions), batch_size)])
+    return time.perf_counter() - t0, latencies
+
+
+def set_wait(rag_ppal, max_wait_ms: float):
+    for batcher in (rag_ppal.embed_batcher, rag_ppal.vector_batcher):
+        batcher.max_wait = max_wait_ms / 1000
+        batcher.batches = batcher.items = batcher.max_batch_seen = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="Preguntas por request en /query/batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=60.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    setup_bench_env(args.embed_latency_ms, args.chat_latency_ms)
+    logging.disable(logging.INFO)
+
+    import rag_ppal
+
+    rag_ppal.generate_embeddings_for_document("bench-doc", "guia_bench", synthetic_chunks())
+
+    # Preguntas únicas para que la cache de embeddings no oculte el embed
+    def questions(tag):
+        return [f"{BASE_QUESTIONS[i % len(BASE_QUESTIONS)]} ({tag} {i})" for i in range(args.requests)]
+
+    runs = [
+        ("por request", 0.0, lambda qs: run_singles(rag_ppal, qs, args.concurrency)),
+        ("micro-lotes", args.max_wait_ms, lambda qs: run_singles(rag_ppal, qs, args.concurrency)),
+        ("/query/batch", args.max_wait_ms, lambda qs: run_batches(rag_ppal, qs, args.batch_size)),
+    ]
+
+    # Un solo event loop: el cliente async de Cohere queda ligado al primero que lo usa
+    async def run_all():
+        for name, wait, run in runs:
+            set_wait(rag_ppal, wait)
+            elapsed, lat = await run(questions(name))
+            embed, vector = rag_ppal.embed_batcher.stats(), rag_ppal.vector_batcher.stats()
+            print(f"[{name:12}] {args.requests / elapsed:7.1f} preguntas/s | {format_ms(percentiles(lat))} | "
+                  f"embeds={embed['batches']} (prom {embed['avg_batch_size']}) | "
+                  f"queries={vector['batches']} (prom {vector['avg_batch_size']})")
+
+    asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Corre los casos de docs/casos_de_prueba.txt contra el pipeline completo
+(rag_answer) con el servidor Cohere simulado, sin red, y reporta:
+
+- recall@k del documento esperado (casos que lo indican o etiquetados)
+- exactitud del gate de grounding (grounded esperado vs obtenido)
+- latencia por etapa (timings_ms) y throughput
+
+El corpus de docs/corpus_final se extrae e indexa en un vector store
+temporal. Los embeddings simulados son deterministas, así que dos corridas
+sobre el mismo árbol dan el mismo recall y el mismo gate; sirve para
+comparar cambios de retrieval o de cache en calidad y velocidad.
+Las pautas de "Respuesta esperada" quedan en los fixtures como referencia:
+con el chat simulado no tiene sentido evaluarlas sobre el texto.
+
+El documento de casos nombra el documento esperado solo en dos de sus
+cinco casos: bench/casos_etiquetados.json completa esas etiquetas y agrega
+casos adicionales sobre el resto del corpus.
+
+    python -m bench.bench_cases --modes hybrid,vector,lexical --repeat 5
+    python -m bench.bench_cases --dump-fixtures casos.json --json resultado.json
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.common import DOCS_DIR, corpus_pdfs, setup_bench_env, percentiles
+
+CASES_PATH = os.path.join(DOCS_DIR, "casos_de_prueba.txt")
+LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "casos_etiquetados.json")
+
+_RULE = re.compile(r"^=+$")
+_CASE_TITLE = re.compile(r"^CASO\s+(\d+)\s*[–-]\s*(.+)$")
+_QUOTED = re.compile(r'"([^"]+)"')
+
+# Expresiones de los casos que nombran un documento del corpus sin usar su nombre de archivo
+DOCUMENT_ALIASES = {
+    "art 25": "03_protocolo_formal_notas_art_25",
+}
+
+
+# --------- Fixtures ---------
+
+def document_title(path: str) -> str:
+    """
+    Título con el que se indexa un PDF del corpus: el nombre sin las extensiones .pdf.
+    """
+    name = os.path.basename(path)
+    while name.lower().endswith(".pdf"):
+        name = name[:-4]
+    return name
+
+
+def _sections(lines: List[str]) -> Dict[str, List[str]]:
+    """
+    Agrupa las líneas de un caso por encabezado ("Pregunta:", "Respuesta esperada:", ...).
+    """
+    sections: Dict[str, List[str]] = {}
+    current = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.endswith(":") and not stripped.startswith(("-", "✔")):
+            current = stripped[:-1].lower()
+            sections.setdefault(current, [])
+        elif current is not None:
+            sections[current].append(stripped)
+    return sections
+
+
+def _expected_documents(sections: Dict[str, List[str]], titles: List[str]) -> List[str]:
+    # "Contexto que debería usar:" suele abrir un sub-bloque "Documento:"
+    hints = sections.get("contexto que debería usar", []) + sections.get("documento", []) + [
+        line for line in sections.get("criterio de aprobación", []) if "documento" in line.lower()
+    ]
+    found = []
+    for hint in hints:
+        text = hint.lower()
+        for title in titles:
+            if title.lower() in text and title not in found:
+                found.append(title)
+        for alias, title in DOCUMENT_ALIASES.items():
+            if alias in text and title in titles and title not in found:
+                found.append(title)
+    return found
+
+
+def parse_cases(path: str = CASES_PATH, titles: List[str] = None,
+                labels_path: Optional[str] = LABELS_PATH) -> List[Dict[str, Any]]:
+    """
+    Convierte el documento de casos en fixtures:
+    {id, name, question, expected_documents, expect_grounded, expected_behaviour, criteria}
+    Un caso espera grounded=False si su título lo marca fuera de alcance.
+    Con labels_path se suman las etiquetas y los casos de ese JSON.
+    """
+    titles = titles if titles is not None else [document_title(p) for p in corpus_pdfs()]
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    # Cada caso es un título entre dos líneas de "=" seguido de su cuerpo
+    cases: List[Dict[str, Any]] = []
+    i = 0
+    while i < len(lines):
+        match = _CASE_TITLE.match(lines[i].strip())
+        if not match or i == 0 or not _RULE.match(lines[i - 1].strip()):
+            i += 1
+            continue
+
+        body: List[str] = []
+        i += 2
+        while i < len(lines) and not _RULE.match(lines[i].strip()):
+            body.append(lines[i])
+            i += 1
+        # La última línea antes del siguiente separador es el título del bloque siguiente
+        if i < len(lines) and body and body[-1].strip():
+            i -= 1
+            body.pop()
+
+        sections = _sections(body)
+        question = " ".join(sections.get("pregunta", []))
+        quoted = _QUOTED.search(question)
+        name = match.group(2).strip()
+
+        cases.append({
+            "id": int(match.group(1)),
+            "name": name,
+            "question": quoted.group(1) if quoted else question,
+            "expected_documents": _expected_documents(sections, titles),
+            "expect_grounded": "FUERA DE ALCANCE" not in name.upper(),
+            "expected_behaviour": [line.lstrip("- ").strip() for line in sections.get("respuesta esperada (comportamiento)",
+                                                                                        sections.get("respuesta esperada", []))],
+            "criteria": [line.lstrip("✔ ").strip() for line in sections.get("criterio de aprobación", [])],
+        })
+    return _apply_labels(cases, labels_path, titles) if labels_path else cases
+
+
+def _apply_labels(cases: List[Dict[str, Any]], labels_path: str, titles: List[str]) -> List[Dict[str, Any]]:
+    with open(labels_path, encoding="utf-8") as f:
+        labels = json.load(f)
+
+    known = set(titles)
+    unknown = {t for docs in labels["documentos_esperados"].values() for t in docs} - known
+    unknown |= {t for case in labels["casos_adicionales"] for t in case["expected_documents"]} - known
+    if unknown:
+        raise ValueError(f"Etiquetas con documentos que no están en el corpus: {sorted(unknown)}")
+
+    for case in cases:
+        for title in labels["documentos_esperados"].get(str(case["id"]), []):
+            if title not in case["expected_documents"]:
+                case["expected_documents"].append(title)
+    for extra in labels["casos_adicionales"]:
+        cases.append({"expected_behaviour": [], "criteria": [], **extra})
+    return cases
+
+
+# --------- Corrida ---------
+
+def index_corpus(rag_ppal) -> List[str]:
+    from chunking import chunk_document_pages
+    from extraction import extract_pdf_pages
+    from chunking import PAGE_BREAK
+
+    titles = []
+    for path in corpus_pdfs():
+        title = document_title(path)
+        chunks, pages = chunk_document_pages(PAGE_BREAK.join(extract_pdf_pages(path)), title)
+        rag_ppal.generate_embeddings_for_document(rag_ppal.document_id_for(title), title, chunks, pages)
+        titles.append(title)
+    return titles
+
+
+def evaluate(rag_ppal, cases: List[Dict[str, Any]], mode: str, ks: List[int], repeat: int) -> Dict[str, Any]:
+    """
+    Una pasada de recall (búsqueda con el mismo filtro que usa rag_answer)
+    y `repeat` pasadas del pipeline completo para latencia y gate.
+    """
+    max_k = max(ks)
+    recall_hits = {k: 0 for k in ks}
+    recall_cases = 0
+    per_case = []
+
+    for case in cases:
+        query_emb = rag_ppal.embed_texts([case["question"]], input_type="search_query")[0]
+        where = rag_ppal.context_filter(case["question"], query_emb)
+        found = rag_ppal.search_similar_chunks(case["question"], n_results=max_k, query_emb=query_emb,
+                                               mode=mode, where=where)
+        ranked_titles = [item.get("title") for item in found]
+        ranks = [ranked_titles.index(t) + 1 for t in case["expected_documents"] if t in ranked_titles]
+        first_rank = min(ranks) if ranks else None
+
+        if case["expected_documents"]:
+            recall_cases += 1
+            for k in ks:
+                if first_rank is not None and first_rank <= k:
+                    recall_hits[k] += 1
+
+        per_case.append({"id": case["id"], "rank": first_rank, "top": ranked_titles[:3]})
+
+    stages: Dict[str, List[float]] = {}
+    gate_ok = 0
+    runs = 0
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for case, row in zip(cases, per_case):
+            result = rag_ppal.rag_answer(case["question"], mode=mode)
+            runs += 1
+            row["grounded"] = result["grounded"]
+            row["similarity"] = round(result["similarity_score"], 3)
+            row["source"] = result.get("source_document")
+            if result["grounded"] == case["expect_grounded"]:
+                gate_ok += 1
+            for stage, ms in (result.get("timings_ms") or {}).items():
+                stages.setdefault(stage.removesuffix("_ms"), []).append(ms / 1000)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "mode": mode,
+        "recall": {f"@{k}": (recall_hits[k] / recall_cases if recall_cases else None) for k in ks},
+        "recall_cases": recall_cases,
+        "gate_accuracy": gate_ok / runs if runs else None,
+        "throughput_qps": runs / elapsed if elapsed else None,
+        "stages": {stage: percentiles(values) for stage, values in stages.items()},
+        "cases": per_case,
+    }
+
+
+def print_report(report: Dict[str, Any], cases: List[Dict[str, Any]]):
+    recall = " ".join(
+        f"recall{k}={v:.2f}" if v is not None else f"recall{k}=n/a" for k, v in report["recall"].items()
+    )
+    print(f"\n[{report['mode']}] {recall} (sobre {report['recall_cases']} casos) | "
+          f"gate={report['gate_accuracy']:.2f} | {report['throughput_qps']:.1f} preguntas/s")
+
+    expected = {c["id"]: c for c in cases}
+    for row in report["cases"]:
+        case = expected[row["id"]]
+        gate = "ok" if row["grounded"] == case["expect_grounded"] else "FALLA"
+        print(f"  caso {row['id']}: rango={row['rank'] or '-':>2} | grounded={row['grounded']!s:5} ({gate}) | "
+              f"sim={row['similarity']:.3f} | fuente={row['source']} | esperado={case['expected_documents'] or '-'}")
+
+    for stage, stats in sorted(report["stages"].items()):
+        print(f"  {stage:16} p50={stats['p50'] * 1000:8.2f}ms p95={stats['p95'] * 1000:8.2f}ms "
+              f"p99={stats['p99'] * 1000:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", default="hybrid,vector,lexical")
+    parser.add_argument("--k", default="1,3,5", help="Valores de k para recall@k")
+    parser.add_argument("--repeat", type=int, default=3, help="Pasadas del pipeline completo por modo")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--dump-fixtures", help="Guarda los casos parseados en este JSON")
+    parser.add_argument("--json", help="Guarda el reporte en este JSON")
+    args = parser.parse_args()
+
+    cases = parse_cases()
+    if args.dump_fixtures:
+        with open(args.dump_fixtures, "w", encoding="utf-8") as f:
+            json.dump(cases, f, ensure_ascii=False, indent=2)
+
+    setup_bench_env(args.embed_latency_ms, args.chat_latency_ms)
+    logging.disable(logging.WARNING)
+
+    import rag_ppal
+
+    t0 = time.perf_counter()
+    titles = index_corpus(rag_ppal)
+    print(f"Corpus indexado: {len(titles)} documentos en {time.perf_counter() - t0:.1f}s | "
+          f"{len(cases)} casos ({sum(1 for c in cases if c['expected_documents'])} con documento esperado)")
+
+    ks = [int(k) for k in args.k.split(",")]
+    reports = []
+    for mode in args.modes.split(","):
+        report = evaluate(rag_ppal, cases, mode.strip(), ks, args.repeat)
+        print_report(report, cases)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cases": cases, "reports": reports}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Chunking por estructura (artículos, títulos, apartados de las guías)
+contra los splitters de tamaño fijo, sobre docs/corpus_final:
+
+- cantidad de chunks, tamaño medio/máximo y tiempo de chunking por estrategia
+- hit rate de artículos: cada epígrafe del Código Tributario ("Principio de
+  Legalidad") se usa como consulta; hay acierto si algún chunk del top-k
+  contiene el comienzo de ese artículo ("Art. 2º.-"). También se reporta
+  cuántos caracteres de contexto trae el top-k.
+- recall@k de documento de los casos de docs/casos_de_prueba.txt
+
+Cada estrategia re-indexa el corpus completo en el vector store temporal
+(reemplaza los chunks de la anterior) con el servidor Cohere simulado.
+
+    python -m bench.bench_chunking --k 1,3,5 --modes hybrid,vector
+"""
+import argparse
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Tuple
+
+from bench.common import corpus_pdfs, setup_bench_env
+from bench.bench_cases import document_title, parse_cases
+
+STRATEGIES = ("recursive", "structure")
+
+# Epígrafe en una línea y "Art. Nº.-" al comienzo de la siguiente
+_CAPTIONED_ARTICLE = re.compile(
+    r"^(?P<caption>[A-ZÁÉÍÓÚ][^\n.;:]{3,80})\n[“\"]?Art\.\s*(?P<number>\d+)\s*[º°]?\s*\.-", re.MULTILINE,
+)
+
+
+def article_queries(documents: Dict[str, str]) -> List[Tuple[str, str, re.Pattern]]:
+    """
+    (título del documento, epígrafe, patrón del comienzo del artículo).
+    """
+    queries = []
+    for title, content in documents.items():
+        for match in _CAPTIONED_ARTICLE.finditer(content.replace("\f", "\n")):
+            marker = re.compile(rf"Art\.\s*{match.group('number')}\s*[º°]?\s*\.-")
+            queries.append((title, match.group("caption").strip(), marker))
+    return queries
+
+
+def chunk_corpus(documents: Dict[str, str], strategy: str):
+    from chunking import chunk_document_pages
+
+    chunked, elapsed = {}, 0.0
+    for title, content in documents.items():
+        t0 = time.perf_counter()
+        chunked[title] = chunk_document_pages(content, title, strategy)
+        elapsed += time.perf_counter() - t0
+    return chunked, elapsed
+
+
+def evaluate(rag_ppal, queries, cases, mode: str, ks: List[int]) -> Dict[str, str]:
+    max_k = max(ks)
+    article_hits = {k: 0 for k in ks}
+    context_chars = {k: 0 for k in ks}
+    embeddings = rag_ppal.embed_texts([caption for _, caption, _ in queries], input_type="search_query")
+    for (title, caption, marker), emb in zip(queries, embeddings):
+        found = rag_ppal.search_similar_chunks(caption, n_results=max_k, query_emb=emb, mode=mode)
+        ranks = [i + 1 for i, item in enumerate(found)
+                 if item.get("title") == title and marker.search(item["full_chunk"])]
+        for k in ks:
+            article_hits[k] += bool(ranks and ranks[0] <= k)
+            context_chars[k] += sum(len(item["full_chunk"]) for item in found[:k])
+
+    case_hits, case_total = {k: 0 for k in ks}, 0
+    for case in cases:
+        if not case["expected_documents"]:
+            continue
+        case_total += 1
+        query_emb = rag_ppal.embed_texts([case["question"]], input_type="search_query")[0]
+        where = rag_ppal.context_filter(case["question"], query_emb)
+        found = rag_ppal.search_similar_chunks(case["question"], n_results=max_k, query_emb=query_emb,
+                                               mode=mode, where=where)
+        titles = [item.get("title") for item in found]
+        ranks = [titles.index(t) + 1 for t in case["expected_documents"] if t in titles]
+        for k in ks:
+            case_hits[k] += bool(ranks and min(ranks) <= k)
+
+    n = len(queries) or 1
+    return {
+        "artículos": " ".join(f"hit@{k}={article_hits[k] / n:.2f}" for k in ks),
+        "contexto": " ".join(f"@{k}={context_chars[k] / n:.0f}c" for k in ks),
+        "casos": " ".join(f"recall@{k}={case_hits[k] / (case_total or 1):.2f}" for k in ks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", default="hybrid,vector")
+    parser.add_argument("--k", default="1,3,5", help="Valores de k")
+    args = parser.parse_args()
+
+    setup_bench_env()
+    logging.disable(logging.WARNING)
+
+    import rag_ppal
+    from chunking import PAGE_BREAK
+    from extraction import extract_pdf_pages
+
+    documents = {document_title(path): PAGE_BREAK.join(extract_pdf_pages(path)) for path in corpus_pdfs()}
+    queries = article_queries(documents)
+    cases = parse_cases()
+    ks = [int(k) for k in args.k.split(",")]
+    print(f"{len(documents)} documentos | {len(queries)} consultas por epígrafe | {len(cases)} casos")
+
+    for strategy in STRATEGIES:
+        chunked, elapsed = chunk_corpus(documents, strategy)
+        sizes = [len(c) for chunks, _ in chunked.values() for c in chunks]
+        with_path = sum(1 for _, pages in chunked.values() for p in pages if p[2])
+        print(f"\n[{strategy}] {len(sizes)} chunks | media={sum(sizes) / len(sizes):.0f}c máx={max(sizes)}c | "
+              f"con heading_path={with_path} | chunking={elapsed * 1000:.1f}ms")
+
+        for title, (chunks, pages) in chunked.items():
+            rag_ppal.generate_embeddings_for_document(rag_ppal.document_id_for(title), title, chunks, pages)
+
+        for mode in args.modes.split(","):
+            report = evaluate(rag_ppal, queries, cases, mode.strip(), ks)
+            print(f"  {mode.strip():7} | artículos {report['artículos']} | contexto {report['contexto']} | "
+                  f"casos {report['casos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Tamaño del prompt y latencia del chat con el contexto original (los
+chunks recuperados concatenados) contra el armado de context_assembly
+(chunks consecutivos unidos sin solapamiento, con y sin presupuesto de
+tokens), sobre el corpus de docs/corpus_final.
+
+El servidor Cohere simulado cobra un prefill proporcional al largo del
+prompt (--chat-ms-per-kchar), así que la diferencia de latencia refleja
+solo el tamaño del contexto.
+
+    python -m bench.bench_context --chat-ms-per-kchar 20 --budget 1500
+"""
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+from bench.common import BASE_QUESTIONS, setup_bench_env, percentiles
+from bench.bench_cases import parse_cases, index_corpus
+
+# Preguntas sobre la ordenanza: recuperan chunks de 3000 caracteres del código
+NORMATIVE_QUESTIONS = [
+    "Qué establece el código tributario municipal sobre la prescripción de las deudas",
+    "Cuáles son las obligaciones de los contribuyentes según la ordenanza tributaria",
+    "Qué recargos e intereses corresponden por pago fuera de término según el código",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Presupuesto de tokens (default: CONTEXT_TOKEN_BUDGET, o 1500 si es 0)")
+    parser.add_argument("--mode", default=None, help="Modo de recuperación")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--chat-ms-per-kchar", type=float, default=20.0)
+    args = parser.parse_args()
+
+    setup_bench_env(chat_latency_ms=args.chat_latency_ms, chat_ms_per_kchar=args.chat_ms_per_kchar)
+    logging.disable(logging.WARNING)
+
+    import rag_ppal
+    from context_assembly import assemble_context
+    from config import CONTEXT_TOKEN_BUDGET, CONTEXT_CHARS_PER_TOKEN
+
+    # Con CONTEXT_TOKEN_BUDGET=0 (sin límite) la variante con presupuesto sería igual a "unidos"
+    budget = (CONTEXT_TOKEN_BUDGET or 1500) if args.budget is None else args.budget
+    index_corpus(rag_ppal)
+
+    questions = BASE_QUESTIONS + [c["question"] for c in parse_cases()] + NORMATIVE_QUESTIONS
+    retrieved = []
+    for q in questions:
+        emb = rag_ppal.embed_texts([q], input_type="search_query")[0]
+        retrieved.append((q, rag_ppal.load_chunk_texts(rag_ppal.retrieve_context(q, emb, args.mode))))
+
+    variants = {
+        "original": lambda results: "\n\n".join(r["full_chunk"] for r in results),
+        "unidos": lambda results: assemble_context(results, 0, CONTEXT_CHARS_PER_TOKEN)[0],
+        f"unidos+{budget}tok": lambda results: assemble_context(results, budget, CONTEXT_CHARS_PER_TOKEN)[0],
+    }
+
+    print(f"{len(questions)} preguntas | chat {args.chat_latency_ms:.0f} ms + {args.chat_ms_per_kchar:.0f} ms/1000 caracteres")
+    baseline_chars = None
+    for name, build in variants.items():
+        sizes, latencies = [], []
+        for q, results in retrieved:
+            context = build(results)
+            sizes.append(len(context))
+            messages = rag_ppal.build_chat_messages(q, context)
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                rag_ppal.co.chat(model=rag_ppal.CHAT_MODEL, messages=messages, temperature=0, max_tokens=400)
+                latencies.append(time.perf_counter() - t0)
+
+        total = float(np.sum(sizes))
+        baseline_chars = baseline_chars or total
+        lat = percentiles(latencies)
+        print(f"[{name:16}] contexto prom {np.mean(sizes):7.0f} car (máx {max(sizes):6d}) | "
+              f"~{np.mean(sizes) / CONTEXT_CHARS_PER_TOKEN:5.0f} tokens | "
+              f"{100 * (1 - total / baseline_chars):5.1f}% menos | chat p50={lat['p50'] * 1000:6.1f}ms "
+              f"p95={lat['p95'] * 1000:6.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
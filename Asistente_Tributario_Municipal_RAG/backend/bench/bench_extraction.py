@@ -0,0 +1,89 @@
+"""
+Compara la extracción + chunking original (concatenación con += página por
+página y split del texto completo) contra la extracción por rangos de
+páginas en un pool de procesos con chunking en streaming, sobre los PDFs
+de docs/corpus_final.
+
+    python -m bench.bench_extraction --workers 4 --pages-per-task 8
+"""
+import argparse
+import logging
+import os
+import time
+
+import pdfplumber
+
+from bench.common import corpus_pdfs
+from chunking import chunk_document, iter_page_chunks
+from extraction import iter_pdf_pages
+
+
+def baseline(path: str, title: str):
+    t0 = time.perf_counter()
+    pdf_text = ""
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text() or ""
+            pdf_text += page_text + "\n"
+    chunks = chunk_document(pdf_text, title)
+    return time.perf_counter() - t0, None, chunks
+
+
+def streaming(path: str, title: str, workers: int, pages_per_task: int):
+    t0 = time.perf_counter()
+    first_chunk = None
+    chunks = []
+    pages = iter_pdf_pages(path, workers=workers, pages_per_task=pages_per_task)
+    for chunk, _, _, _ in iter_page_chunks(pages, title):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - t0
+        chunks.append(chunk)
+    return time.perf_counter() - t0, first_chunk, chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    modes = [
+        ("original", lambda p, t: baseline(p, t)),
+        ("stream x1", lambda p, t: streaming(p, t, 1, args.pages_per_task)),
+        (f"stream x{args.workers}", lambda p, t: streaming(p, t, args.workers, args.pages_per_task)),
+    ]
+    totals = {name: 0.0 for name, _ in modes}
+
+    print(f"CPUs={os.cpu_count()} | workers={args.workers} | páginas por tarea={args.pages_per_task}")
+    for path in corpus_pdfs():
+        title = os.path.basename(path)
+        with pdfplumber.open(path) as pdf:
+            n_pages = len(pdf.pages)
+
+        reference = None
+        for name, run in modes:
+            best = None
+            for _ in range(args.repeat):
+                elapsed, first, chunks = run(path, title)
+                if best is None or elapsed < best[0]:
+                    best = (elapsed, first, chunks)
+
+            elapsed, first, chunks = best
+            totals[name] += elapsed
+            if reference is None:
+                reference = chunks
+            same = "=" if chunks == reference else "≠"
+            first_txt = f"primer chunk {first * 1000:7.1f} ms" if first is not None else " " * 24
+            print(f"{title[:44]:44} {n_pages:4d} págs | {name:10} {elapsed * 1000:9.1f} ms | "
+                  f"{first_txt} | {len(chunks):4d} chunks {same}")
+
+    print()
+    for name, total in totals.items():
+        print(f"[TOTAL] {name:10} {total * 1000:9.1f} ms | speedup {totals['original'] / total:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Ruteo de intención: la búsqueda de palabras clave anterior (modo nota)
+contra intent_router (centroides tipo_documento/tramite + ejemplos de
+intent_routes.json), sobre preguntas etiquetadas con la ruta esperada.
+
+Reporta aciertos, falsos positivos y negativos de la ruta "nota" y la
+latencia de clasificar una consulta ya embebida.
+Con los embeddings simulados (bolsa de palabras) el router solo reconoce
+paráfrasis que comparten vocabulario con la ruta; con Cohere la
+comparación es semántica.
+
+    python -m bench.bench_intent --repeat 2000
+"""
+import argparse
+import logging
+import os
+import time
+
+from bench.common import BASE_QUESTIONS, setup_bench_env, percentiles
+from bench.bench_cases import parse_cases, index_corpus
+
+# Detección por palabras clave que usaba rag_ppal antes del router
+KEYWORDS_BASELINE = [
+    "nota", "presentar nota", "nota formal", "nota de reclamo", "nota para reclamo",
+    "escribir nota", "carta", "como hago la nota",
+]
+
+# Preguntas adicionales: (pregunta, ruta esperada o None)
+EXTRA_QUESTIONS = [
+    ("¿Cómo hago la nota para reclamar el pago duplicado?", "nota"),
+    ("¿Qué datos tiene que llevar la nota de reclamo?", "nota"),
+    ("Necesito redactar una carta para reclamar un cobro", "nota"),
+    ("¿La deuda queda anotada en mi cuenta corriente?", None),
+    ("¿Cuál es el horario de atención de la oficina de rentas?", None),
+    ("¿Dónde consulto el estado de mi cuenta?", None),
+]
+
+
+def keyword_route(question: str):
+    return "nota" if any(w in question.lower() for w in KEYWORDS_BASELINE) else None
+
+
+def labeled_questions():
+    questions = [(q, None) for q in BASE_QUESTIONS]
+    for case in parse_cases():
+        # El caso que pregunta por la nota espera el modo nota
+        expected = "nota" if "nota" in case["name"].lower() or "nota" in case["question"].lower() else None
+        questions.append((case["question"], expected))
+    return questions + EXTRA_QUESTIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000, help="Clasificaciones por pregunta para la latencia")
+    args = parser.parse_args()
+
+    setup_bench_env()
+    logging.disable(logging.WARNING)
+
+    import rag_ppal
+
+    index_corpus(rag_ppal)
+    router = rag_ppal.intent_router
+    print(f"Router: {router.stats()} | rutas: {[r['name'] for r in router.describe()]}")
+
+    questions = labeled_questions()
+    embeddings = rag_ppal.embed_texts([q for q, _ in questions], input_type="search_query")
+
+    classifiers = {
+        "palabras clave": lambda q, emb: keyword_route(q),
+        "router": lambda q, emb: router.classify(emb)["route"],
+    }
+    for name, classify in classifiers.items():
+        ok, false_pos, false_neg = 0, [], []
+        for (q, expected), emb in zip(questions, embeddings):
+            got = classify(q, emb)
+            if got == expected:
+                ok += 1
+            elif got is not None:
+                false_pos.append(q)
+            else:
+                false_neg.append(q)
+
+        latencies = []
+        for (q, _), emb in zip(questions, embeddings):
+            t0 = time.perf_counter()
+            for _ in range(args.repeat):
+                classify(q, emb)
+            latencies.append((time.perf_counter() - t0) / args.repeat)
+        lat = percentiles(latencies)
+
+        print(f"\n[{name}] aciertos {ok}/{len(questions)} | p50={lat['p50'] * 1e6:.1f}µs p95={lat['p95'] * 1e6:.1f}µs")
+        for q in false_pos:
+            print(f"  falso positivo: {q}")
+        for q in false_neg:
+            print(f"  falso negativo: {q}")
+
+
+if __name__ == "__main__":
+    main()
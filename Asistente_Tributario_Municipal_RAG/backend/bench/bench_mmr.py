@@ -0,0 +1,137 @@
+"""
+Re-rankeo por diversidad (MMR) con distintos λ sobre docs/corpus_final,
+con las consultas de bench_chunking (epígrafes de artículos) y los casos de
+docs/casos_de_prueba.txt. Por λ reporta:
+
+- latencia de hybrid_search (p50/p99) y de la etapa mmr sola
+- documentos y secciones distintos en el top-k (sección: el heading_path
+  sin su último nivel, p. ej. el capítulo de un artículo)
+- redundancia: coseno medio entre los chunks del top-k
+- hit@k de artículos y recall@k de documento de los casos
+
+λ=1 es la línea base (sin sobreconsultar ni re-rankear). Con
+VECTOR_STORE=numpy se mide el costo de traer los embeddings del store en
+proceso en lugar de Chroma.
+
+    python -m bench.bench_mmr --lambdas 1,0.9,0.7,0.5 --candidates 20 --k 5
+"""
+import argparse
+import logging
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from bench.common import percentiles, format_ms, setup_bench_env
+from bench.bench_cases import index_corpus, parse_cases
+from bench.bench_chunking import article_queries
+from structure_chunking import PATH_SEPARATOR
+
+
+def set_mmr(rag_ppal, lambda_: float, candidates: int):
+    rag_ppal.MMR_LAMBDA = lambda_
+    rag_ppal.MMR_ENABLED = lambda_ < 1.0
+    rag_ppal.MMR_CANDIDATES = candidates
+
+
+def redundancy(rag_ppal, found: List[Dict]) -> float:
+    if len(found) < 2:
+        return 0.0
+    got = rag_ppal.vector_store.get(ids=[item["chunk_id"] for item in found], include=("embeddings",))
+    E = got["embeddings"] / np.maximum(np.linalg.norm(got["embeddings"], axis=1, keepdims=True), 1e-12)
+    sims = E @ E.T
+    return float(sims[np.triu_indices(len(E), 1)].mean())
+
+
+def section_of(item: Dict) -> tuple:
+    path = (item.get("heading_path") or "").split(PATH_SEPARATOR)
+    return item.get("document_id"), PATH_SEPARATOR.join(path[:-1])
+
+
+def evaluate(rag_ppal, queries, mode: str, k: int) -> Dict[str, float]:
+    """
+    queries: [(consulta, embedding, where, acierto(found) -> bool | None)];
+    None si la consulta no tiene documento esperado.
+    """
+    latencies, mmr_ms, docs, sections, redundancies, hits = [], [], [], [], [], []
+    for query, emb, where, is_hit in queries:
+        timings = {}
+        t0 = time.perf_counter()
+        found = rag_ppal.hybrid_search(query, emb, k, where=where, mode=mode, timings=timings)
+        latencies.append(time.perf_counter() - t0)
+        found = rag_ppal.load_chunk_texts(found)
+        mmr_ms.append(timings.get("mmr_ms", 0.0))
+        docs.append(len({item.get("document_id") for item in found}))
+        sections.append(len({section_of(item) for item in found}))
+        redundancies.append(redundancy(rag_ppal, found))
+        hit = is_hit(found)
+        if hit is not None:
+            hits.append(hit)
+
+    return {
+        "latency": percentiles(latencies),
+        "mmr_ms": float(np.mean(mmr_ms)) if mmr_ms else 0.0,
+        "docs": float(np.mean(docs)),
+        "sections": float(np.mean(sections)),
+        "redundancy": float(np.mean(redundancies)),
+        "hit": float(np.mean(hits)) if hits else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lambdas", default="1,0.9,0.7,0.5")
+    parser.add_argument("--candidates", type=int, default=20, help="Pool sobre el que se re-rankea")
+    parser.add_argument("--modes", default="hybrid,vector")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_bench_env()
+    # Las secciones distintas del top-k se miden con el heading_path del chunking estructural
+    os.environ.setdefault("CHUNKING_STRATEGY", "structure")
+    logging.disable(logging.WARNING)
+
+    import rag_ppal
+    from chunking import PAGE_BREAK
+    from extraction import extract_pdf_pages
+    from bench.common import corpus_pdfs
+    from bench.bench_cases import document_title
+
+    titles = index_corpus(rag_ppal)
+    documents = {document_title(path): PAGE_BREAK.join(extract_pdf_pages(path)) for path in corpus_pdfs()}
+
+    articles = article_queries(documents)
+    article_embs = rag_ppal.embed_texts([caption for _, caption, _ in articles], input_type="search_query")
+    article_set = [
+        (caption, emb, None,
+         lambda found, t=title, m=marker: any(i.get("title") == t and m.search(i["full_chunk"]) for i in found))
+        for (title, caption, marker), emb in zip(articles, article_embs)
+    ]
+
+    cases = parse_cases(titles=titles)
+    case_embs = rag_ppal.embed_texts([c["question"] for c in cases], input_type="search_query")
+    case_set = [
+        (c["question"], emb, rag_ppal.context_filter(c["question"], emb),
+         lambda found, expected=set(c["expected_documents"]):
+             any(i.get("title") in expected for i in found) if expected else None)
+        for c, emb in zip(cases, case_embs)
+    ]
+    print(f"{len(documents)} documentos | {len(article_set)} consultas por epígrafe | {len(case_set)} casos | "
+          f"k={args.k} pool={args.candidates}")
+
+    for mode in args.modes.split(","):
+        mode = mode.strip()
+        print(f"\n[{mode}]")
+        for lambda_ in (float(x) for x in args.lambdas.split(",")):
+            set_mmr(rag_ppal, lambda_, args.candidates)
+            for label, queries in (("artículos", article_set), ("casos", case_set)):
+                r = evaluate(rag_ppal, queries, mode, args.k)
+                lat = format_ms({p: r["latency"][p] for p in ("p50", "p99")})
+                print(f"  λ={lambda_:<4} {label:9} | {lat} | mmr={r['mmr_ms']:.2f}ms | "
+                      f"docs distintos={r['docs']:.2f} secciones={r['sections']:.2f} | "
+                      f"redundancia={r['redundancy']:.3f} | acierto@{args.k}={r['hit']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Store numpy en float32 contra int8 y binario (búsqueda sobre los códigos
++ re-puntuación float32 de los candidatos): bytes recorridos por
+búsqueda, latencia y recall@k contra la búsqueda exacta en float32.
+
+Los vectores son los embeddings de Cohere del corpus (leídos de una copia
+de chroma_db). Las consultas son esos mismos vectores con ruido, como
+paráfrasis de cada chunk. --scale agrega filas sintéticas alrededor de los
+vectores reales para ver el comportamiento con un índice grande.
+
+    python -m bench.bench_quantization --scale 100000 --rescore-factor 10
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.common import BACKEND_DIR, percentiles, format_ms
+from bench.bench_vector_store import fill
+from config import COLLECTION_NAME
+from vector_store import ChromaVectorStore, NumpyVectorStore
+
+
+def corpus_vectors() -> np.ndarray:
+    copy = os.path.join(tempfile.mkdtemp(prefix="bench_quant_"), "chroma_db")
+    shutil.copytree(os.path.join(BACKEND_DIR, "chroma_db"), copy)
+    return ChromaVectorStore(copy, COLLECTION_NAME).get(include=("embeddings",))["embeddings"]
+
+
+def noisy(vectors: np.ndarray, n: int, scale: float, rng) -> np.ndarray:
+    picked = vectors[rng.integers(0, len(vectors), size=n)]
+    return picked + scale * rng.standard_normal(picked.shape).astype(np.float32) / np.sqrt(vectors.shape[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=0, help="Filas sintéticas agregadas al corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.5, help="Ruido de las consultas (norma relativa)")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    vectors = corpus_vectors()
+    if args.scale:
+        vectors = np.vstack([vectors, noisy(vectors, args.scale, 1.0, rng)])
+    queries = noisy(vectors, args.queries, args.noise, rng)
+    where = {"tipo_documento": "procedimiento"}
+
+    print(f"filas={len(vectors)} dim={vectors.shape[1]} consultas={args.queries} k={args.k} "
+          f"re-puntuación={args.rescore_factor}×k")
+    reference = {}
+    for quantization in ("float", "int8", "binary"):
+        store = NumpyVectorStore(tempfile.mkdtemp(prefix=f"bench_{quantization}_"),
+                                 quantization=quantization, rescore_factor=args.rescore_factor)
+        fill(store, vectors)
+        store.warmup()
+        scan_mb = store.stats()["scan_bytes"] / 1e6
+
+        for label, filt in (("sin filtro", None), ("con filtro", where)):
+            latencies, results = [], []
+            for q in queries:
+                t0 = time.perf_counter()
+                hits = store.query(q, args.k, filt)
+                latencies.append(time.perf_counter() - t0)
+                results.append({h["id"] for h in hits})
+            reference.setdefault(label, results)
+            hits = sum(len(a & b) for a, b in zip(results, reference[label]))
+            print(f"[{quantization:6}] {label:10} | recorre {scan_mb:8.2f} MB | {format_ms(percentiles(latencies))} | "
+                  f"recall@{args.k}={hits / (args.k * len(results)):.3f}")
+
+
+if __name__ == "__main__":
+    main()
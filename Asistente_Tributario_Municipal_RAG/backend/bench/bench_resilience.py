@@ -0,0 +1,115 @@
+"""
+Llamados a Cohere con el cliente del SDK directo contra cohere_client
+(deadline, reintentos, hedging, circuit breaker) bajo fallas inyectadas en
+el servidor simulado:
+
+- sano: sin fallas
+- errores: una fracción de requests responde 503
+- cola lenta: una fracción tarda slow_ms extra (el caso del hedging)
+- caída: todos los requests fallan (el circuit breaker corta)
+
+Por perfil reporta la tasa de éxito, la latencia p50/p99 de los embeds de
+consultas y cuántos reintentos, hedges y rechazos del breaker hubo.
+
+    python -m bench.bench_resilience --calls 300 --concurrency 4 --hedge-after-ms 150
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import cohere
+import httpx
+
+from bench.common import setup_bench_env, set_faults, get_faults, percentiles, format_ms
+from cohere_client import ResilientCohere
+
+PROFILES = {
+    "sano": {"fail_rate": 0.0, "slow_rate": 0.0},
+    "errores": {"fail_rate": 0.2, "fail_status": 503, "slow_rate": 0.0},
+    "cola lenta": {"fail_rate": 0.0, "slow_rate": 0.05},
+    "caída": {"fail_rate": 1.0, "fail_status": 503, "slow_rate": 0.0},
+}
+
+
+async def run_calls(embed, calls: int, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors = [], {}
+
+    async def one(i: int):
+        async with slots:
+            t0 = time.perf_counter()
+            try:
+                await embed(texts=[f"consulta {i} sobre el pago duplicado"], model="embed-multilingual-v3.0",
+                            input_type="search_query", embedding_types=["float"])
+                latencies.append(time.perf_counter() - t0)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(calls)])
+    return latencies, errors, time.perf_counter() - t0
+
+
+async def main_async(args):
+    base_url = os.environ["COHERE_BASE_URL"]
+    http_client = httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=100))
+    raw = cohere.AsyncClientV2(base_url=base_url, api_key="fake-key", httpx_client=http_client)
+
+    def resilient(hedge_after_ms: float) -> ResilientCohere:
+        return ResilientCohere(
+            None, raw,
+            deadlines={"embed": args.deadline, "chat": args.deadline},
+            concurrency={"embed": args.concurrency, "chat": args.concurrency},
+            max_retries=args.retries, backoff_base_seconds=args.backoff,
+            hedge_after_ms=hedge_after_ms, hedge_max_ratio=args.hedge_ratio,
+            breaker_failures=args.breaker_failures, breaker_reset_seconds=30.0,
+        )
+
+    for profile, faults in PROFILES.items():
+        set_faults(base_url, slow_ms=args.slow_ms, **faults)
+        print(f"\n[{profile}] {faults}")
+        clients = [("sdk directo", None), ("cohere_client", resilient(0))]
+        if args.hedge_after_ms:
+            clients.append((f"+ hedge {args.hedge_after_ms:.0f}ms", resilient(args.hedge_after_ms)))
+
+        for name, client in clients:
+            embed = raw.embed if client is None else client.embed_async
+            latencies, errors, elapsed = await run_calls(embed, args.calls, args.concurrency)
+            # Lee y reinicia los contadores del servidor
+            server = get_faults(base_url)
+            set_faults(base_url)
+
+            stats = client.stats()["embed"] if client is not None else {}
+            ok = len(latencies)
+            lat = format_ms({k: v for k, v in percentiles(latencies).items() if k in ("p50", "p99")}) if latencies else "-"
+            print(f"  {name:18} éxito {ok}/{args.calls} ({ok / args.calls:.0%}) | {lat} | {elapsed:.2f}s | "
+                  f"requests al servidor={server['requests']} reintentos={stats.get('retries', 0)} "
+                  f"hedges={stats.get('hedges', 0)} rechazos breaker={stats.get('rejected_by_circuit', 0)} | "
+                  f"errores={errors or '-'}")
+
+    await http_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--slow-ms", type=float, default=1000.0, help="Latencia extra de la cola lenta")
+    parser.add_argument("--deadline", type=float, default=5.0)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    parser.add_argument("--hedge-after-ms", type=float, default=150.0, help="0 = sin la variante con hedging")
+    parser.add_argument("--hedge-ratio", type=float, default=0.1)
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_bench_env(embed_latency_ms=args.embed_latency_ms)
+    logging.disable(logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
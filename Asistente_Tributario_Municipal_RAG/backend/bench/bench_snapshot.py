@@ -0,0 +1,120 @@
+"""
+Snapshot portable del índice (snapshot.py) contra abrir chroma_db y el
+store numpy: tiempo y tamaño del export, tiempo de apertura de cada store,
+verificación de checksums y paridad de resultados con el store numpy
+(mismos ids y scores en el top-k) junto con la latencia de consulta.
+
+Los vectores son los del corpus (copia de chroma_db). --scale agrega filas
+sintéticas alrededor de ellos para ver la apertura con un índice grande.
+Las aperturas se miden en el mismo proceso, con el archivo ya en la cache
+de páginas del sistema operativo.
+
+    python -m bench.bench_snapshot --scale 50000 --repeat 5
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.common import BACKEND_DIR, percentiles, format_ms
+from bench.bench_quantization import noisy
+from bench.bench_vector_store import fill
+from config import COLLECTION_NAME, EMBED_MODEL
+from snapshot import SnapshotReader, write_snapshot
+from vector_store import ChromaVectorStore, NumpyVectorStore, SnapshotVectorStore, copy_vectors
+
+
+def store_pages(store, page_size: int = 1000):
+    offset = 0
+    while True:
+        page = store.get(include=("documents", "metadatas", "embeddings"), limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def open_times(factory, repeat: int):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        store = factory()
+        store.count()
+        times.append(time.perf_counter() - t0)
+    return percentiles(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=0, help="Filas sintéticas agregadas al corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="bench_snapshot_")
+    chroma_path = os.path.join(workdir, "chroma_db")
+    shutil.copytree(os.path.join(BACKEND_DIR, "chroma_db"), chroma_path)
+    chroma = ChromaVectorStore(chroma_path, COLLECTION_NAME)
+
+    numpy_path = os.path.join(workdir, "vector_index")
+    numpy_store = NumpyVectorStore(numpy_path)
+    copy_vectors(chroma, numpy_store)
+    vectors = numpy_store.get(include=("embeddings",))["embeddings"]
+    if args.scale:
+        fill(numpy_store, noisy(vectors, args.scale, 1.0, rng))
+
+    snapshot_path = os.path.join(workdir, "index.ragsnap")
+    t0 = time.perf_counter()
+    manifest = write_snapshot(snapshot_path, store_pages(numpy_store), EMBED_MODEL)
+    export_s = time.perf_counter() - t0
+    print(f"filas={manifest['count']} dim={manifest['dim']} | export {export_s * 1000:.0f} ms | "
+          f"snapshot {os.path.getsize(snapshot_path) / 1e6:.1f} MB")
+
+    reader = SnapshotReader(snapshot_path)
+    t0 = time.perf_counter()
+    bad = reader.verify()
+    print(f"verify {(time.perf_counter() - t0) * 1000:.0f} ms | {'checksums OK' if not bad else bad}")
+    reader.close()
+
+    print("\n[apertura]")
+    factories = [
+        ("numpy", lambda: NumpyVectorStore(numpy_path)),
+        ("snapshot", lambda: SnapshotVectorStore(snapshot_path)),
+    ]
+    if not args.scale:
+        factories.insert(0, ("chroma", lambda: ChromaVectorStore(chroma_path, COLLECTION_NAME)))
+    for name, factory in factories:
+        print(f"  {name:9} | {format_ms(open_times(factory, args.repeat))}")
+
+    snapshot_store = SnapshotVectorStore(snapshot_path)
+    queries = noisy(vectors, args.queries, 0.5, rng)
+    print(f"\n[consulta top-{args.k}]")
+    results = {}
+    for name, store in (("numpy", numpy_store), ("snapshot", snapshot_store)):
+        store.warmup()
+        latencies, hits = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            hits.append(store.query(q, args.k))
+            latencies.append(time.perf_counter() - t0)
+        results[name] = hits
+        print(f"  {name:9} | {format_ms(percentiles(latencies))}")
+
+    same = sum(
+        [h["id"] for h in a] == [h["id"] for h in b]
+        and all(h["document"] == g["document"] for h, g in zip(a, b))
+        and np.allclose([h["similarity"] for h in a], [g["similarity"] for g in b], atol=1e-6)
+        for a, b in zip(results["numpy"], results["snapshot"])
+    )
+    print(f"  paridad con numpy: {same}/{len(queries)} consultas idénticas (ids, textos y scores)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Tiempo de arranque del backend en cada STARTUP_MODE, cada uno en un
+proceso nuevo (imports en frío) sobre una copia de chroma_db:
+
+- import: importar main (antes abría Chroma y construía BM25 acá)
+- atiende: hasta que el servidor acepta requests (fin del lifespan de arranque)
+- /status: primer /status respondido
+- listo: todos los componentes inicializados (lazy: los que usó la 1ra consulta)
+- 1ra consulta: primer /search respondido
+
+    python -m bench.bench_startup --modes eager,background,lazy --warmup
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from bench.common import BACKEND_DIR, setup_bench_env
+
+
+def child(mode: str):
+    """
+    Corre dentro del proceso medido; imprime los tiempos en JSON.
+    """
+    t0 = time.perf_counter()
+    import main
+    from fastapi.testclient import TestClient
+
+    out = {"import": time.perf_counter() - t0}
+    with TestClient(main.app) as client:
+        out["serving"] = time.perf_counter() - t0
+        client.get("/status")
+        out["status"] = time.perf_counter() - t0
+
+        while not client.get("/status").json()["readiness"]["ready"] and mode != "lazy":
+            time.sleep(0.005)
+        out["ready"] = time.perf_counter() - t0 if mode != "lazy" else None
+
+        client.post("/search", json={"query": "cómo pido un plan de pago"})
+        out["first_query"] = time.perf_counter() - t0
+        if out["ready"] is None:
+            out["ready"] = out["first_query"]
+        out["components"] = client.get("/status").json()["readiness"]["components"]
+
+    print(json.dumps(out))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", default="eager,background,lazy")
+    parser.add_argument("--warmup", action="store_true", help="STARTUP_WARMUP=true")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    workdir = setup_bench_env()
+    shutil.copytree(os.path.join(BACKEND_DIR, "chroma_db"), os.environ["CHROMA_PATH"])
+    env = {
+        **os.environ,
+        "STARTUP_WARMUP": "true" if args.warmup else "false",
+        "ANONYMIZED_TELEMETRY": "False",
+    }
+
+    print(f"warm-up={args.warmup} | mejor de {args.repeat} corridas (ms)")
+    print(f"{'modo':11} {'import':>8} {'atiende':>8} {'/status':>8} {'listo':>8} {'1ra consulta':>13}")
+    for mode in args.modes.split(","):
+        best = None
+        for _ in range(args.repeat):
+            proc = subprocess.run(
+                [sys.executable, "-m", "bench.bench_startup", "--child", mode],
+                cwd=BACKEND_DIR, env={**env, "STARTUP_MODE": mode},
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                sys.exit(f"[{mode}] el proceso medido falló:\n{proc.stderr[-3000:]}")
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            if best is None or result["first_query"] < best["first_query"]:
+                best = result
+
+        ms = {k: best[k] * 1000 for k in ("import", "serving", "status", "ready", "first_query")}
+        print(f"{mode:11} {ms['import']:8.0f} {ms['serving']:8.0f} {ms['status']:8.0f} "
+              f"{ms['ready']:8.0f} {ms['first_query']:13.0f}")
+        components = " | ".join(
+            (f"{name}={c['init_ms']:.0f}" if "init_ms" in c else f"{name}={c['state']}")
+            + (f"+{c['warmup_ms']:.0f}" if "warmup_ms" in c else "")
+            for name, c in best["components"].items()
+        )
+        print(f"{'':11} {components}")
+
+
+if __name__ == "__main__":
+    main()
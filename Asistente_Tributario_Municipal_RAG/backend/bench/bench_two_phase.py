@@ -0,0 +1,110 @@
+"""
+Retrieval en dos fases (ids, scores y metadatos para el gate de grounding;
+textos solo si el gate pasa) contra leer siempre los textos, sobre el
+corpus de docs/corpus_final.
+
+- una fase: como antes, los textos de los chunks se leen del vector store
+  y se arma el contexto para toda pregunta, aunque el gate la rechace
+- dos fases: rag_ppal tal cual (retrieve_context + evaluate_grounding y
+  build_context solo con grounding suficiente)
+
+Se reporta, separado por desenlace del gate, la latencia desde el
+retrieval hasta el contexto listo, los caracteres de texto leídos y el pico
+de memoria asignada (tracemalloc, en una pasada aparte).
+
+    python -m bench.bench_two_phase --repeat 5
+"""
+import argparse
+import logging
+import os
+import time
+import tracemalloc
+
+from bench.common import BASE_QUESTIONS, setup_bench_env, percentiles, format_ms
+from bench.bench_cases import parse_cases, index_corpus
+
+# Fuera del alcance del asistente: el gate las rechaza
+OUT_OF_SCOPE_QUESTIONS = [
+    "Cuál es la receta de la pizza napolitana con albahaca",
+    "Quién ganó el mundial de fútbol de 1986",
+    "Cómo configuro el router wifi de mi casa",
+    "Qué síntomas tiene la gripe y cuándo ir al médico",
+    "Cuánto cuesta un pasaje de avión a Madrid",
+]
+
+
+def one_phase(rag_ppal, question, query_emb):
+    from context_assembly import assemble_context
+
+    results = rag_ppal.retrieve_context(question, query_emb)
+    if results:
+        got = rag_ppal.vector_store.get(ids=[r["chunk_id"] for r in results], include=("documents",))
+        texts = dict(zip(got["ids"], got["documents"]))
+        for r in results:
+            r["full_chunk"] = texts.get(r["chunk_id"], "")
+            r["content_snippet"] = r["full_chunk"][:200]
+        rag_ppal._log_context(results)
+    grounding = rag_ppal.evaluate_grounding(results)
+    assemble_context(results, rag_ppal.CONTEXT_TOKEN_BUDGET, rag_ppal.CONTEXT_CHARS_PER_TOKEN)
+    return grounding["confianza"], sum(len(r.get("full_chunk", "")) for r in results)
+
+
+def two_phase(rag_ppal, question, query_emb):
+    results = rag_ppal.retrieve_context(question, query_emb)
+    grounding = rag_ppal.evaluate_grounding(results)
+    if grounding["confianza"]:
+        results = rag_ppal.build_context(results, grounding)
+    return grounding["confianza"], sum(len(r.get("full_chunk", "")) for r in results)
+
+
+def run(rag_ppal, pipeline, questions, repeat: int, trace: bool):
+    by_outcome = {True: {"latency": [], "chars": [], "peak": []}, False: {"latency": [], "chars": [], "peak": []}}
+    for _ in range(repeat):
+        for question, emb in questions:
+            if trace:
+                tracemalloc.start()
+            t0 = time.perf_counter()
+            grounded, chars = pipeline(rag_ppal, question, emb)
+            elapsed = time.perf_counter() - t0
+            if trace:
+                by_outcome[grounded]["peak"].append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            else:
+                by_outcome[grounded]["latency"].append(elapsed)
+                by_outcome[grounded]["chars"].append(chars)
+    return by_outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_bench_env()
+    logging.disable(logging.WARNING)
+
+    import rag_ppal
+
+    index_corpus(rag_ppal)
+    texts = BASE_QUESTIONS + [c["question"] for c in parse_cases()] + OUT_OF_SCOPE_QUESTIONS
+    questions = list(zip(texts, rag_ppal.embed_texts(texts, input_type="search_query")))
+    # Deja abierto el store de textos y las caches antes de medir
+    two_phase(rag_ppal, *questions[0])
+
+    for name, pipeline in (("una fase", one_phase), ("dos fases", two_phase)):
+        timed = run(rag_ppal, pipeline, questions, args.repeat, trace=False)
+        traced = run(rag_ppal, pipeline, questions, 1, trace=True)
+        print(f"\n[{name}]")
+        for grounded in (False, True):
+            stats = timed[grounded]
+            if not stats["latency"]:
+                continue
+            n = len(stats["latency"])
+            peak = traced[grounded]["peak"]
+            print(f"  {'con grounding' if grounded else 'sin grounding':13} ({n // args.repeat} preguntas) | "
+                  f"{format_ms({k: v for k, v in percentiles(stats['latency']).items() if k in ('p50', 'p99')})} | "
+                  f"texto leído={sum(stats['chars']) / n:.0f}c | pico memoria={sum(peak) / len(peak) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Latencia de consulta de los backends de vector store (Chroma, numpy exacto
+y numpy con IVF) sobre vectores sintéticos agrupados, y recall@k de cada
+uno contra la búsqueda exacta.
+
+    python -m bench.bench_vector_store --rows 5000 --queries 200
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+from bench.common import percentiles, format_ms
+from vector_store import ChromaVectorStore, NumpyVectorStore
+
+
+def clustered_vectors(rows: int, dim: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+
+
+def fill(store, vectors: np.ndarray, batch: int = 1000):
+    for start in range(0, len(vectors), batch):
+        end = min(start + batch, len(vectors))
+        store.add(
+            [f"c{i}" for i in range(start, end)],
+            [f"chunk {i}" for i in range(start, end)],
+            vectors[start:end],
+            [{"tipo_documento": "normativa" if i % 4 else "procedimiento"} for i in range(start, end)],
+        )
+
+
+def measure(store, queries: np.ndarray, k: int, where=None):
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = store.query(q, k, where)
+        latencies.append(time.perf_counter() - t0)
+        results.append({h["id"] for h in hits})
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ivf-lists", type=int, default=64)
+    parser.add_argument("--ivf-nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(args.rows, args.dim, clusters=max(8, args.rows // 100), rng=rng)
+    queries = vectors[rng.integers(0, args.rows, size=args.queries)] + 0.3 * rng.standard_normal(
+        (args.queries, args.dim)).astype(np.float32)
+
+    stores = {
+        # numpy exacto primero: es la referencia para el recall
+        "numpy": NumpyVectorStore(tempfile.mkdtemp(prefix="bench_np_")),
+        "chroma": ChromaVectorStore(tempfile.mkdtemp(prefix="bench_chroma_"), "bench"),
+        "numpy+ivf": NumpyVectorStore(tempfile.mkdtemp(prefix="bench_ivf_"), ivf_lists=args.ivf_lists,
+                                      ivf_nprobe=args.ivf_nprobe, ivf_min_rows=0),
+    }
+
+    print(f"filas={args.rows} dim={args.dim} consultas={args.queries} k={args.k}")
+    reference = None
+    for name, store in stores.items():
+        t0 = time.perf_counter()
+        fill(store, vectors)
+        load_seconds = time.perf_counter() - t0
+        store.query(queries[0], args.k)  # calentamiento (entrena IVF)
+
+        for label, where in (("sin filtro", None), ("con filtro", {"tipo_documento": "procedimiento"})):
+            latencies, results = measure(store, queries, args.k, where)
+            if name == "numpy":
+                reference = reference or {}
+                reference[label] = results
+            recall = ""
+            if reference and label in reference:
+                hits = sum(len(a & b) for a, b in zip(results, reference[label]))
+                recall = f"recall@{args.k}={hits / (args.k * len(results)):.3f}"
+            print(f"[{name:10}] {label:10} | carga {load_seconds:6.2f}s | {format_ms(percentiles(latencies))} | {recall}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+IMPORTANTE: setup_bench_env() debe llamarse ANTES de importar rag_ppal,
+porque los clientes y el vector store se configuran desde variables de
+entorno (ver config.py).
+"""
+import json
+import os
+import socket
+import tempfile
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "docs")
+CORPUS_DIR = os.path.join(DOCS_DIR, "corpus_final")
+
+BASE_QUESTIONS = [
+    "He pagado dos veces el mismo impuesto municipal, qué tengo que hacer",
+    "He pagado pero no se ve reflejado en sistema, qué pasa en esos casos",
+    "Si no soy titular puedo hacer un reclamo por pago duplicado",
+    "Cómo pido un plan de pago para regularizar mi deuda",
+    "Dónde consulto y pago el cedulón de la tasa municipal",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def set_faults(base_url: str, **faults) -> Dict[str, Any]:
+    """
+    Cambia las fallas inyectadas del servidor simulado (y pone sus
+    contadores en cero); devuelve la configuración resultante.
+    """
+    request = urllib.request.Request(
+        f"{base_url}/fake/faults", data=json.dumps(faults).encode(),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def get_faults(base_url: str) -> Dict[str, Any]:
+    """Fallas configuradas y contadores de requests del servidor simulado."""
+    with urllib.request.urlopen(f"{base_url}/fake/faults") as response:
+        return json.load(response)
+
+
+def setup_bench_env(embed_latency_ms: float = 0.0, chat_latency_ms: float = 0.0,
+                    disable_answer_cache: bool = True, chat_ms_per_kchar: float = 0.0,
+                    faults: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Levanta el servidor Cohere simulado y apunta el backend a vector stores,
+    cache de embeddings y directorio de datos (documentos, jobs) temporales:
+    un benchmark no escribe en chroma_db, data/ ni vector_index/ del backend.
+    Devuelve el directorio temporal.
+    faults: fallas inyectadas iniciales (fail_rate, fail_status, slow_rate, slow_ms).
+    """
+    from bench.fake_cohere_server import start_server_process
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    base_url = start_server_process(
+        port=free_port(),
+        embed_latency_ms=embed_latency_ms,
+        chat_latency_ms=chat_latency_ms,
+        chat_ms_per_kchar=chat_ms_per_kchar,
+        **(faults or {}),
+    )
+
+    os.environ["COHERE_BASE_URL"] = base_url
+    os.environ.setdefault("COHERE_API_KEY", "fake-key")
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma_db")
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.sqlite3")
+    os.environ["NUMPY_STORE_PATH"] = os.path.join(workdir, "vector_index")
+    os.environ["DATA_DIR"] = os.path.join(workdir, "data")
+    if disable_answer_cache:
+        # Umbral inalcanzable: cada pregunta recorre el pipeline completo
+        os.environ["ANSWER_CACHE_THRESHOLD"] = "2.0"
+
+    return workdir
+
+
+def corpus_pdfs() -> List[str]:
+    return sorted(
+        os.path.join(CORPUS_DIR, name)
+        for name in os.listdir(CORPUS_DIR)
+        if name.lower().endswith(".pdf")
+    )
+
+
+def synthetic_chunks(n_per_question: int = 20) -> List[str]:
+    """
+    Corpus sintético cuyo vocabulario coincide con BASE_QUESTIONS, de modo que
+    con los embeddings simulados el grounding pasa y se ejercita el LLM.
+    """
+    chunks = []
+    for q in BASE_QUESTIONS:
+        for i in range(n_per_question):
+            chunks.append(f"{q}. Variante {i}: presentar DNI y comprobantes en la oficina de rentas.")
+    return chunks
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+        "mean": float(arr.mean()),
+    }
+
+
+def format_ms(stats: Dict[str, float]) -> str:
+    return " | ".join(f"{k}={v * 1000:.1f}ms" for k, v in stats.items())
@@ -0,0 +1,281 @@
+"""
+Servidor HTTP local que imita los endpoints v2 de Cohere usados por el backend
+(/v2/embed y /v2/chat, con y sin streaming).
+
+- Los embeddings son deterministas (hashing de tokens normalizados), de modo
+  que textos con vocabulario compartido quedan cerca en el espacio coseno.
+- La latencia de embed y chat es configurable para medir el pipeline sin red;
+  chat_ms_per_kchar suma un costo de prefill proporcional al largo del prompt.
+- Inyección de fallas: una fracción de los requests responde con error
+  (fail_status) o tarda slow_ms extra (cola lenta). Se cambia en caliente con
+  POST /fake/faults {"fail_rate": 0.2, "slow_rate": 0.05, "slow_ms": 2000}.
+  fail_next / slow_next afectan a los próximos N requests sin azar (tests).
+
+Uso standalone:
+
+    python -m bench.fake_cohere_server --port 8900 --embed-latency-ms 80 --chat-latency-ms 1200
+
+y luego levantar el backend con COHERE_BASE_URL=http://127.0.0.1:8900
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import unicodedata
+from typing import List
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+
+EMBED_DIM = 1024
+
+# Configuración mutable en caliente (ver configure())
+SETTINGS = {
+    "embed_latency_ms": 0.0,
+    "chat_latency_ms": 0.0,
+    "chat_ms_per_kchar": 0.0,
+    # Fallas inyectadas (fracción de requests afectados)
+    "fail_rate": 0.0,
+    "fail_status": 503,
+    "slow_rate": 0.0,
+    "slow_ms": 0.0,
+    # Los próximos N requests fallan / van a la cola lenta, sin importar la fracción
+    "fail_next": 0,
+    "slow_next": 0,
+}
+
+FAULT_SETTINGS = ("fail_rate", "fail_status", "slow_rate", "slow_ms", "fail_next", "slow_next")
+
+# Contadores de requests recibidos y fallas inyectadas (GET /fake/faults)
+COUNTS = {"requests": 0, "failed": 0, "slowed": 0}
+
+app = FastAPI(title="Fake Cohere API")
+
+
+def configure(**kwargs):
+    SETTINGS.update({k: v for k, v in kwargs.items() if v is not None})
+
+
+# --------- Embeddings deterministas ---------
+
+def _tokens(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", text)
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> np.ndarray:
+    """
+    Bag of words con feature hashing, normalizado a norma 1.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in _tokens(text):
+        h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 63) == 0 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0:
+        vec[0] = 1.0
+        return vec
+    return vec / norm
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content)
+    return content
+
+
+def prefill_seconds(messages: List[dict]) -> float:
+    chars = sum(len(_message_text(m)) for m in messages)
+    return chars / 1000 * SETTINGS["chat_ms_per_kchar"] / 1000
+
+
+def fake_answer(messages: List[dict]) -> str:
+    user = next((m for m in reversed(messages) if m.get("role") == "user"), {})
+    content = _message_text(user)
+    pregunta = content.rsplit("Pregunta:", 1)[-1].strip()
+    return (
+        "Debe presentar un reclamo con su DNI y los comprobantes de pago. "
+        f"Respuesta simulada para: {pregunta[:120]}"
+    )
+
+
+# --------- Fallas inyectadas ---------
+
+async def read_body(request: Request):
+    # Un cliente que abandonó el request (p. ej. el hedge que perdió) no es un error del servidor
+    try:
+        return await request.json()
+    except ClientDisconnect:
+        return None
+
+
+async def inject_faults():
+    """
+    Devuelve una respuesta de error si este request debe fallar; si cae en
+    la cola lenta espera slow_ms antes de seguir.
+    """
+    COUNTS["requests"] += 1
+    if SETTINGS["fail_next"] > 0 or random.random() < SETTINGS["fail_rate"]:
+        SETTINGS["fail_next"] = max(0, SETTINGS["fail_next"] - 1)
+        COUNTS["failed"] += 1
+        status = int(SETTINGS["fail_status"])
+        headers = {"retry-after": "1"} if status == 429 else None
+        return JSONResponse(status_code=status, content={"message": "falla inyectada"}, headers=headers)
+    if SETTINGS["slow_next"] > 0 or random.random() < SETTINGS["slow_rate"]:
+        SETTINGS["slow_next"] = max(0, SETTINGS["slow_next"] - 1)
+        COUNTS["slowed"] += 1
+        await asyncio.sleep(SETTINGS["slow_ms"] / 1000)
+    return None
+
+
+@app.get("/fake/faults")
+async def get_faults():
+    return {**{k: SETTINGS[k] for k in FAULT_SETTINGS}, **COUNTS}
+
+
+@app.post("/fake/faults")
+async def set_faults(request: Request):
+    body = await request.json()
+    configure(**{k: v for k, v in body.items() if k in FAULT_SETTINGS})
+    for key in COUNTS:
+        COUNTS[key] = 0
+    return await get_faults()
+
+
+# --------- Endpoints ---------
+
+@app.post("/v2/embed")
+async def embed(request: Request):
+    body = await read_body(request)
+    if body is None:
+        return Response(status_code=499)
+    fault = await inject_faults()
+    if fault is not None:
+        return fault
+    await asyncio.sleep(SETTINGS["embed_latency_ms"] / 1000)
+
+    texts = body.get("texts") or []
+    vectors = [fake_embedding(t).tolist() for t in texts]
+
+    return {
+        "id": f"fake-embed-{time.time_ns()}",
+        "response_type": "embeddings_by_type",
+        "embeddings": {"float": vectors},
+        "texts": texts,
+        "meta": {"api_version": {"version": "2"}, "billed_units": {"input_tokens": sum(len(_tokens(t)) for t in texts)}},
+    }
+
+
+@app.post("/v2/chat")
+async def chat(request: Request):
+    body = await read_body(request)
+    if body is None:
+        return Response(status_code=499)
+    messages = body.get("messages", [])
+    fault = await inject_faults()
+    if fault is not None:
+        return fault
+    answer = fake_answer(messages)
+    await asyncio.sleep(prefill_seconds(messages))
+
+    if body.get("stream"):
+        return StreamingResponse(_stream_answer(answer), media_type="text/event-stream")
+
+    await asyncio.sleep(SETTINGS["chat_latency_ms"] / 1000)
+    return {
+        "id": f"fake-chat-{time.time_ns()}",
+        "finish_reason": "COMPLETE",
+        "message": {"role": "assistant", "content": [{"type": "text", "text": answer}]},
+        "usage": {"billed_units": {"input_tokens": 0, "output_tokens": len(answer.split())}},
+    }
+
+
+async def _stream_answer(answer: str):
+    words = answer.split(" ")
+    # La latencia total del chat se reparte entre los tokens emitidos
+    delay = SETTINGS["chat_latency_ms"] / 1000 / max(len(words), 1)
+
+    def sse(payload: dict) -> str:
+        return f"data: {json.dumps(payload)}\n\n"
+
+    yield sse({"type": "message-start", "id": f"fake-chat-{time.time_ns()}", "delta": {"message": {"role": "assistant"}}})
+    yield sse({"type": "content-start", "index": 0, "delta": {"message": {"content": {"type": "text", "text": ""}}}})
+    for i, word in enumerate(words):
+        await asyncio.sleep(delay)
+        text = word if i == 0 else " " + word
+        yield sse({"type": "content-delta", "index": 0, "delta": {"message": {"content": {"text": text}}}})
+    yield sse({"type": "content-end", "index": 0})
+    yield sse({"type": "message-end", "delta": {"finish_reason": "COMPLETE"}})
+
+
+# --------- Arranque ---------
+
+def start_server_process(port: int = 8900, embed_latency_ms: float = 0.0, chat_latency_ms: float = 0.0,
+                         chat_ms_per_kchar: float = 0.0, fail_rate: float = 0.0, fail_status: int = 503,
+                         slow_rate: float = 0.0, slow_ms: float = 0.0) -> str:
+    """
+    Levanta el servidor en un proceso aparte (para no competir por el GIL
+    con el backend medido) y devuelve su base_url. El proceso termina
+    junto con el proceso que lo lanzó.
+    """
+    import atexit
+    import socket
+    import subprocess
+    import sys
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fake_cohere_server",
+            "--port", str(port),
+            "--embed-latency-ms", str(embed_latency_ms),
+            "--chat-latency-ms", str(chat_latency_ms),
+            "--chat-ms-per-kchar", str(chat_ms_per_kchar),
+            "--fail-rate", str(fail_rate),
+            "--fail-status", str(fail_status),
+            "--slow-rate", str(slow_rate),
+            "--slow-ms", str(slow_ms),
+        ],
+        cwd=backend_dir,
+    )
+    atexit.register(proc.terminate)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+
+    proc.terminate()
+    raise RuntimeError("El servidor Cohere simulado no respondió a tiempo")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor Cohere simulado")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--chat-ms-per-kchar", type=float, default=0.0,
+                        help="Prefill simulado: ms extra por cada 1000 caracteres del prompt")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de requests que fallan")
+    parser.add_argument("--fail-status", type=int, default=503, help="Status de las fallas inyectadas")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fracción de requests en la cola lenta")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="Latencia extra de la cola lenta")
+    args = parser.parse_args()
+
+    configure(embed_latency_ms=args.embed_latency_ms, chat_latency_ms=args.chat_latency_ms,
+              chat_ms_per_kchar=args.chat_ms_per_kchar, fail_rate=args.fail_rate, fail_status=args.fail_status,
+              slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", timeout_keep_alive=30)
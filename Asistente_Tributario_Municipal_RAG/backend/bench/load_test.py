@@ -0,0 +1,376 @@
+"""
+Prueba de carga de una instancia de main:app por HTTP, contra el servidor
+Cohere simulado (latencia de embed/chat y streaming de tokens
+configurables, ver fake_cohere_server.py).
+
+Levanta el backend con uvicorn en un proceso aparte sobre un vector store
+temporal, indexa el corpus de docs/corpus_final por /upload-file y genera
+carga sobre /query, /query/stream, /search y /upload-file con la mezcla
+pedida. Las preguntas salen de docs/casos_de_prueba.txt y BASE_QUESTIONS.
+
+- Lazo cerrado (--concurrency N): N clientes que envían un request apenas
+  termina el anterior.
+- Lazo abierto (--rate R): llegadas de Poisson a R req/s, con a lo sumo
+  --concurrency requests en vuelo (los que no entran cuentan como
+  descartados por el cliente). Mide la latencia que ve un ciudadano cuando
+  la llegada no depende de lo que tarda el servidor.
+
+Con varios valores (--concurrency 1,8,32,128) corre un nivel por vez, para
+ver dónde se degrada el p95. Reporta throughput, percentiles de latencia
+(y del primer token en streaming), errores y respuestas degradadas por el
+control de admisión por endpoint. --json guarda el reporte y --compare lo
+compara con uno anterior: sale con código 1 si el p95 o el throughput
+empeoran más que --tolerance o suben las tasas de errores o de degradadas.
+
+    python -m bench.load_test --concurrency 1,8,32 --duration 20 --chat-latency-ms 800
+    python -m bench.load_test --rate 20 --concurrency 200 --json carga.json --compare base.json
+    python -m bench.load_test --url http://127.0.0.1:8000 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from bench.common import BACKEND_DIR, BASE_QUESTIONS, corpus_pdfs, free_port, percentiles, setup_bench_env
+from bench.bench_cases import document_title, parse_cases
+
+ENDPOINTS = ("query", "stream", "search", "upload")
+DEFAULT_MIX = "query=0.6,stream=0.2,search=0.18,upload=0.02"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name.strip() not in ENDPOINTS:
+            raise ValueError(f"Endpoint desconocido en la mezcla: {name}")
+        mix[name.strip()] = float(weight)
+    total = sum(mix.values())
+    return {name: weight / total for name, weight in mix.items() if weight > 0}
+
+
+# --------- Backend bajo prueba ---------
+
+def start_backend(workdir: str, workers: int) -> Tuple[subprocess.Popen, str]:
+    """
+    uvicorn main:app en un proceso aparte con el entorno de setup_bench_env;
+    su log queda en workdir/backend.log.
+    """
+    port = free_port()
+    env = {**os.environ, "ANONYMIZED_TELEMETRY": "False"}
+    log = open(os.path.join(workdir, "backend.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El backend terminó al arrancar (ver {log.name})")
+        try:
+            if httpx.get(f"{base_url}/status", timeout=1.0).json()["readiness"]["ready"]:
+                return proc, base_url
+        except (httpx.HTTPError, KeyError, ValueError):
+            pass
+        time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError("El backend no quedó listo a tiempo")
+
+
+def upload_corpus(base_url: str, timeout: float = 600.0):
+    """
+    Sube los PDFs del corpus y espera a que terminen sus jobs.
+    """
+    with httpx.Client(base_url=base_url, timeout=60.0) as client:
+        jobs = []
+        for path in corpus_pdfs():
+            with open(path, "rb") as f:
+                response = client.post("/upload-file", params={"title": document_title(path)},
+                                       files={"file": (os.path.basename(path), f, "application/pdf")})
+            response.raise_for_status()
+            jobs.append(response.json()["job_id"])
+
+        deadline = time.time() + timeout
+        while jobs and time.time() < deadline:
+            states = {job_id: client.get(f"/jobs/{job_id}").json() for job_id in jobs}
+            for job_id, state in states.items():
+                if state["status"] == "failed":
+                    raise RuntimeError(f"Falló el job {job_id}: {state.get('error')}")
+            jobs = [job_id for job_id, state in states.items() if state["status"] != "completed"]
+            time.sleep(0.5)
+        if jobs:
+            raise RuntimeError(f"Jobs sin terminar: {jobs}")
+
+
+# --------- Requests ---------
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.first_token: List[float] = []
+        self.errors: Dict[str, Dict[str, int]] = {name: {} for name in ENDPOINTS}
+        self.sent = {name: 0 for name in ENDPOINTS}
+        # Respuestas sin LLM porque el control de admisión no les dio lugar
+        self.degraded = {name: 0 for name in ENDPOINTS}
+        self.dropped = 0
+
+    def error(self, endpoint: str, kind: str):
+        self.errors[endpoint][kind] = self.errors[endpoint].get(kind, 0) + 1
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, rng: random.Random, questions: List[str],
+               upload: bytes, recorder: Recorder):
+    recorder.sent[endpoint] += 1
+    question = rng.choice(questions)
+    t0 = time.perf_counter()
+    try:
+        if endpoint == "query":
+            response = await client.post("/query", json={"question": question})
+        elif endpoint == "search":
+            response = await client.post("/search", json={"query": question})
+        elif endpoint == "upload":
+            # Pocos títulos distintos: los re-envíos re-indexan de forma incremental
+            response = await client.post("/upload-file", params={"title": f"Prueba de carga {rng.randrange(3)}"},
+                                         files={"file": ("carga.pdf", upload, "application/pdf")})
+        else:
+            async with client.stream("POST", "/query/stream", json={"question": question}) as response:
+                if response.status_code == 200:
+                    first, metadata = True, False
+                    async for line in response.aiter_lines():
+                        if line.startswith("event: token") and first:
+                            recorder.first_token.append(time.perf_counter() - t0)
+                            first = False
+                        elif line.startswith("event: metadata"):
+                            metadata = True
+                        elif metadata and line.startswith("data:"):
+                            recorder.degraded[endpoint] += bool(json.loads(line[5:]).get("degraded"))
+                            metadata = False
+                        elif line.startswith("event: error"):
+                            recorder.error(endpoint, "evento error")
+                            return
+        elapsed = time.perf_counter() - t0
+    except httpx.TimeoutException:
+        recorder.error(endpoint, "timeout")
+        return
+    except httpx.HTTPError as e:
+        recorder.error(endpoint, type(e).__name__)
+        return
+
+    if response.status_code >= 400:
+        recorder.error(endpoint, str(response.status_code))
+    else:
+        recorder.latencies[endpoint].append(elapsed)
+        if endpoint == "query":
+            recorder.degraded[endpoint] += bool(response.json().get("degraded"))
+
+
+async def closed_loop(client, mix, args, questions, upload, recorder, concurrency: int):
+    stop = time.perf_counter() + args.duration
+
+    async def user(i: int):
+        rng = random.Random(args.seed * 1000 + i)
+        while time.perf_counter() < stop:
+            endpoint = rng.choices(list(mix), weights=list(mix.values()))[0]
+            await send(client, endpoint, rng, questions, upload, recorder)
+
+    await asyncio.gather(*[user(i) for i in range(concurrency)])
+
+
+async def open_loop(client, mix, args, questions, upload, recorder, rate: float, max_in_flight: int):
+    rng = random.Random(args.seed)
+    stop = time.perf_counter() + args.duration
+    in_flight = set()
+    next_at = time.perf_counter()
+    while next_at < stop:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        next_at += rng.expovariate(rate)
+        if len(in_flight) >= max_in_flight:
+            recorder.dropped += 1
+            continue
+        endpoint = rng.choices(list(mix), weights=list(mix.values()))[0]
+        task = asyncio.ensure_future(send(client, endpoint, random.Random(rng.random()), questions, upload, recorder))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+# --------- Reporte ---------
+
+def summarize(recorder: Recorder, elapsed: float, level: Dict[str, Any]) -> Dict[str, Any]:
+    endpoints = {}
+    for name in ENDPOINTS:
+        sent = recorder.sent[name]
+        if not sent:
+            continue
+        errors = sum(recorder.errors[name].values())
+        stats = {k: v * 1000 for k, v in percentiles(recorder.latencies[name]).items()}
+        endpoints[name] = {
+            "sent": sent,
+            "ok": len(recorder.latencies[name]),
+            "throughput": len(recorder.latencies[name]) / elapsed,
+            "error_rate": errors / sent,
+            "errors": recorder.errors[name],
+            "degraded_rate": recorder.degraded[name] / len(recorder.latencies[name]) if recorder.latencies[name] else 0.0,
+            **{f"{k}_ms": round(v, 2) for k, v in stats.items()},
+        }
+        if name == "stream" and recorder.first_token:
+            first = percentiles(recorder.first_token)
+            endpoints[name]["first_token_p50_ms"] = round(first["p50"] * 1000, 2)
+            endpoints[name]["first_token_p95_ms"] = round(first["p95"] * 1000, 2)
+
+    ok = sum(e["ok"] for e in endpoints.values())
+    sent = sum(e["sent"] for e in endpoints.values())
+    return {
+        **level,
+        "elapsed_s": round(elapsed, 2),
+        "throughput": ok / elapsed,
+        "error_rate": (sent - ok) / sent if sent else 0.0,
+        "dropped": recorder.dropped,
+        "endpoints": endpoints,
+    }
+
+
+def print_level(report: Dict[str, Any]):
+    label = f"rate={report['rate']}/s" if report.get("rate") else f"concurrency={report['concurrency']}"
+    print(f"\n[{label}] {report['throughput']:.1f} req/s ok | errores {report['error_rate']:.1%} | "
+          f"descartados por el cliente={report['dropped']}")
+    for name, e in report["endpoints"].items():
+        extra = (f" | 1er token p50={e['first_token_p50_ms']:.0f}ms p95={e['first_token_p95_ms']:.0f}ms"
+                 if "first_token_p50_ms" in e else "")
+        if e["degraded_rate"]:
+            extra += f" | degradadas {e['degraded_rate']:.1%}"
+        print(f"  {name:7} {e['ok']:6}/{e['sent']:<6} {e['throughput']:7.1f} req/s | p50={e['p50_ms']:.0f}ms "
+              f"p95={e['p95_ms']:.0f}ms p99={e['p99_ms']:.0f}ms | errores {e['error_rate']:.1%} "
+              f"{e['errors'] or ''}{extra}")
+
+
+def level_key(report: Dict[str, Any]) -> str:
+    return f"rate={report['rate']}" if report.get("rate") else f"concurrency={report['concurrency']}"
+
+
+def compare(reports: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> bool:
+    """
+    Compara nivel por nivel y endpoint por endpoint con el reporte anterior.
+    Devuelve True si hubo alguna regresión.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {level_key(r): r for r in json.load(f)["levels"]}
+
+    regressed = False
+    print(f"\nComparación con {baseline_path} (tolerancia {tolerance:.0%})")
+    for report in reports:
+        before = baseline.get(level_key(report))
+        if before is None:
+            print(f"  {level_key(report)}: sin nivel equivalente en la base")
+            continue
+        for name, now in report["endpoints"].items():
+            old = before["endpoints"].get(name)
+            if old is None:
+                continue
+            problems = []
+            if old["p95_ms"] and now["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                problems.append("p95")
+            if now["throughput"] < old["throughput"] * (1 - tolerance):
+                problems.append("throughput")
+            if now["error_rate"] > old["error_rate"] + 0.01:
+                problems.append("errores")
+            if now.get("degraded_rate", 0.0) > old.get("degraded_rate", 0.0) + 0.01:
+                problems.append("degradadas")
+            regressed = regressed or bool(problems)
+            print(f"  {level_key(report):16} {name:7} p95 {old['p95_ms']:.0f}→{now['p95_ms']:.0f}ms | "
+                  f"throughput {old['throughput']:.1f}→{now['throughput']:.1f} req/s | "
+                  f"errores {old['error_rate']:.1%}→{now['error_rate']:.1%}"
+                  f"{' | REGRESIÓN: ' + ', '.join(problems) if problems else ''}")
+    return regressed
+
+
+async def run_levels(base_url: str, args) -> List[Dict[str, Any]]:
+    mix = parse_mix(args.mix)
+    questions = BASE_QUESTIONS + [c["question"] for c in parse_cases()]
+    with open(min(corpus_pdfs(), key=os.path.getsize), "rb") as f:
+        upload = f.read()
+
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    levels = (
+        [{"rate": float(r), "concurrency": concurrencies[0]} for r in args.rate.split(",")]
+        if args.rate else [{"rate": None, "concurrency": c} for c in concurrencies]
+    )
+
+    reports = []
+    limits = httpx.Limits(max_connections=max(concurrencies) + 10, max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for level in levels:
+            recorder = Recorder()
+            t0 = time.perf_counter()
+            if level["rate"]:
+                await open_loop(client, mix, args, questions, upload, recorder, level["rate"], level["concurrency"])
+            else:
+                await closed_loop(client, mix, args, questions, upload, recorder, level["concurrency"])
+            report = summarize(recorder, time.perf_counter() - t0, level)
+            print_level(report)
+            reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="8", help="Clientes (lazo cerrado) o máximo en vuelo (lazo abierto)")
+    parser.add_argument("--rate", default=None, help="Llegadas por segundo (lazo abierto); admite varios valores")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos por nivel")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Pesos por endpoint: query, stream, search, upload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por request del cliente")
+    parser.add_argument("--url", default=None, help="Backend ya levantado (no se inicia ni se indexa nada)")
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn del backend")
+    parser.add_argument("--embed-latency-ms", type=float, default=60.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=800.0, help="Repartida entre los tokens en streaming")
+    parser.add_argument("--chat-ms-per-kchar", type=float, default=0.0)
+    parser.add_argument("--answer-cache", action="store_true", help="Deja activa la cache semántica de respuestas")
+    parser.add_argument("--json", help="Guarda el reporte en este JSON")
+    parser.add_argument("--compare", help="Reporte JSON anterior contra el que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    proc = None
+    base_url = args.url
+    if base_url is None:
+        workdir = setup_bench_env(args.embed_latency_ms, args.chat_latency_ms,
+                                  disable_answer_cache=not args.answer_cache,
+                                  chat_ms_per_kchar=args.chat_ms_per_kchar)
+        proc, base_url = start_backend(workdir, args.workers)
+        t0 = time.perf_counter()
+        upload_corpus(base_url)
+        print(f"Backend en {base_url} | corpus indexado en {time.perf_counter() - t0:.1f}s | log en {workdir}")
+
+    try:
+        print(f"mezcla={parse_mix(args.mix)} | {args.duration:.0f}s por nivel | "
+              f"embed {args.embed_latency_ms:.0f}ms | chat {args.chat_latency_ms:.0f}ms")
+        reports = asyncio.run(run_levels(base_url, args))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": reports}, f, ensure_ascii=False, indent=2)
+    if args.compare and compare(reports, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("CHUNK_TEXTS")
+# ---------------------------------------------------------
+
+# SQLite limita la cantidad de parámetros por sentencia
+_SQL_BATCH = 500
+
+
+class ChunkTextStore:
+    """
+    Texto de cada chunk por chunk_id, local al proceso, en dos niveles:
+    - Memoria: LRU acotado (OrderedDict)
+    - Disco: SQLite (chunk_id → texto)
+
+    Es la segunda fase del retrieval: la búsqueda y el gate de grounding
+    trabajan solo con ids, scores y metadatos, y los textos se leen de acá
+    cuando hace falta armar el contexto del prompt.
+    """
+
+    def __init__(self, path: str, max_memory_items: int = 4096):
+        self.path = path
+        self.max_memory_items = max_memory_items
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_texts (chunk_id TEXT PRIMARY KEY, text TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM chunk_texts").fetchone()[0]
+
+        logger.info(f"[CHUNK_TEXTS] Store abierto en {path} | chunks={self._count}")
+
+    # --------- Lectura ---------
+
+    def get_many(self, chunk_ids: List[str]) -> Dict[str, str]:
+        """
+        Textos de los ids pedidos; los que no están se omiten.
+        """
+        found: Dict[str, str] = {}
+        with self._lock:
+            pending = []
+            for cid in chunk_ids:
+                text = self._memory.get(cid)
+                if text is not None:
+                    self._memory.move_to_end(cid)
+                    found[cid] = text
+                    self.memory_hits += 1
+                else:
+                    pending.append(cid)
+
+            for start in range(0, len(pending), _SQL_BATCH):
+                part = pending[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                for cid, text in self._conn.execute(
+                    f"SELECT chunk_id, text FROM chunk_texts WHERE chunk_id IN ({placeholders})", part
+                ):
+                    self._remember(cid, text)
+                    found[cid] = text
+                    self.disk_hits += 1
+
+            self.misses += sum(1 for cid in pending if cid not in found)
+        return found
+
+    def count(self) -> int:
+        with self._lock:
+            return self._count
+
+    # --------- Escritura ---------
+
+    def put_many(self, chunk_ids: List[str], texts: List[str]):
+        with self._lock:
+            for cid, text in zip(chunk_ids, texts):
+                if cid in self._memory:
+                    self._remember(cid, text)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_texts (chunk_id, text) VALUES (?, ?)",
+                list(zip(chunk_ids, texts)),
+            )
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM chunk_texts").fetchone()[0]
+
+    def delete(self, chunk_ids: List[str]):
+        with self._lock:
+            for cid in chunk_ids:
+                self._memory.pop(cid, None)
+            self._conn.executemany("DELETE FROM chunk_texts WHERE chunk_id = ?", [(cid,) for cid in chunk_ids])
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM chunk_texts").fetchone()[0]
+
+    def _remember(self, chunk_id: str, text: str):
+        self._memory[chunk_id] = text
+        self._memory.move_to_end(chunk_id)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    # --------- Métricas ---------
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "chunks": self._count,
+                "memory_items": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
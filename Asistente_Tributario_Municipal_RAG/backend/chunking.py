@@ -0,0 +1,256 @@
+import re
+import time
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import (
+    CHUNKING_STRATEGY, CHUNKING_STRATEGIES, STRUCTURE_CHUNK_MIN_CHARS, STRUCTURE_CHUNK_MAX_CHARS,
+)
+from metrics import metrics
+from structure_chunking import StructureChunker
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("RAG")
+# ---------------------------------------------------------
+
+# Este módulo no inicializa clientes externos: puede importarse desde
+# procesos worker (ver ingestion.py) sin abrir Cohere ni Chroma.
+
+# --------- Utilidades de texto ---------
+
+
+def limpiar_texto(texto: str) -> str:
+    """
+    Normaliza saltos de línea y espacios.
+    """
+    texto = texto.replace("\r\n", "\n").replace("\r", "\n")
+    texto = re.sub(r"\n{3,}", "\n\n", texto)
+    texto = re.sub(r"[ \t]+", " ", texto)
+    return texto.strip() 
+
+# --------- SPLITTERS ---------
+
+# Diferentes configuraciones para distintos tipos de documentos.
+# Los tamaños son constantes del módulo (context_assembly.py también los usa)
+# para no depender de atributos privados del splitter.
+
+# textos cortos
+GUIAS_CHUNK_SIZE = 500
+GUIAS_CHUNK_OVERLAP = 80
+
+# textos largos
+CODIGO_CHUNK_SIZE = 3000
+CODIGO_CHUNK_OVERLAP = 350
+
+splitter_guias = RecursiveCharacterTextSplitter(
+    chunk_size=GUIAS_CHUNK_SIZE,
+    chunk_overlap=GUIAS_CHUNK_OVERLAP,
+    separators=["\n\n", "\n", " ", ""],
+)
+
+splitter_codigo = RecursiveCharacterTextSplitter(
+    chunk_size=CODIGO_CHUNK_SIZE,
+    chunk_overlap=CODIGO_CHUNK_OVERLAP,
+    separators=["\n\n", "\n", " ", ""],
+)
+
+def infer_document_metadata(title: str) -> Dict[str, str]:
+    t = title.lower()
+    
+    if "codigo" in t or "tributario" in t:
+        return {"tipo_documento": "normativa", "tramite": "general"}
+
+    if "guia" in t:
+        return {"tipo_documento": "procedimiento", "tramite": "general"}
+
+    if "art" in t and "25" in t:
+        return {"tipo_documento": "protocolo_reclamo", "tramite": "reclamo"}
+
+    if "autoridad" in t:
+        return {"tipo_documento": "autoridad_operativa", "tramite": "general"}
+
+    if "plan" in t:
+        return {"tipo_documento": "regularizacion", "tramite": "general"}
+
+    return {"tipo_documento": "desconocido", "tramite": "general"}
+
+
+# --------- Chunking por páginas ---------
+
+# Separador de páginas en el texto guardado de un documento (como pdftotext)
+PAGE_BREAK = "\f"
+
+# El splitter trabaja sobre una ventana de varios chunks: los cortes quedan
+# igual que sobre el documento completo sin acumular todo el texto
+_WINDOW_CHUNKS = 8
+
+
+def splitter_for(title: str) -> Tuple[RecursiveCharacterTextSplitter, int]:
+    """
+    Splitter del documento y su chunk_size.
+    """
+    if infer_document_metadata(title)["tipo_documento"] == "normativa":
+        return splitter_codigo, CODIGO_CHUNK_SIZE
+    return splitter_guias, GUIAS_CHUNK_SIZE
+
+
+def split_pages(content: str) -> Iterator[Tuple[int, str]]:
+    """
+    (número de página, texto) de un documento guardado con PAGE_BREAK.
+    Un texto sin separadores es una única página.
+    """
+    for i, text in enumerate(content.split(PAGE_BREAK)):
+        yield i + 1, text
+
+
+def _observe_chunking(seconds: float):
+    metrics.observe("chunk", seconds)
+
+
+def iter_page_chunks(pages: Iterable[Tuple[int, str]], title: str, strategy: Optional[str] = None,
+                     record_busy: Callable[[float], None] = _observe_chunking) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    Recibe páginas en orden (p. ej. a medida que se extraen) y genera
+    (chunk, página inicial, página final, heading_path) según la estrategia
+    (CHUNKING_STRATEGY por defecto). heading_path es "" con los splitters
+    de tamaño fijo.
+    Al terminar, el tiempo propio del chunking va a record_busy (por defecto
+    la etapa "chunk" de metrics).
+    """
+    strategy = strategy or CHUNKING_STRATEGY
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"CHUNKING_STRATEGY desconocida: {strategy} (opciones: {CHUNKING_STRATEGIES})")
+    if strategy == "structure":
+        return _iter_structured_chunks(pages, record_busy)
+    return _iter_recursive_chunks(pages, title, record_busy)
+
+
+def _iter_structured_chunks(pages: Iterable[Tuple[int, str]],
+                            record_busy: Callable[[float], None]) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    Cortes por estructura del documento (ver structure_chunking.py).
+    """
+    chunker = StructureChunker(min_chars=STRUCTURE_CHUNK_MIN_CHARS, max_chars=STRUCTURE_CHUNK_MAX_CHARS)
+    busy = 0.0
+    for page_no, text in pages:
+        t0 = time.perf_counter()
+        out = list(chunker.feed(limpiar_texto(text), page_no))
+        busy += time.perf_counter() - t0
+        yield from out
+
+    t0 = time.perf_counter()
+    out = list(chunker.finish())
+    record_busy(busy + time.perf_counter() - t0)
+    yield from out
+
+
+def _iter_recursive_chunks(pages: Iterable[Tuple[int, str]], title: str,
+                           record_busy: Callable[[float], None]) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    Splitter de tamaño fijo con un buffer acotado: cuando el buffer supera
+    la ventana se emiten todos los chunks menos el último, y el texto se
+    retiene desde el inicio de ese último chunk.
+    """
+    splitter, chunk_size = splitter_for(title)
+    window = chunk_size * _WINDOW_CHUNKS
+
+    buffer = ""
+    starts: List[int] = []   # offset en el buffer donde empieza cada página
+    numbers: List[int] = []  # número de página correspondiente
+
+    def page_at(offset: int) -> int:
+        return numbers[max(bisect_right(starts, offset) - 1, 0)]
+
+    def split(final: bool):
+        nonlocal buffer, starts, numbers
+        chunks = splitter.split_text(buffer)
+        if not final and len(chunks) <= 1:
+            return []
+
+        located = []
+        cursor = 0
+        for chunk in chunks:
+            pos = buffer.find(chunk, cursor)
+            if pos < 0:
+                pos = cursor
+            located.append((chunk, pos))
+            cursor = pos + 1
+
+        if final:
+            emit = located
+        else:
+            emit = located[:-1]
+            keep_from = located[-1][1]
+            first = max(bisect_right(starts, keep_from) - 1, 0)
+            starts = [0] + [s - keep_from for s in starts[first + 1:]]
+            numbers = numbers[first:]
+
+        out = [(chunk, page_at(pos), page_at(pos + len(chunk) - 1), "") for chunk, pos in emit]
+        if not final:
+            buffer = buffer[keep_from:]
+        return out
+
+    # Tiempo propio del chunking, sin el de producir las páginas ni el del consumidor
+    busy = 0.0
+    for page_no, text in pages:
+        t0 = time.perf_counter()
+        text = limpiar_texto(text)
+        out = []
+        if text:
+            if buffer:
+                buffer += "\n"
+            starts.append(len(buffer))
+            numbers.append(page_no)
+            buffer += text
+
+            if len(buffer) >= window:
+                out = split(final=False)
+        busy += time.perf_counter() - t0
+        yield from out
+
+    t0 = time.perf_counter()
+    out = split(final=True) if buffer else []
+    record_busy(busy + time.perf_counter() - t0)
+    yield from out
+
+
+def chunk_document_pages(content: str, title: str,
+                         strategy: Optional[str] = None) -> Tuple[List[str], List[Tuple[int, int, str]]]:
+    """
+    Divide un documento y devuelve (chunks, [(página inicial, página final, heading_path)]).
+    """
+    return _chunk_pages(content, title, strategy, _observe_chunking)
+
+
+def chunk_document_pages_timed(content: str, title: str, strategy: Optional[str] = None
+                               ) -> Tuple[List[str], List[Tuple[int, int, str]], float]:
+    """
+    Igual que chunk_document_pages pero devuelve además el tiempo de
+    chunking en vez de registrarlo: los workers de un pool de procesos
+    tienen su propio metrics, así que lo registra el proceso principal.
+    """
+    busy: List[float] = []
+    chunks, pages = _chunk_pages(content, title, strategy, busy.append)
+    return chunks, pages, sum(busy)
+
+
+def _chunk_pages(content: str, title: str, strategy: Optional[str],
+                 record_busy: Callable[[float], None]) -> Tuple[List[str], List[Tuple[int, int, str]]]:
+    logger.info(f"[CHUNK] Iniciando chunking del documento. Longitud={len(content)} caracteres")
+
+    chunks: List[str] = []
+    pages: List[Tuple[int, int, str]] = []
+    for chunk, page_start, page_end, heading_path in iter_page_chunks(split_pages(content), title, strategy,
+                                                                      record_busy):
+        chunks.append(chunk)
+        pages.append((page_start, page_end, heading_path))
+
+    logger.info(f"[CHUNK] Documento dividido en {len(chunks)} chunks ({infer_document_metadata(title)})")
+    return chunks, pages
+
+
+def chunk_document(content: str, title: str, strategy: Optional[str] = None) -> List[str]:
+    return chunk_document_pages(content, title, strategy)[0]
@@ -0,0 +1,502 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+import httpx
+from cohere.core.api_error import ApiError
+
+from metrics import metrics
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("COHERE")
+# ---------------------------------------------------------
+
+# Errores de Cohere que justifican reintentar (rate limit y fallas del servidor)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+OPERATIONS = ("embed", "chat")
+
+
+# --------- Errores ---------
+
+class CohereUnavailableError(Exception):
+    """
+    Cohere falló de forma transitoria y se agotaron los reintentos: el
+    llamador puede responder 503 (con Retry-After) en lugar de un 500.
+    """
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(CohereUnavailableError):
+    """El circuit breaker de la operación está abierto: no se llamó a Cohere."""
+
+
+class DeadlineExceededError(CohereUnavailableError):
+    """El llamado no terminó dentro de su deadline."""
+
+    status_code = 504
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (CohereUnavailableError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, ApiError) and error.status_code in RETRYABLE_STATUS
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    """
+    Segundos de Retry-After que indicó el servidor (o el breaker), si los hay.
+    """
+    headers = getattr(error, "headers", None) or {}
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return getattr(error, "retry_after", None)
+
+
+def retry_delay(error: BaseException, attempt: int, base_seconds: float) -> float:
+    """
+    Espera antes del reintento `attempt` (desde 0): respeta Retry-After si
+    viene; si no, backoff exponencial. El jitter evita que los llamados en
+    vuelo reintenten todos a la vez.
+    """
+    retry_after = retry_after_of(error)
+    base = retry_after if retry_after is not None else base_seconds * (2 ** attempt)
+    return base * random.uniform(0.5, 1.5)
+
+
+# --------- Circuit breaker ---------
+
+class CircuitBreaker:
+    """
+    closed → open tras failure_threshold fallas transitorias seguidas.
+    open: rechaza sin llamar durante reset_seconds; después pasa a half_open
+    y deja pasar un único llamado de prueba: si responde se cierra, si falla
+    vuelve a abrirse. Cualquier respuesta del servidor que no sea una falla
+    transitoria (incluso un 400) cuenta como éxito.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened_total = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> bool:
+        """
+        Autoriza un llamado o lanza CircuitOpenError. Devuelve True si este
+        llamado es la prueba de half_open (el único que puede liberarla).
+        """
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            retry_after = max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(f"Circuit breaker de '{self.name}' abierto", retry_after=retry_after or None)
+
+    def on_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"[COHERE] Circuit breaker de '{self.name}' cerrado")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._probing
+            self._probing = False
+            if probe_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened_total += 1
+                logger.warning(
+                    f"[COHERE] Circuit breaker de '{self.name}' abierto tras {self._failures} fallas "
+                    f"(se reintenta en {self.reset_seconds:.0f}s)"
+                )
+
+    def release(self):
+        """La prueba de half_open se canceló: se libera sin resultado para que pase otra."""
+        with self._lock:
+            self._probing = False
+
+
+# --------- Cliente resiliente ---------
+
+class ResilientCohere:
+    """
+    Capa única de salida hacia Cohere para embed y chat (sync, async y
+    streaming), sobre los clientes del SDK:
+
+    - deadline por llamado: cubre la espera de un lugar, cada intento
+      (timeout del request) y los reintentos; al vencer → DeadlineExceededError.
+    - reintentos con backoff exponencial y jitter ante 429/5xx y fallas de
+      transporte; los errores definitivos (4xx) se propagan sin reintentar.
+    - hedging opcional del embed async: si el primer request no respondió en
+      hedge_after_ms se lanza otro y gana el primero (acotado a hedge_max_ratio).
+    - circuit breaker y límite de concurrencia por operación.
+    Si se agotan los reintentos se lanza CohereUnavailableError.
+    """
+
+    def __init__(self, sync_client: Any, async_client: Any,
+                 deadlines: Dict[str, float], concurrency: Dict[str, int],
+                 max_retries: int = 2, backoff_base_seconds: float = 0.2,
+                 hedge_after_ms: float = 0.0, hedge_max_ratio: float = 0.1,
+                 breaker_failures: int = 5, breaker_reset_seconds: float = 30.0):
+        self._sync = sync_client
+        self._async = async_client
+        self.deadlines = dict(deadlines)
+        self.concurrency = dict(concurrency)
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.hedge_after = hedge_after_ms / 1000
+        self.hedge_max_ratio = hedge_max_ratio
+
+        self.breakers = {op: CircuitBreaker(op, breaker_failures, breaker_reset_seconds) for op in OPERATIONS}
+        self._sync_slots = {op: threading.BoundedSemaphore(self.concurrency[op]) for op in OPERATIONS}
+        # Los semáforos async quedan atados a un event loop: uno por loop
+        self._async_slots: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = {}
+
+        self._lock = threading.Lock()
+        self._in_flight = {op: 0 for op in OPERATIONS}
+        self._calls = {op: 0 for op in OPERATIONS}
+        self._hedges = {op: 0 for op in OPERATIONS}
+        self._retries = {op: 0 for op in OPERATIONS}
+        self._rejected = {op: 0 for op in OPERATIONS}
+
+    # --------- API (mismos argumentos que el SDK) ---------
+
+    def embed(self, **kwargs):
+        return self._call("embed", self._sync.embed, kwargs)
+
+    def chat(self, **kwargs):
+        return self._call("chat", self._sync.chat, kwargs)
+
+    async def embed_async(self, **kwargs):
+        return await self._acall("embed", self._async.embed, kwargs, hedge=self.hedge_after > 0)
+
+    async def chat_async(self, **kwargs):
+        return await self._acall("chat", self._async.chat, kwargs)
+
+    async def chat_stream(self, **kwargs) -> AsyncIterator[Any]:
+        """
+        Igual que chat_stream del SDK. Se reintenta solo hasta recibir el
+        primer evento: una vez que empezó a emitir, un corte (timeout o falla
+        de transporte) cuenta para el breaker y se propaga como
+        DeadlineExceededError o CohereUnavailableError.
+        """
+        op = "chat"
+        deadline = self._start(op)
+        outcome = "cancelled"
+        try:
+            async with self._async_slot(op, deadline):
+                attempt = 0
+                while True:
+                    probe = self.breakers[op].before_call()
+                    iterator = self._async.chat_stream(**kwargs, request_options=self._options(op, deadline)).__aiter__()
+                    t0 = time.perf_counter()
+                    try:
+                        with self._tracking(op):
+                            first = await asyncio.wait_for(iterator.__anext__(), self._remaining(op, deadline))
+                    except StopAsyncIteration:
+                        self.breakers[op].on_success()
+                        outcome = "ok"
+                        return
+                    except asyncio.CancelledError:
+                        self._cancelled(op, probe)
+                        raise
+                    except Exception as e:
+                        delay = self._after_failure(op, e, attempt, deadline)
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                    metrics.observe(f"cohere_{op}", time.perf_counter() - t0)
+                    self.breakers[op].on_success()
+                    break
+
+                yield first
+                while True:
+                    try:
+                        event = await asyncio.wait_for(iterator.__anext__(), self._remaining(op, deadline))
+                    except StopAsyncIteration:
+                        break
+                    except (asyncio.TimeoutError, DeadlineExceededError, httpx.TransportError) as e:
+                        self.breakers[op].on_failure()
+                        raise self._interrupted(op, e) from e
+                    yield event
+            outcome = "ok"
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            self._finish(op, outcome)
+
+    # --------- Llamados ---------
+
+    def _call(self, op: str, fn: Callable, kwargs: Dict[str, Any]):
+        deadline = self._start(op)
+        outcome = "cancelled"
+        slots = self._sync_slots[op]
+        try:
+            if not slots.acquire(timeout=self._remaining(op, deadline)):
+                raise DeadlineExceededError(f"Deadline de '{op}' vencido esperando un lugar")
+            try:
+                attempt = 0
+                while True:
+                    self.breakers[op].before_call()
+                    t0 = time.perf_counter()
+                    try:
+                        with self._tracking(op):
+                            response = fn(**kwargs, request_options=self._options(op, deadline))
+                    except Exception as e:
+                        delay = self._after_failure(op, e, attempt, deadline)
+                        time.sleep(delay)
+                        attempt += 1
+                        continue
+                    metrics.observe(f"cohere_{op}", time.perf_counter() - t0)
+                    self.breakers[op].on_success()
+                    outcome = "ok"
+                    return response
+            finally:
+                slots.release()
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            self._finish(op, outcome)
+
+    async def _acall(self, op: str, fn: Callable, kwargs: Dict[str, Any], hedge: bool = False):
+        deadline = self._start(op)
+        outcome = "cancelled"
+        try:
+            async with self._async_slot(op, deadline):
+                attempt = 0
+                while True:
+                    probe = self.breakers[op].before_call()
+                    try:
+                        if hedge:
+                            response = await self._hedged(op, fn, kwargs, deadline)
+                        else:
+                            response = await self._attempt(op, fn, kwargs, deadline)
+                    except asyncio.CancelledError:
+                        self._cancelled(op, probe)
+                        raise
+                    except Exception as e:
+                        delay = self._after_failure(op, e, attempt, deadline)
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+                    self.breakers[op].on_success()
+                    outcome = "ok"
+                    return response
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            self._finish(op, outcome)
+
+    async def _attempt(self, op: str, fn: Callable, kwargs: Dict[str, Any], deadline: float):
+        t0 = time.perf_counter()
+        with self._tracking(op):
+            response = await asyncio.wait_for(
+                fn(**kwargs, request_options=self._options(op, deadline)), self._remaining(op, deadline),
+            )
+        metrics.observe(f"cohere_{op}", time.perf_counter() - t0)
+        return response
+
+    async def _hedged(self, op: str, fn: Callable, kwargs: Dict[str, Any], deadline: float):
+        primary = asyncio.ensure_future(self._attempt(op, fn, kwargs, deadline))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(self.hedge_after, self._remaining(op, deadline)))
+            if done or not self._take_hedge(op):
+                return await primary
+
+            hedge = asyncio.ensure_future(self._attempt(op, fn, kwargs, deadline))
+            tasks.add(hedge)
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        metrics.inc("rag_cohere_hedges_total", {"op": op, "result": "won" if task is hedge else "lost"},
+                                    help="Requests duplicados por hedging según quién respondió primero")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Los intentos que perdieron se cancelan; el resultado del llamado
+            # (y de la prueba de half_open, si lo era) lo registra _acall
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _take_hedge(self, op: str) -> bool:
+        # Solo con el circuito cerrado y dentro del presupuesto de requests extra
+        if self.breakers[op].state != "closed":
+            return False
+        with self._lock:
+            if self._hedges[op] + 1 > self.hedge_max_ratio * self._calls[op]:
+                return False
+            self._hedges[op] += 1
+        return True
+
+    # --------- Reintentos y deadlines ---------
+
+    def _after_failure(self, op: str, error: Exception, attempt: int, deadline: float) -> float:
+        """
+        Decide si se reintenta: devuelve la espera o lanza el error final.
+        """
+        if isinstance(error, CohereUnavailableError):
+            raise error
+        if not is_retryable(error):
+            # El servidor respondió: para el breaker no es una falla
+            self.breakers[op].on_success()
+            raise error
+
+        self.breakers[op].on_failure()
+        delay = retry_delay(error, attempt, self.backoff_base_seconds)
+        if attempt < self.max_retries and time.monotonic() + delay < deadline:
+            with self._lock:
+                self._retries[op] += 1
+            metrics.inc("rag_cohere_retries_total", {"op": op}, help="Reintentos de llamados a Cohere")
+            logger.warning(
+                f"[COHERE] Error transitorio en {op} ({type(error).__name__}). "
+                f"Reintento {attempt + 1}/{self.max_retries} en {delay:.2f}s"
+            )
+            return delay
+
+        if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+            raise DeadlineExceededError(
+                f"'{op}' no respondió dentro del deadline ({self.deadlines[op]:.0f}s)"
+            ) from error
+        raise CohereUnavailableError(
+            f"'{op}' falló tras {attempt + 1} intentos: {type(error).__name__}",
+            retry_after=retry_after_of(error),
+        ) from error
+
+    def _interrupted(self, op: str, error: Exception) -> CohereUnavailableError:
+        """
+        Error final de un stream cortado después del primer evento (ya no se
+        puede reintentar sin repetir tokens).
+        """
+        if isinstance(error, (asyncio.TimeoutError, DeadlineExceededError, httpx.TimeoutException)):
+            return DeadlineExceededError(
+                f"'{op}' no terminó de emitir dentro del deadline ({self.deadlines[op]:.0f}s)"
+            )
+        return CohereUnavailableError(f"Stream de '{op}' cortado: {type(error).__name__}")
+
+    def _cancelled(self, op: str, probe: bool):
+        # Un llamado cancelado no es falla ni éxito; si era la prueba de
+        # half_open la libera para que la haga el próximo
+        if probe:
+            self.breakers[op].release()
+
+    def _start(self, op: str) -> float:
+        with self._lock:
+            self._calls[op] += 1
+        return time.monotonic() + self.deadlines[op]
+
+    def _remaining(self, op: str, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"Deadline de '{op}' vencido ({self.deadlines[op]:.0f}s)")
+        return remaining
+
+    def _options(self, op: str, deadline: float) -> Dict[str, Any]:
+        # Timeout del request acotado al deadline; los reintentos los maneja esta capa
+        return {"timeout_in_seconds": self._remaining(op, deadline), "max_retries": 0}
+
+    def _finish(self, op: str, outcome: str):
+        if outcome == "circuit_open":
+            with self._lock:
+                self._rejected[op] += 1
+        metrics.inc("rag_cohere_calls_total", {"op": op, "outcome": outcome},
+                    help="Llamados a Cohere por operación y desenlace")
+
+    # --------- Concurrencia ---------
+
+    @contextmanager
+    def _tracking(self, op: str):
+        with self._lock:
+            self._in_flight[op] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[op] -= 1
+
+    @asynccontextmanager
+    async def _async_slot(self, op: str, deadline: float):
+        loop = asyncio.get_running_loop()
+        bound = self._async_slots.get(op)
+        if bound is None or bound[0] is not loop:
+            bound = self._async_slots[op] = (loop, asyncio.Semaphore(self.concurrency[op]))
+        semaphore = bound[1]
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self._remaining(op, deadline))
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError(f"Deadline de '{op}' vencido esperando un lugar") from None
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    # --------- Estado ---------
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                op: {
+                    "circuit": self.breakers[op].state,
+                    "circuit_opened": self.breakers[op].opened_total,
+                    "in_flight": self._in_flight[op],
+                    "concurrency": self.concurrency[op],
+                    "calls": self._calls[op],
+                    "retries": self._retries[op],
+                    "hedges": self._hedges[op],
+                    "rejected_by_circuit": self._rejected[op],
+                }
+                for op in OPERATIONS
+            }
+
+
+def _outcome(error: BaseException) -> str:
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, DeadlineExceededError):
+        return "deadline"
+    if isinstance(error, CohereUnavailableError):
+        return "unavailable"
+    return "error"
@@ -0,0 +1,215 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --------- Persistencia ---------
+
+# Carpeta del vector store persistente (relativa al directorio del backend)
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chroma_db")
+COLLECTION_NAME = "asistente_tributario_municipal"
+
+# Backend de vectores: "chroma", "numpy" (matriz float32 en memoria mapeada)
+# o "snapshot" (archivo de snapshot portable, solo lectura; ver snapshot.py)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", "vector_index")
+# Particionado IVF del store numpy: se activa desde IVF_MIN_ROWS vectores
+# (0 listas = siempre búsqueda exacta). IVF_NPROBE listas se recorren por consulta.
+IVF_LISTS = int(os.getenv("IVF_LISTS", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "20000"))
+# Cuantización del store numpy: "float", "int8" (1 byte por dimensión) o
+# "binary" (1 bit). La búsqueda recorre los códigos y re-puntúa en float32
+# los QUANTIZATION_RESCORE_FACTOR * n_results mejores candidatos
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "float").lower()
+QUANTIZATION_RESCORE_FACTOR = int(os.getenv("QUANTIZATION_RESCORE_FACTOR", "10"))
+# Snapshot que abre VECTOR_STORE=snapshot; verificar las sumas sha256 al abrir
+# recorre el archivo entero (python -m snapshot verify lo hace aparte)
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "index.ragsnap")
+SNAPSHOT_VERIFY = os.getenv("SNAPSHOT_VERIFY", "false").lower() in ("1", "true", "yes")
+
+# --------- Modelos Cohere ---------
+
+EMBED_MODEL = os.getenv("COHERE_EMBED_MODEL", "embed-multilingual-v3.0")
+CHAT_MODEL = os.getenv("COHERE_CHAT_MODEL", "command-r-plus-08-2024")
+
+# Cohere permite máximo 96 textos por request de embed
+MAX_EMBED_TEXTS = 96
+
+# --------- Chunking ---------
+
+# "recursive": splitters de tamaño fijo (3000 caracteres para el código, 500 para guías)
+# "structure": cortes por artículo/título/apartado con heading_path en la metadata
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "recursive").lower()
+CHUNKING_STRATEGIES = ("structure", "recursive")
+# Tamaño de los chunks estructurales: las unidades más chicas se unen con las
+# siguientes y las más grandes se cortan entre líneas
+STRUCTURE_CHUNK_MIN_CHARS = int(os.getenv("STRUCTURE_CHUNK_MIN_CHARS", "400"))
+STRUCTURE_CHUNK_MAX_CHARS = int(os.getenv("STRUCTURE_CHUNK_MAX_CHARS", "2000"))
+
+# --------- Cache de embeddings ---------
+
+EMBED_CACHE_PATH = os.getenv(
+    "EMBED_CACHE_PATH", os.path.join(CHROMA_PATH, "embedding_cache.sqlite3")
+)
+# Entradas mantenidas en memoria (tier LRU en proceso)
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "2048"))
+# Entradas máximas en disco antes de desalojar las menos usadas
+EMBED_CACHE_DISK_ITEMS = int(os.getenv("EMBED_CACHE_DISK_ITEMS", "50000"))
+
+# --------- Textos de los chunks (segunda fase del retrieval) ---------
+
+# Store local chunk_id → texto; se completa desde el vector store al arrancar
+CHUNK_TEXTS_PATH = os.getenv(
+    "CHUNK_TEXTS_PATH", os.path.join(CHROMA_PATH, "chunk_texts.sqlite3")
+)
+CHUNK_TEXTS_MEMORY_ITEMS = int(os.getenv("CHUNK_TEXTS_MEMORY_ITEMS", "4096"))
+
+# --------- Cache semántica de respuestas ---------
+
+# Similitud coseno mínima entre preguntas para reutilizar una respuesta
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# --------- Recuperación ---------
+
+# "vector" (solo Chroma), "lexical" (solo BM25) o "hybrid" (ambos fusionados con RRF);
+# hybrid se habilita explícitamente, el default conserva la búsqueda vectorial
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+# Candidatos que aporta cada ranking antes de fusionar
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# Constante k de reciprocal rank fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Re-rankeo por diversidad (MMR): peso de la relevancia frente a la redundancia
+# con los chunks ya elegidos; 1 (default) lo desactiva
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "1.0"))
+# Candidatos que se traen (con sus embeddings) para re-rankear antes de quedarse con n_results
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+
+# --------- Micro-batching de consultas ---------
+
+# Ventana para agrupar embeds de preguntas y consultas al vector store
+# concurrentes (0 = sin agrupar). Hasta MICROBATCH_MAX_SIZE por lote.
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "96"))
+# Preguntas máximas por request en /query/batch
+QUERY_BATCH_MAX_QUESTIONS = int(os.getenv("QUERY_BATCH_MAX_QUESTIONS", "200"))
+
+# --------- Clientes Cohere ---------
+
+# Permite apuntar a un servidor compatible (p. ej. bench/fake_cohere_server.py)
+COHERE_BASE_URL = os.getenv("COHERE_BASE_URL") or None
+COHERE_TIMEOUT_SECONDS = float(os.getenv("COHERE_TIMEOUT_SECONDS", "60"))
+# Conexiones simultáneas máximas del cliente async compartido
+COHERE_MAX_CONNECTIONS = int(os.getenv("COHERE_MAX_CONNECTIONS", "100"))
+
+# --------- Resiliencia de los llamados a Cohere (cohere_client.py) ---------
+
+# Tiempo total por llamado, incluyendo la espera de un lugar y los reintentos
+COHERE_EMBED_DEADLINE_SECONDS = float(os.getenv("COHERE_EMBED_DEADLINE_SECONDS", "10"))
+COHERE_CHAT_DEADLINE_SECONDS = float(os.getenv("COHERE_CHAT_DEADLINE_SECONDS", "45"))
+# Reintentos ante 429/5xx y fallas de transporte (backoff exponencial con jitter)
+COHERE_MAX_RETRIES = int(os.getenv("COHERE_MAX_RETRIES", "2"))
+COHERE_BACKOFF_BASE_SECONDS = float(os.getenv("COHERE_BACKOFF_BASE_SECONDS", "0.2"))
+# Llamados simultáneos por operación (los que exceden esperan dentro de su deadline)
+COHERE_EMBED_CONCURRENCY = int(os.getenv("COHERE_EMBED_CONCURRENCY", "32"))
+COHERE_CHAT_CONCURRENCY = int(os.getenv("COHERE_CHAT_CONCURRENCY", "16"))
+# Hedging del embed async: si no respondió en este tiempo se lanza un segundo
+# request y se usa el primero que llegue (0 = desactivado; conviene ~p95 del embed).
+# COHERE_HEDGE_MAX_RATIO acota los requests extra a una fracción de los llamados.
+COHERE_EMBED_HEDGE_AFTER_MS = float(os.getenv("COHERE_EMBED_HEDGE_AFTER_MS", "0"))
+COHERE_HEDGE_MAX_RATIO = float(os.getenv("COHERE_HEDGE_MAX_RATIO", "0.1"))
+# Circuit breaker por operación: tras N fallas seguidas se rechaza sin llamar
+# durante RESET segundos y luego se deja pasar un llamado de prueba
+COHERE_BREAKER_FAILURES = int(os.getenv("COHERE_BREAKER_FAILURES", "5"))
+COHERE_BREAKER_RESET_SECONDS = float(os.getenv("COHERE_BREAKER_RESET_SECONDS", "30"))
+
+# --------- Control de admisión de la etapa LLM (admission.py) ---------
+
+# Respuestas generándose a la vez; el resto espera en la cola de su carril
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(COHERE_CHAT_CONCURRENCY)))
+# Carril interactivo (Streamlit, /query y /query/stream): cola corta y poca espera
+ADMISSION_INTERACTIVE_QUEUE = int(os.getenv("ADMISSION_INTERACTIVE_QUEUE", "32"))
+ADMISSION_INTERACTIVE_MAX_WAIT_MS = float(os.getenv("ADMISSION_INTERACTIVE_MAX_WAIT_MS", "2000"))
+# Carril batch (/query/batch e integraciones): cola para un lote completo y más espera
+ADMISSION_BATCH_QUEUE = int(os.getenv("ADMISSION_BATCH_QUEUE", "256"))
+ADMISSION_BATCH_MAX_WAIT_MS = float(os.getenv("ADMISSION_BATCH_MAX_WAIT_MS", "30000"))
+# Fracción de los lugares que puede ocupar el carril batch
+ADMISSION_BATCH_MAX_SHARE = float(os.getenv("ADMISSION_BATCH_MAX_SHARE", "0.75"))
+# Caracteres del chunk más relevante en la respuesta degradada (sin LLM)
+DEGRADED_ANSWER_CHARS = int(os.getenv("DEGRADED_ANSWER_CHARS", "800"))
+
+# --------- Ingesta masiva (/generate-embeddings sin document_id) ---------
+
+# Procesos para el chunking en paralelo
+INGEST_CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", str(os.cpu_count() or 1)))
+# Por debajo de este tamaño total el chunking se hace en el mismo proceso
+INGEST_PROCESS_POOL_MIN_CHARS = int(os.getenv("INGEST_PROCESS_POOL_MIN_CHARS", "500000"))
+# Lotes de embed simultáneos contra Cohere
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+# Reintentos ante rate limit / errores 5xx
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+INGEST_BACKOFF_BASE_SECONDS = float(os.getenv("INGEST_BACKOFF_BASE_SECONDS", "1.0"))
+# Chunks acumulados por cada escritura del writer en el vector store
+INGEST_WRITE_BATCH = int(os.getenv("INGEST_WRITE_BATCH", "512"))
+
+# --------- Extracción de PDFs ---------
+
+# Procesos para extraer rangos de páginas en paralelo (1 = en el proceso actual)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "8"))
+
+# --------- Datos de la aplicación ---------
+
+# Carpeta para PDFs subidos, estado de jobs y documentos (relativa al backend)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")
+
+# --------- Almacenamiento de documentos ---------
+
+# Catálogo (metadatos) en SQLite y textos comprimidos con zlib, uno por archivo
+DOCUMENTS_DB_PATH = os.path.join(DATA_DIR, "documents.sqlite3")
+DOCUMENTS_DIR = os.path.join(DATA_DIR, "documents")
+DOCUMENTS_COMPRESSION_LEVEL = int(os.getenv("DOCUMENTS_COMPRESSION_LEVEL", "6"))
+
+# --------- Jobs de ingesta en segundo plano ---------
+
+JOBS_DB_PATH = os.path.join(DATA_DIR, "jobs.sqlite3")
+# Jobs de extracción + chunking + embed ejecutados en paralelo
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# --------- Métricas ---------
+
+# Últimas observaciones por etapa usadas para p50/p95/p99 en /status
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+# --------- Arranque ---------
+
+# background: atiende de inmediato e inicializa en segundo plano
+# lazy: inicializa en el primer request | eager: espera a tener todo listo
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background").lower()
+STARTUP_MODES = ("background", "lazy", "eager")
+# Carga el índice vectorial en memoria al arrancar
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# --------- Armado del contexto para el LLM ---------
+
+# Tope de tokens del contexto enviado al chat (0 = sin límite)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Estimación de tokens sin tokenizer: caracteres por token
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+# Une chunks consecutivos del mismo documento quitando el texto solapado
+CONTEXT_MERGE_ADJACENT = os.getenv("CONTEXT_MERGE_ADJACENT", "true").lower() in ("1", "true", "yes")
+
+# --------- Ruteo de intención ---------
+
+# Rutas de intención (filtro de retrieval + frases de ejemplo) en JSON:
+# agregar una ruta no requiere cambiar código
+INTENT_ROUTES_PATH = os.getenv("INTENT_ROUTES_PATH", "intent_routes.json")
+# Coseno mínimo con el centroide de la ruta y ventaja mínima sobre el siguiente
+# (valores por defecto; cada ruta puede definir los suyos)
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", "0.3"))
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.02"))
@@ -0,0 +1,149 @@
+import math
+from typing import Any, Dict, List, Tuple
+
+from chunking import CODIGO_CHUNK_OVERLAP, GUIAS_CHUNK_OVERLAP
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("CONTEXT")
+# ---------------------------------------------------------
+
+# El solapamiento entre chunks consecutivos nunca supera el chunk_overlap de los splitters
+MAX_OVERLAP = max(CODIGO_CHUNK_OVERLAP, GUIAS_CHUNK_OVERLAP)
+
+# Largo del prefijo con que se busca el solapamiento en el chunk anterior
+_PROBE = 32
+# Solapamientos más cortos que esto se consideran coincidencias
+_MIN_OVERLAP = 5
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def overlap_length(previous: str, following: str, max_overlap: int = MAX_OVERLAP) -> int:
+    """
+    Largo del sufijo de previous que es prefijo de following (el texto que
+    el splitter repite entre dos chunks consecutivos). 0 si no se encuentra.
+    """
+    probe = following[:_PROBE]
+    if len(probe) == _PROBE:
+        pos = previous.find(probe, max(0, len(previous) - max_overlap))
+        while pos != -1:
+            if following.startswith(previous[pos:]):
+                return len(previous) - pos
+            pos = previous.find(probe, pos + 1)
+
+    # Solapamientos cortos (p. ej. solo la última frase): comparación directa
+    for k in range(min(len(previous), len(following), _PROBE - 1), _MIN_OVERLAP - 1, -1):
+        if previous.endswith(following[:k]):
+            return k
+    return 0
+
+
+def _passages(results: List[Dict[str, Any]], merge_adjacent: bool) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Agrupa los chunks de un mismo documento con chunk_index consecutivo en
+    un pasaje, sin repetir el texto solapado. Devuelve (pasajes, caracteres quitados).
+    """
+    removed = 0
+    seen = set()
+    by_doc: Dict[Any, List[Dict[str, Any]]] = {}
+    for r in results:
+        if r["chunk_id"] in seen:
+            continue
+        seen.add(r["chunk_id"])
+        by_doc.setdefault(r.get("document_id") or r["chunk_id"], []).append(r)
+
+    passages = []
+    for chunks in by_doc.values():
+        chunks.sort(key=lambda r: r.get("chunk_index") if r.get("chunk_index") is not None else -1)
+        current = None
+        for r in chunks:
+            index = r.get("chunk_index")
+            adjacent = (
+                merge_adjacent and current is not None and index is not None
+                and current["last_index"] is not None and index == current["last_index"] + 1
+            )
+            if adjacent:
+                overlap = overlap_length(current["text"], r["full_chunk"])
+                removed += overlap
+                joiner = "" if overlap else "\n"
+                current["text"] += joiner + r["full_chunk"][overlap:]
+                current["last_index"] = index
+                current["score"] = max(current["score"], r["similarity_score"])
+                current["chunk_ids"].append(r["chunk_id"])
+            else:
+                current = {
+                    "text": r["full_chunk"],
+                    "last_index": index,
+                    "score": r["similarity_score"],
+                    "chunk_ids": [r["chunk_id"]],
+                }
+                passages.append(current)
+    return passages, removed
+
+
+def _trim(text: str, max_chars: int) -> str:
+    """
+    Recorta al último fin de oración (o espacio) antes de max_chars.
+    """
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    for sep in ("\n", ". "):
+        pos = cut.rfind(sep)
+        if pos >= max_chars // 2:
+            return cut[:pos + len(sep)].rstrip()
+    pos = cut.rfind(" ")
+    return cut[:pos] if pos > 0 else cut
+
+
+def assemble_context(results: List[Dict[str, Any]], token_budget: int = 0,
+                     chars_per_token: float = 4.0, merge_adjacent: bool = True) -> Tuple[str, Dict[str, Any]]:
+    """
+    Arma el texto de contexto para el prompt a partir de los chunks recuperados:
+    1. une chunks consecutivos del mismo documento y quita el solapamiento
+    2. ordena los pasajes por la mejor similitud de sus chunks
+    3. agrega pasajes hasta token_budget (0 = sin límite); el que no entra
+       completo se recorta si queda espacio razonable
+    Los tokens se estiman como caracteres / chars_per_token.
+    Devuelve (contexto, estadísticas).
+    """
+    raw_chars = sum(len(r["full_chunk"]) for r in results)
+    passages, overlap_removed = _passages(results, merge_adjacent)
+    passages.sort(key=lambda p: p["score"], reverse=True)
+
+    budget_chars = int(token_budget * chars_per_token) if token_budget > 0 else None
+    parts: List[str] = []
+    used = 0
+    dropped = 0
+    for passage in passages:
+        text = passage["text"]
+        if budget_chars is not None:
+            remaining = budget_chars - used - (2 if parts else 0)
+            if len(text) > remaining:
+                # Un pasaje recortado a menos de un cuarto del presupuesto no aporta
+                if remaining < budget_chars // 4 and parts:
+                    dropped += 1
+                    continue
+                text = _trim(text, max(remaining, 0))
+                if not text:
+                    dropped += 1
+                    continue
+        parts.append(text)
+        used += len(text) + (2 if len(parts) > 1 else 0)
+
+    context = "\n\n".join(parts)
+    stats = {
+        "chunks": len(results),
+        "passages": len(passages),
+        "passages_used": len(parts),
+        "passages_dropped": dropped,
+        "raw_chars": raw_chars,
+        "chars": len(context),
+        "overlap_chars_removed": overlap_removed,
+        "tokens_est": estimate_tokens(context, chars_per_token),
+    }
+    logger.info(f"[CONTEXT] {stats}")
+    return context, stats
@@ -0,0 +1,43 @@
+from typing import List
+
+import numpy as np
+
+
+def mmr_select(relevance: np.ndarray, embeddings: np.ndarray, k: int, lambda_: float) -> List[int]:
+    """
+    Maximal marginal relevance sobre un pool de candidatos: devuelve los
+    índices elegidos en orden. En cada paso gana el candidato con mayor
+    λ·relevancia − (1 − λ)·(similitud máxima con los ya elegidos).
+
+    La relevancia se reescala a [0, 1] (min-max) para que λ signifique lo
+    mismo con cosenos, puntajes RRF o BM25; la redundancia es el coseno
+    entre embeddings. La matriz de similitud del pool se calcula una sola
+    vez (E @ Eᵀ) y la similitud máxima se actualiza con un np.maximum por
+    paso: k pasos vectorizados, sin recorrer pares en Python.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if lambda_ >= 1.0 or k == n:
+        return np.argsort(-np.asarray(relevance, dtype=np.float32), kind="stable")[:k].tolist()
+
+    rel = np.asarray(relevance, dtype=np.float32)
+    span = float(rel.max() - rel.min())
+    rel = (rel - rel.min()) / span if span > 0 else np.ones(n, dtype=np.float32)
+
+    E = np.asarray(embeddings, dtype=np.float32)
+    E = E / np.maximum(np.linalg.norm(E, axis=1, keepdims=True), 1e-12)
+    sims = E @ E.T
+
+    max_sim = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked: List[int] = []
+    for _ in range(k):
+        scores = lambda_ * rel - (1.0 - lambda_) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(max_sim, sims[best], out=max_sim)
+    return picked
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("EMBED_CACHE")
+# ---------------------------------------------------------
+
+
+def normalizar_para_cache(texto: str) -> str:
+    """
+    Normalización usada solo para la clave de cache:
+    unicode NFC + colapso de espacios. El texto enviado a Cohere no se modifica.
+    """
+    texto = unicodedata.normalize("NFC", texto)
+    return " ".join(texto.split())
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings direccionada por contenido, en dos niveles:
+    - Memoria: LRU acotado (OrderedDict)
+    - Disco: SQLite con vectores float32 serializados, acotado por cantidad
+      de entradas y desalojo por último acceso.
+
+    La clave es sha256(modelo, input_type, texto normalizado).
+    """
+
+    def __init__(self, path: str, max_memory_items: int = 2048, max_disk_items: int = 50000):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                input_type TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+        self._disk_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        logger.info(f"[EMBED_CACHE] Cache abierta en {path} | entradas en disco={self._disk_count}")
+
+    # --------- Claves ---------
+
+    @staticmethod
+    def make_key(model: str, input_type: str, text: str) -> str:
+        raw = f"{model}\x1f{input_type}\x1f{normalizar_para_cache(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --------- Lectura ---------
+
+    def get_many(self, model: str, input_type: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Devuelve un vector por texto (None si no está en cache).
+        Primero consulta memoria y luego disco para los faltantes.
+        """
+        keys = [self.make_key(model, input_type, t) for t in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        with self._lock:
+            pending: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vec
+                    self.memory_hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+
+            if pending:
+                rows = self._fetch_from_disk(list(pending.keys()))
+                now = time.time()
+                for key, dim, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32, count=dim)
+                    self._remember(key, vec)
+                    for i in pending.pop(key):
+                        found[i] = vec
+                        self.disk_hits += 1
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(now, key) for key, _, _ in rows],
+                    )
+                    self._conn.commit()
+
+                self.misses += sum(len(idx) for idx in pending.values())
+
+        return found
+
+    def _fetch_from_disk(self, keys: List[str]):
+        rows = []
+        # SQLite limita la cantidad de parámetros por sentencia
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows.extend(
+                self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part,
+                ).fetchall()
+            )
+        return rows
+
+    # --------- Escritura ---------
+
+    def put_many(self, model: str, input_type: str, texts: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        now = time.time()
+        rows = []
+
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                key = self.make_key(model, input_type, text)
+                vec = np.ascontiguousarray(vec)
+                self._remember(key, vec)
+                rows.append((key, model, input_type, int(vec.shape[0]), vec.tobytes(), now))
+
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, input_type, dim, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._disk_count += self._conn.total_changes - before
+            self._evict_disk()
+            self._conn.commit()
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        overflow = self._disk_count - self.max_disk_items
+        if overflow <= 0:
+            return
+
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (overflow,),
+        )
+        self._disk_count -= overflow
+        self.evictions += overflow
+        logger.info(f"[EMBED_CACHE] Desalojadas {overflow} entradas de disco")
+
+    # --------- Métricas ---------
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_items": len(self._memory),
+                "disk_items": self._disk_count,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,92 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import pdfplumber
+
+from config import EXTRACT_WORKERS, EXTRACT_PAGES_PER_TASK
+from metrics import metrics
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("EXTRACTION")
+# ---------------------------------------------------------
+
+# Los pools se crean desde hilos (uvicorn, JobManager): fork copiaría locks tomados
+# por otros hilos. forkserver (o spawn en Windows) arranca workers limpios que solo
+# importan el módulo de la función (extraction, storage, chunking; sin clientes externos)
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    """
+    Worker: extrae el texto de las páginas [start, end) de un PDF.
+    """
+    with pdfplumber.open(path) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def count_pages(source) -> int:
+    with pdfplumber.open(source) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(source, workers: Optional[int] = None,
+                   pages_per_task: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Genera (número de página desde 1, texto) en orden.
+
+    Con una ruta y suficientes páginas, los rangos de páginas se extraen en
+    un pool de procesos y se entregan a medida que terminan (en orden), de
+    modo que el chunking puede empezar antes de que termine la extracción.
+    Con un archivo abierto o PDFs chicos se extrae en el proceso actual.
+    El tiempo de extracción (sin el del consumidor) se registra en la etapa "extract".
+    """
+    return metrics.timed_iter("extract", _iter_pages(source, workers, pages_per_task))
+
+
+def _iter_pages(source, workers: Optional[int], pages_per_task: Optional[int]) -> Iterator[Tuple[int, str]]:
+    workers = EXTRACT_WORKERS if workers is None else workers
+    pages_per_task = pages_per_task or EXTRACT_PAGES_PER_TASK
+
+    if not isinstance(source, str):
+        with pdfplumber.open(source) as pdf:
+            for i, page in enumerate(pdf.pages):
+                yield i + 1, page.extract_text() or ""
+        return
+
+    n_pages = count_pages(source)
+    ranges = [(start, min(start + pages_per_task, n_pages)) for start in range(0, n_pages, pages_per_task)]
+    workers = min(workers, len(ranges))
+
+    if workers <= 1:
+        for start, end in ranges:
+            for offset, text in enumerate(_extract_page_range(source, start, end)):
+                yield start + offset + 1, text
+        return
+
+    logger.info(f"[EXTRACTION] {n_pages} páginas en {len(ranges)} rangos | {workers} procesos")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as pool:
+        futures = [pool.submit(_extract_page_range, source, start, end) for start, end in ranges]
+        for (start, _), future in zip(ranges, futures):
+            for offset, text in enumerate(future.result()):
+                yield start + offset + 1, text
+
+
+def extract_pdf_pages(source, workers: Optional[int] = None) -> List[str]:
+    """
+    Texto de cada página del PDF (índice 0 = página 1).
+    """
+    pages = [text for _, text in iter_pdf_pages(source, workers)]
+    logger.info(f"[EXTRACTION] Texto extraído: {len(pages)} páginas, {sum(len(p) for p in pages)} caracteres")
+    return pages
+
+
+def extract_pdf_text(source, workers: Optional[int] = None) -> str:
+    """
+    Extrae el texto de todas las páginas de un PDF.
+    source puede ser una ruta o un archivo abierto en modo binario.
+    """
+    return "\n".join(extract_pdf_pages(source, workers)) + "\n"
@@ -0,0 +1,312 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import rag_ppal
+from cohere_client import is_retryable, retry_delay
+from chunking import chunk_document_pages, chunk_document_pages_timed
+from extraction import MP_CONTEXT
+from metrics import metrics
+from storage import StoredDocument, chunk_stored_document
+from config import (
+    INGEST_CHUNK_WORKERS, INGEST_PROCESS_POOL_MIN_CHARS, INGEST_EMBED_CONCURRENCY,
+    INGEST_MAX_RETRIES, INGEST_BACKOFF_BASE_SECONDS, INGEST_WRITE_BATCH,
+)
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("INGEST")
+# ---------------------------------------------------------
+
+_SENTINEL = None
+
+
+
+class IngestStats:
+    """
+    Contadores por etapa del pipeline (chunking → embed → escritura).
+    Se actualizan desde varios hilos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+
+        self.documents = 0
+        self.chunks = 0
+        self.chunking_seconds = 0.0
+
+        self.batches = 0
+        self.embedded_chunks = 0
+        self.embed_busy_seconds = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.retries = 0
+
+        self.reindex: Dict[str, int] = {}
+
+        self.add_calls = 0
+        self.written_chunks = 0
+        self.write_seconds = 0.0
+
+    def batch_started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def batch_finished(self, n_chunks: int, seconds: float, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if ok:
+                self.batches += 1
+                self.embedded_chunks += n_chunks
+                self.embed_busy_seconds += seconds
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def add_reindex(self, doc_report: Dict[str, int]):
+        for key, value in doc_report.items():
+            self.reindex[key] = self.reindex.get(key, 0) + value
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+
+        def rate(n, seconds):
+            return round(n / seconds, 1) if seconds > 0 else 0.0
+
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": rate(self.written_chunks, elapsed),
+            "stages": {
+                "chunking": {
+                    "chunks": self.chunks,
+                    "seconds": round(self.chunking_seconds, 3),
+                    "chunks_per_second": rate(self.chunks, self.chunking_seconds),
+                },
+                "embedding": {
+                    "batches": self.batches,
+                    "chunks": self.embedded_chunks,
+                    "busy_seconds": round(self.embed_busy_seconds, 3),
+                    "chunks_per_second": rate(self.embedded_chunks, elapsed),
+                    "max_batches_in_flight": self.max_in_flight,
+                    "retries": self.retries,
+                },
+                "writing": {
+                    "add_calls": self.add_calls,
+                    "chunks": self.written_chunks,
+                    "seconds": round(self.write_seconds, 3),
+                    "chunks_per_second": rate(self.written_chunks, self.write_seconds),
+                },
+            },
+            "reindex": self.reindex,
+        }
+
+
+# --------- Etapa 1: chunking ---------
+
+def _chunk_all(docs: List[dict], stats: IngestStats) -> Iterator[Tuple[dict, Tuple[List[str], List[Tuple[int, int]]]]]:
+    """
+    Genera (documento, (chunks, páginas)) a medida que cada documento termina de dividirse.
+    Con corpus grandes el chunking corre en un pool de procesos; con corpus
+    chicos el costo de levantar procesos no se justifica.
+    """
+    t0 = time.perf_counter()
+    total_chars = sum(d.get("content_chars") or len(d["content"]) for d in docs)
+    workers = min(INGEST_CHUNK_WORKERS, len(docs))
+
+    if workers > 1 and total_chars >= INGEST_PROCESS_POOL_MIN_CHARS:
+        logger.info(f"[INGEST] Chunking en {workers} procesos ({total_chars} caracteres)")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as pool:
+            futures = {_submit_chunking(pool, d): d for d in docs}
+            for future in as_completed(futures):
+                chunks, pages, busy = future.result()
+                # El metrics del worker no es el del servicio: el tiempo se registra acá
+                metrics.observe("chunk", busy)
+                stats.chunking_seconds = time.perf_counter() - t0
+                yield futures[future], (chunks, pages)
+    else:
+        for doc in docs:
+            result = chunk_document_pages(doc["content"], doc["title"])
+            stats.chunking_seconds = time.perf_counter() - t0
+            yield doc, result
+
+
+def _submit_chunking(pool: ProcessPoolExecutor, doc: dict):
+    # Los documentos del catálogo viajan como ruta: el worker lee el blob y el
+    # texto nunca pasa por el proceso principal
+    if isinstance(doc, StoredDocument):
+        return pool.submit(chunk_stored_document, doc.path, doc["title"])
+    return pool.submit(chunk_document_pages_timed, doc["content"], doc["title"])
+
+
+# --------- Etapa 2: embeddings con reintentos ---------
+
+def embed_with_retry(texts: List[str], stats: Optional[IngestStats] = None) -> np.ndarray:
+    """
+    embed_texts con backoff exponencial por encima de los reintentos cortos
+    de cohere_client: un lote de ingesta tolera esperar más que una consulta
+    (rate limit sostenido, circuit breaker abierto). Respeta Retry-After.
+    """
+    for attempt in range(INGEST_MAX_RETRIES + 1):
+        try:
+            return rag_ppal.embed_texts(texts, input_type="search_document")
+        except Exception as e:
+            if not is_retryable(e) or attempt == INGEST_MAX_RETRIES:
+                raise
+
+            delay = retry_delay(e, attempt, INGEST_BACKOFF_BASE_SECONDS)
+            if stats:
+                stats.add_retry()
+            logger.warning(
+                f"[INGEST] Error transitorio en embed ({type(e).__name__}). "
+                f"Reintento {attempt + 1}/{INGEST_MAX_RETRIES} en {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+def _embed_stage(batch: List[str], ids: List[str], metadatas: List[dict],
+                 write_q: "queue.Queue", stats: IngestStats, slots: threading.BoundedSemaphore):
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        embeddings = embed_with_retry(batch, stats)
+        write_q.put((ids, batch, embeddings, metadatas))
+        ok = True
+    finally:
+        stats.batch_finished(len(batch), time.perf_counter() - t0, ok)
+        slots.release()
+
+
+# --------- Etapa 3: escritura en el vector store ---------
+
+class _Writer(threading.Thread):
+    """
+    Drena la cola de lotes embebidos y los escribe en el vector store con
+    escrituras grandes (INGEST_WRITE_BATCH chunks por llamada).
+    """
+
+    def __init__(self, write_q: "queue.Queue", stats: IngestStats):
+        super().__init__(name="ingest-writer", daemon=True)
+        self.write_q = write_q
+        self.stats = stats
+        self.error: Optional[BaseException] = None
+        self._buffer: List[tuple] = []
+        self._buffered = 0
+
+    def run(self):
+        try:
+            while True:
+                item = self.write_q.get()
+                if item is _SENTINEL:
+                    self._flush()
+                    return
+
+                self._buffer.append(item)
+                self._buffered += len(item[0])
+                if self._buffered >= INGEST_WRITE_BATCH:
+                    self._flush()
+        except BaseException as e:
+            self.error = e
+            logger.error("[INGEST] Error escribiendo en el vector store", exc_info=True)
+            # Seguir drenando para no bloquear a los productores
+            while self.write_q.get() is not _SENTINEL:
+                pass
+
+    def _flush(self):
+        if not self._buffer:
+            return
+
+        ids = [i for item in self._buffer for i in item[0]]
+        documents = [d for item in self._buffer for d in item[1]]
+        embeddings = np.vstack([item[2] for item in self._buffer])
+        metadatas = [m for item in self._buffer for m in item[3]]
+
+        t0 = time.perf_counter()
+        rag_ppal.store_chunks(ids, documents, embeddings, metadatas)
+        self.stats.write_seconds += time.perf_counter() - t0
+        self.stats.add_calls += 1
+        self.stats.written_chunks += len(ids)
+
+        logger.info(f"[INGEST] Escritura de {len(ids)} chunks")
+        self._buffer = []
+        self._buffered = 0
+
+
+# --------- Pipeline completo ---------
+
+def ingest_documents(docs: List[dict]) -> Tuple[Dict[str, Dict[str, List[str]]], Dict[str, Any]]:
+    """
+    Ingesta en pipeline de varios documentos:
+    chunking (pool de procesos) → embed (lotes concurrentes acotados, con
+    reintentos) → writer dedicado que agrupa escrituras en el vector store.
+    Las etapas se solapan: mientras un lote se escribe, otros se embeben.
+    Solo se embeben los chunks nuevos o modificados (ver rag_ppal.plan_reindex);
+    las actualizaciones de metadatos y borrados se aplican al final.
+
+    Devuelve ({doc_id: {"chunks": [...], "embedding_ids": [...]}}, reporte).
+    """
+    stats = IngestStats()
+    per_doc: Dict[str, Dict[str, List[str]]] = {}
+
+    # Cola acotada: si el vector store se atrasa, el embed espera (backpressure)
+    write_q: "queue.Queue" = queue.Queue(maxsize=INGEST_EMBED_CONCURRENCY * 2)
+    writer = _Writer(write_q, stats)
+    writer.start()
+
+    slots = threading.BoundedSemaphore(INGEST_EMBED_CONCURRENCY)
+    futures = []
+    plans = []
+
+    try:
+        with ThreadPoolExecutor(max_workers=INGEST_EMBED_CONCURRENCY, thread_name_prefix="ingest-embed") as embed_pool:
+            for doc, (chunks, pages) in _chunk_all(docs, stats):
+                stats.documents += 1
+                stats.chunks += len(chunks)
+                logger.info(f"[INGEST] Documento {doc['id']} - '{doc['title']}' dividido en {len(chunks)} chunks")
+
+                plan = rag_ppal.plan_reindex(doc["id"], doc["title"], chunks, pages)
+                plans.append((plan, chunks))
+                to_add = plan["to_add"]
+
+                for start in range(0, len(to_add), rag_ppal.MAX_BATCH):
+                    positions = to_add[start:start + rag_ppal.MAX_BATCH]
+                    batch = [chunks[i] for i in positions]
+                    ids = [plan["ids"][i] for i in positions]
+                    metadatas = [plan["metadatas"][i] for i in positions]
+
+                    # Concurrencia acotada: no se encolan más lotes que los que pueden estar en vuelo
+                    slots.acquire()
+                    stats.batch_started()
+                    futures.append(embed_pool.submit(_embed_stage, batch, ids, metadatas, write_q, stats, slots))
+
+                per_doc[doc["id"]] = {"chunks": chunks, "embedding_ids": plan["ids"]}
+
+            for future in futures:
+                future.result()
+    finally:
+        write_q.put(_SENTINEL)
+        writer.join()
+
+    if writer.error:
+        raise writer.error
+
+    for plan, chunks in plans:
+        rag_ppal.finalize_reindex(plan)
+        stats.add_reindex(rag_ppal.reindex_report(plan, chunks))
+
+    report = stats.report()
+    logger.info(
+        f"[INGEST] Ingesta completa | docs={report['documents']} | chunks={report['chunks']} | "
+        f"{report['chunks_per_second']} chunks/s | max lotes en vuelo="
+        f"{report['stages']['embedding']['max_batches_in_flight']} | reintentos={report['stages']['embedding']['retries']} | "
+        f"sin cambios={report['reindex'].get('unchanged', 0)}"
+    )
+    return per_doc, report
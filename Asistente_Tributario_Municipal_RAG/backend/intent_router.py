@@ -0,0 +1,257 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("INTENT")
+# ---------------------------------------------------------
+
+# Campos de metadata por los que se agrupan los chunks: un centroide por combinación
+GROUP_FIELDS = ("tipo_documento", "tramite")
+
+GroupKey = Tuple[str, ...]
+
+
+def _group_key(metadata: Dict[str, Any]) -> GroupKey:
+    return tuple(str(metadata.get(field) or "") for field in GROUP_FIELDS)
+
+
+def _matches(where: Dict[str, Any], key: GroupKey) -> bool:
+    return all(key[GROUP_FIELDS.index(field)] == str(value) for field, value in where.items())
+
+
+def _unit(vec: np.ndarray) -> Optional[np.ndarray]:
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else None
+
+
+def load_routes(path: str) -> List[Dict[str, Any]]:
+    """
+    Lee las rutas de intención de un JSON:
+
+        {"routes": [{"name": "nota",
+                     "where": {"tipo_documento": "protocolo_reclamo"},
+                     "examples": ["cómo hago la nota", ...],
+                     "min_score": 0.3, "min_margin": 0.02}]}
+
+    - where: filtro que se aplica al retrieval cuando la consulta cae en la
+      ruta; solo puede usar campos de GROUP_FIELDS.
+    - examples, min_score, min_margin y description son opcionales.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    routes = []
+    for raw in data.get("routes", []):
+        name = raw.get("name")
+        where = raw.get("where") or {}
+        if not name or not where:
+            raise ValueError(f"Ruta de intención sin name o where: {raw}")
+        unknown = set(where) - set(GROUP_FIELDS)
+        if unknown:
+            raise ValueError(f"Ruta '{name}': where solo admite {GROUP_FIELDS}, no {sorted(unknown)}")
+        if any(r["name"] == name for r in routes):
+            raise ValueError(f"Ruta de intención duplicada: '{name}'")
+        routes.append({
+            "name": name,
+            "description": raw.get("description", ""),
+            "where": dict(where),
+            "examples": list(raw.get("examples", [])),
+            "min_score": raw.get("min_score"),
+            "min_margin": raw.get("min_margin"),
+        })
+    return routes
+
+
+class IntentRouter:
+    """
+    Clasifica la intención de una consulta a partir de su embedding, sin
+    recorrer listas de palabras clave.
+
+    - Cada combinación tipo_documento/tramite del índice tiene un centroide
+      (suma de los embeddings de sus chunks) que se mantiene al agregar o
+      borrar chunks.
+    - Una ruta se representa con el centroide de los grupos que cumplen su
+      where, sumado al promedio de sus frases de ejemplo (embebidas como
+      consultas). Los grupos que no cubre ninguna ruta compiten como "sin ruta".
+    - classify hace un único producto matriz-vector (centroides @ consulta):
+      gana la fila con mayor coseno si es una ruta, supera min_score y le
+      saca min_margin a la siguiente.
+    La matriz de centroides se rearma solo cuando cambiaron los chunks o las rutas.
+    """
+
+    def __init__(self, routes: List[Dict[str, Any]],
+                 embed_examples: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 min_score: float = 0.3, min_margin: float = 0.02):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self._embed_examples = embed_examples
+
+        self._lock = threading.RLock()
+        self._sums: Dict[GroupKey, np.ndarray] = {}
+        self._counts: Dict[GroupKey, int] = {}
+        self._members: Dict[str, GroupKey] = {}
+
+        self._routes: List[Dict[str, Any]] = []
+        self._example_vectors: Dict[str, np.ndarray] = {}
+        # (rutas por fila, o None si la fila es un grupo sin ruta; matriz de centroides)
+        self._labels: List[Optional[Dict[str, Any]]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._dirty = True
+
+        self.set_routes(routes)
+
+    # --------- Rutas ---------
+
+    def set_routes(self, routes: List[Dict[str, Any]]):
+        """
+        Reemplaza las rutas (p. ej. tras editar el JSON). Las frases de ejemplo
+        se embeben acá; si falla, la ruta queda representada solo por sus chunks.
+        """
+        vectors: Dict[str, np.ndarray] = {}
+        for route in routes:
+            if not route["examples"] or self._embed_examples is None:
+                continue
+            try:
+                embs = np.asarray(self._embed_examples(route["examples"]), dtype=np.float32)
+            except Exception as e:
+                logger.warning(f"[INTENT] No se pudieron embeber los ejemplos de '{route['name']}': {e}")
+                continue
+            rows = [v for v in (_unit(e) for e in embs) if v is not None]
+            mean = _unit(np.mean(rows, axis=0)) if rows else None
+            if mean is not None:
+                vectors[route["name"]] = mean
+
+        with self._lock:
+            self._routes = list(routes)
+            self._example_vectors = vectors
+            self._dirty = True
+        logger.info(f"[INTENT] {len(routes)} rutas cargadas: {[r['name'] for r in routes]}")
+
+    # --------- Mantenimiento de centroides ---------
+
+    def add(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]]):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            for chunk_id, emb, meta in zip(ids, embeddings, metadatas):
+                if chunk_id in self._members:
+                    continue
+                unit = _unit(emb)
+                if unit is None:
+                    continue
+                key = _group_key(meta)
+                if key in self._sums:
+                    self._sums[key] += unit
+                else:
+                    self._sums[key] = unit.astype(np.float32, copy=True)
+                self._counts[key] = self._counts.get(key, 0) + 1
+                self._members[chunk_id] = key
+            self._dirty = True
+
+    def remove(self, ids: List[str], embeddings: np.ndarray):
+        """
+        embeddings: los vectores guardados de esos chunks (para restarlos del centroide).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            for chunk_id, emb in zip(ids, embeddings):
+                key = self._members.pop(chunk_id, None)
+                unit = _unit(emb)
+                if key is None or unit is None:
+                    continue
+                self._counts[key] -= 1
+                if self._counts[key] <= 0:
+                    del self._counts[key]
+                    del self._sums[key]
+                else:
+                    self._sums[key] -= unit
+            self._dirty = True
+
+    def _rebuild_locked(self):
+        labels: List[Optional[Dict[str, Any]]] = []
+        rows: List[np.ndarray] = []
+        covered = set()
+
+        for route in self._routes:
+            keys = [k for k in self._sums if _matches(route["where"], k)]
+            covered.update(keys)
+            parts = []
+            if keys:
+                parts.append(_unit(np.sum([self._sums[k] for k in keys], axis=0)))
+            if route["name"] in self._example_vectors:
+                parts.append(self._example_vectors[route["name"]])
+            centroid = _unit(np.sum([p for p in parts if p is not None], axis=0)) if parts else None
+            if centroid is None:
+                logger.warning(f"[INTENT] La ruta '{route['name']}' no tiene chunks indexados ni ejemplos")
+                continue
+            labels.append(route)
+            rows.append(centroid)
+
+        for key, total in self._sums.items():
+            centroid = _unit(total)
+            if key not in covered and centroid is not None:
+                labels.append(None)
+                rows.append(centroid)
+
+        self._labels = labels
+        self._matrix = np.vstack(rows).astype(np.float32) if rows else None
+        self._dirty = False
+
+    # --------- Clasificación ---------
+
+    def classify(self, query_emb: np.ndarray) -> Dict[str, Any]:
+        """
+        Devuelve {route, where, score, margin}; route y where son None si la
+        consulta no cae claramente en ninguna ruta.
+        """
+        with self._lock:
+            if self._dirty:
+                self._rebuild_locked()
+            labels, matrix = self._labels, self._matrix
+
+        no_route = {"route": None, "where": None, "score": 0.0, "margin": 0.0}
+        q = _unit(np.asarray(query_emb, dtype=np.float32).ravel())
+        if matrix is None or q is None:
+            return no_route
+        if matrix.shape[1] != q.shape[0]:
+            logger.warning(f"[INTENT] Dimensión de consulta {q.shape[0]} distinta de la de los centroides {matrix.shape[1]}")
+            return no_route
+
+        scores = matrix @ q
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        margin = score - float(np.max(np.delete(scores, best))) if len(scores) > 1 else score
+        route = labels[best]
+        if route is None:
+            return {**no_route, "score": score, "margin": margin}
+
+        min_score = route["min_score"] if route["min_score"] is not None else self.min_score
+        min_margin = route["min_margin"] if route["min_margin"] is not None else self.min_margin
+        if score < min_score or margin < min_margin:
+            return {**no_route, "score": score, "margin": margin}
+        return {"route": route["name"], "where": dict(route["where"]), "score": score, "margin": margin}
+
+    # --------- Estado ---------
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"routes": len(self._routes), "groups": len(self._sums), "chunks": len(self._members)}
+
+    def describe(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            out = []
+            for route in self._routes:
+                keys = [k for k in self._counts if _matches(route["where"], k)]
+                out.append({
+                    "name": route["name"],
+                    "description": route["description"],
+                    "where": route["where"],
+                    "examples": len(route["examples"]),
+                    "chunks": sum(self._counts[k] for k in keys),
+                    "min_score": route["min_score"] if route["min_score"] is not None else self.min_score,
+                    "min_margin": route["min_margin"] if route["min_margin"] is not None else self.min_margin,
+                })
+            return out
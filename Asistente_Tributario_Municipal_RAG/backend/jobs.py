@@ -0,0 +1,325 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set
+from uuid import uuid4
+
+import rag_ppal
+from chunking import chunk_document_pages, iter_page_chunks
+from config import JOBS_DB_PATH, JOB_WORKERS, UPLOADS_DIR
+from extraction import iter_pdf_pages
+from ingestion import embed_with_retry
+from storage import save_document, get_document, set_document_embeddings, file_sha256
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("JOBS")
+# ---------------------------------------------------------
+
+# Etapas de un job: queued → extracting (incluye chunking) | chunking → embedding → done
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobManager:
+    """
+    Cola de jobs de ingesta ejecutados por un pool de workers.
+
+    - kind="upload": extracción del PDF + chunking + embeddings
+    - kind="embed": chunking + embeddings de un documento ya cargado
+
+    El estado se persiste en SQLite después de cada lote embebido. La
+    re-indexación es incremental por hash de chunk, así que al reiniciar el
+    servicio un job interrumpido solo embebe los chunks que faltan.
+
+    Hay un solo trabajo por documento a la vez: un job para un doc_id ocupado
+    (por otro job o por claim) queda en cola detrás y arranca al terminar el
+    anterior, en orden de llegada.
+    """
+
+    def __init__(self, db_path: str, workers: int = 2):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                file_path TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                total_chunks INTEGER NOT NULL DEFAULT 0,
+                chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                batches_done INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.commit()
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-worker")
+        # doc_ids con trabajo en curso y jobs esperando a que se liberen
+        self._busy: Set[str] = set()
+        self._waiting: Dict[str, Deque[str]] = {}
+
+    # --------- Encolado ---------
+
+    def submit_upload(self, doc_id: str, title: str, file_path: str) -> Dict[str, Any]:
+        return self._submit("upload", doc_id, title, file_path)
+
+    def submit_embedding(self, doc_id: str, title: str) -> Dict[str, Any]:
+        return self._submit("embed", doc_id, title, None)
+
+    def _submit(self, kind: str, doc_id: str, title: str, file_path: Optional[str]) -> Dict[str, Any]:
+        job_id = str(uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, document_id, title, file_path, status, stage, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', 'queued', ?)",
+                (job_id, kind, doc_id, title, file_path, time.time()),
+            )
+            self._conn.commit()
+
+        logger.info(f"[JOBS] Job {job_id} encolado ({kind}) para documento {doc_id}")
+        self._schedule(job_id, doc_id)
+        return self.get(job_id)
+
+    def resume_pending(self) -> int:
+        """
+        Re-encola los jobs que quedaron en cola o en ejecución al apagarse el servicio.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, document_id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                ACTIVE_STATUSES,
+            ).fetchall()
+
+        for row in rows:
+            logger.info(f"[JOBS] Reanudando job {row['id']}")
+            self._schedule(row["id"], row["document_id"])
+        return len(rows)
+
+    # --------- Un trabajo por documento ---------
+
+    def _schedule(self, job_id: str, doc_id: str):
+        with self._lock:
+            if doc_id in self._busy:
+                self._waiting.setdefault(doc_id, deque()).append(job_id)
+                logger.info(f"[JOBS] Job {job_id} espera a que termine el trabajo en curso de {doc_id}")
+                return
+            self._busy.add(doc_id)
+        self._pool.submit(self._run_serialized, job_id, doc_id)
+
+    def _run_serialized(self, job_id: str, doc_id: str):
+        try:
+            self._run(job_id)
+        finally:
+            self._release(doc_id)
+
+    def _release(self, doc_id: str):
+        # El documento sigue ocupado si hay otro job esperándolo: pasa directo al siguiente
+        with self._lock:
+            waiting = self._waiting.get(doc_id)
+            if not waiting:
+                self._busy.discard(doc_id)
+                return
+            job_id = waiting.popleft()
+            if not waiting:
+                del self._waiting[doc_id]
+        self._pool.submit(self._run_serialized, job_id, doc_id)
+
+    @contextmanager
+    def claim(self, doc_ids: List[str]) -> Iterator[List[str]]:
+        """
+        Reserva para un procesamiento fuera de la cola (embeddings sincrónicos)
+        los documentos sin trabajo en curso y devuelve cuáles obtuvo. Los jobs
+        que lleguen mientras tanto esperan a que termine el bloque.
+        """
+        with self._lock:
+            claimed = [d for d in dict.fromkeys(doc_ids) if d not in self._busy]
+            self._busy.update(claimed)
+        try:
+            yield claimed
+        finally:
+            for doc_id in claimed:
+                self._release(doc_id)
+
+    # --------- Consulta ---------
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_status(row) if row else None
+
+    def list(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [_to_status(r) for r in rows]
+
+    def active_document_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._busy)
+
+    def _update(self, job_id: str, **fields):
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    # --------- Ejecución ---------
+
+    def _run(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["status"] not in ACTIVE_STATUSES:
+            return
+
+        started_at = row["started_at"] or time.time()
+        self._update(job_id, status="running", started_at=started_at, finished_at=None)
+
+        try:
+            self._execute(row)
+        except Exception as e:
+            logger.error(f"[JOBS] Job {job_id} falló", exc_info=True)
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+            return
+
+        self._update(job_id, status="completed", stage="done", finished_at=time.time())
+        logger.info(f"[JOBS] Job {job_id} completado")
+
+    def _execute(self, row: sqlite3.Row):
+        job_id = row["id"]
+        doc_id = row["document_id"]
+        title = row["title"]
+
+        # ---- Extracción ----
+        # Un upload con el mismo título reutiliza el doc_id: se vuelve a extraer
+        # si el documento guardado proviene de otro archivo (nueva versión)
+        doc = get_document(doc_id)
+        if doc is None and row["kind"] != "upload":
+            raise RuntimeError(f"Documento {doc_id} no disponible")
+
+        if row["kind"] == "upload" and (doc is None or doc.get("source_file") != row["file_path"]):
+            # ---- Extracción + chunking en streaming ----
+            # Las páginas llegan del pool de extracción y se van dividiendo en
+            # chunks; el texto completo nunca se concatena en memoria
+            self._update(job_id, stage="extracting")
+            page_texts: List[str] = []
+
+            def pages():
+                for page_no, text in iter_pdf_pages(row["file_path"]):
+                    page_texts.append(text)
+                    yield page_no, text
+
+            chunks: List[str] = []
+            pages_per_chunk = []
+            for chunk, page_start, page_end, heading_path in iter_page_chunks(pages(), title):
+                chunks.append(chunk)
+                pages_per_chunk.append((page_start, page_end, heading_path))
+
+            if not chunks:
+                raise ValueError("No se pudo extraer texto del PDF")
+
+            logger.info(f"[JOBS] Job {job_id}: {len(page_texts)} páginas → {len(chunks)} chunks")
+            save_document(doc_id, title, page_texts, source_file=row["file_path"],
+                          source_sha256=file_sha256(row["file_path"]))
+            if doc is not None:
+                _remove_replaced_upload(doc.get("source_file"), row["file_path"])
+        else:
+            # ---- Chunking ----
+            self._update(job_id, stage="chunking")
+            chunks, pages_per_chunk = chunk_document_pages(doc["content"], title)
+
+        self._update(job_id, total_chunks=len(chunks))
+
+        # ---- Embeddings por lote, solo de chunks nuevos o modificados ----
+        self._update(job_id, stage="embedding")
+        plan = rag_ppal.plan_reindex(doc_id, title, chunks, pages_per_chunk)
+        to_add = plan["to_add"]
+        chunks_embedded = len(chunks) - len(to_add)
+        batches_done = 0
+        self._update(job_id, chunks_embedded=chunks_embedded, batches_done=batches_done)
+        if chunks_embedded:
+            logger.info(f"[JOBS] Job {job_id}: {chunks_embedded} chunks sin cambios, {len(to_add)} por embeber")
+
+        for start in range(0, len(to_add), rag_ppal.MAX_BATCH):
+            positions = to_add[start:start + rag_ppal.MAX_BATCH]
+            batch = [chunks[i] for i in positions]
+            embeddings = embed_with_retry(batch)
+            rag_ppal.store_chunks(
+                [plan["ids"][i] for i in positions],
+                batch,
+                embeddings,
+                [plan["metadatas"][i] for i in positions],
+            )
+
+            batches_done += 1
+            chunks_embedded += len(batch)
+            self._update(job_id, batches_done=batches_done, chunks_embedded=chunks_embedded)
+
+        rag_ppal.finalize_reindex(plan)
+
+        set_document_embeddings(doc_id, plan["ids"])
+
+
+def _remove_replaced_upload(previous: Optional[str], current: str):
+    """
+    Borra el PDF subido de la versión anterior del documento: el guardado
+    ya apunta al nuevo. Solo toca archivos de UPLOADS_DIR.
+    """
+    if not previous or previous == current:
+        return
+    uploads = os.path.abspath(UPLOADS_DIR)
+    if os.path.dirname(os.path.abspath(previous)) != uploads:
+        return
+    try:
+        os.remove(previous)
+        logger.info(f"[JOBS] Upload anterior eliminado: {previous}")
+    except FileNotFoundError:
+        pass
+
+
+def _to_status(row: sqlite3.Row) -> Dict[str, Any]:
+    total = row["total_chunks"]
+    if row["status"] == "completed":
+        percent = 100.0
+    elif total:
+        percent = round(100.0 * row["chunks_embedded"] / total, 1)
+    else:
+        percent = 0.0
+
+    elapsed = 0.0
+    if row["started_at"]:
+        elapsed = (row["finished_at"] or time.time()) - row["started_at"]
+
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "document_id": row["document_id"],
+        "title": row["title"],
+        "status": row["status"],
+        "stage": row["stage"],
+        "percent_done": percent,
+        "total_chunks": total,
+        "chunks_embedded": row["chunks_embedded"],
+        "elapsed_seconds": round(elapsed, 3),
+        "error": row["error"],
+    }
+
+
+job_manager = JobManager(JOBS_DB_PATH, workers=JOB_WORKERS)
@@ -0,0 +1,238 @@
+import json
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import _where_items
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("LEXICAL")
+# ---------------------------------------------------------
+
+STOPWORDS = {
+    "a", "al", "ante", "con", "como", "cual", "de", "del", "desde", "donde", "el", "en",
+    "entre", "es", "esa", "ese", "eso", "esta", "este", "hay", "la", "las", "le", "les",
+    "lo", "los", "mas", "me", "mi", "mis", "muy", "o", "para", "pero", "por", "que",
+    "se", "si", "sin", "sobre", "su", "sus", "tengo", "un", "una", "uno", "y", "ya", "yo",
+}
+
+# Cuando las entradas borradas superan esta fracción se compactan los postings
+_COMPACT_RATIO = 0.25
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Minúsculas, sin acentos (cedulón → cedulon), tokens alfanuméricos,
+    sin stopwords. Se usa igual para indexar y para consultar.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]+", text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 en memoria sobre los mismos chunks que Chroma.
+
+    Cada término tiene dos array compactos (ids internos de documento y
+    frecuencias) que crecen con append; la consulta los convierte a numpy
+    sin copiar y acumula los scores de forma vectorizada.
+    Los borrados marcan el documento como inactivo y se compacta cuando
+    los inactivos superan _COMPACT_RATIO.
+    Los filtros where usan máscaras por (campo, valor) cacheadas, igual que
+    NumpyVectorStore, que se mantienen al agregar y actualizar metadatos.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_cached_masks: int = 256):
+        self.k1 = k1
+        self.b = b
+        self.max_cached_masks = max_cached_masks
+
+        self._lock = threading.RLock()
+        self._terms: Dict[str, int] = {}
+        self._postings_docs: List[array] = []
+        self._postings_tfs: List[array] = []
+
+        self._ids: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._position: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._alive = bytearray()
+
+        self._live = 0
+        self._live_length = 0
+
+        # (campo, valor en JSON) → un byte por documento interno
+        self._masks: Dict[Tuple[str, str], bytearray] = {}
+
+    def __len__(self) -> int:
+        return self._live
+
+    # --------- Escritura ---------
+
+    def add(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None):
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            self._remove_locked([i for i in ids if i in self._position])
+            filters = [(key, json.loads(value_json), mask) for (key, value_json), mask in self._masks.items()]
+
+            for chunk_id, text, meta in zip(ids, texts, metadatas):
+                doc = len(self._ids)
+                tokens = tokenize(text)
+
+                self._ids.append(chunk_id)
+                self._metadatas.append(dict(meta))
+                self._position[chunk_id] = doc
+                self._lengths.append(len(tokens))
+                self._alive.append(1)
+                self._live += 1
+                self._live_length += len(tokens)
+                for key, value, mask in filters:
+                    mask.append(meta.get(key) == value)
+
+                for term, tf in Counter(tokens).items():
+                    t = self._terms.get(term)
+                    if t is None:
+                        t = self._terms[term] = len(self._postings_docs)
+                        self._postings_docs.append(array("I"))
+                        self._postings_tfs.append(array("I"))
+                    self._postings_docs[t].append(doc)
+                    self._postings_tfs[t].append(tf)
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            self._remove_locked(ids)
+            if len(self._ids) and (len(self._ids) - self._live) / len(self._ids) > _COMPACT_RATIO:
+                self._compact()
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._lock:
+            for chunk_id, meta in zip(ids, metadatas):
+                doc = self._position.get(chunk_id)
+                if doc is not None:
+                    self._metadatas[doc] = dict(meta)
+                    for (key, value_json), mask in self._masks.items():
+                        mask[doc] = meta.get(key) == json.loads(value_json)
+
+    def _remove_locked(self, ids: List[str]):
+        for chunk_id in ids:
+            doc = self._position.pop(chunk_id, None)
+            if doc is None:
+                continue
+            self._alive[doc] = 0
+            self._live -= 1
+            self._live_length -= self._lengths[doc]
+
+    def _compact(self):
+        alive = np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive) - 1
+
+        terms: Dict[str, int] = {}
+        postings_docs: List[array] = []
+        postings_tfs: List[array] = []
+        for term, t in self._terms.items():
+            docs = np.frombuffer(self._postings_docs[t], dtype=np.uint32)
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            terms[term] = len(postings_docs)
+            postings_docs.append(array("I", remap[docs[keep]].astype(np.uint32).tobytes()))
+            postings_tfs.append(array("I", np.frombuffer(self._postings_tfs[t], dtype=np.uint32)[keep].tobytes()))
+
+        live_docs = np.flatnonzero(alive)
+        self._ids = [self._ids[d] for d in live_docs]
+        self._metadatas = [self._metadatas[d] for d in live_docs]
+        self._position = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+        self._lengths = array("I", np.frombuffer(self._lengths, dtype=np.uint32)[live_docs].tobytes())
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._terms, self._postings_docs, self._postings_tfs = terms, postings_docs, postings_tfs
+        self._masks = {
+            key: bytearray(np.frombuffer(mask, dtype=np.uint8)[live_docs].tobytes())
+            for key, mask in self._masks.items()
+        }
+
+        logger.info(f"[LEXICAL] Índice compactado: {len(self._ids)} chunks, {len(terms)} términos")
+
+    # --------- Filtros ---------
+
+    def _mask(self, key: str, value: Any) -> np.ndarray:
+        cache_key = (key, json.dumps(value))
+        mask = self._masks.get(cache_key)
+        if mask is None:
+            if len(self._masks) >= self.max_cached_masks:
+                self._masks.clear()
+            mask = self._masks[cache_key] = bytearray(m.get(key) == value for m in self._metadatas)
+        return np.frombuffer(mask, dtype=bool)
+
+    # --------- Consulta ---------
+
+    def search(self, query: str, n_results: int = 10,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Devuelve [(chunk_id, score BM25)] ordenado de mayor a menor.
+        where admite igualdad ($eq) y $and sobre metadatos, como los vector stores.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self._live or not terms:
+                return []
+
+            n_docs = len(self._ids)
+            alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+            for key, value in _where_items(where):
+                alive &= self._mask(key, value)
+
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            avgdl = self._live_length / self._live if self._live else 1.0
+            norm = self.k1 * (1 - self.b + self.b * lengths / max(avgdl, 1e-9))
+
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for term in terms:
+                t = self._terms.get(term)
+                if t is None:
+                    continue
+                docs = np.frombuffer(self._postings_docs[t], dtype=np.uint32)
+                tfs = np.frombuffer(self._postings_tfs[t], dtype=np.uint32).astype(np.float32)
+
+                live = alive[docs]
+                df = int(live.sum())
+                if df == 0:
+                    continue
+                docs, tfs = docs[live], tfs[live]
+
+                idf = math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+            k = min(n_results, int((scores > 0).sum()))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[d], float(scores[d])) for d in top]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "chunks": self._live,
+                "terms": len(self._terms),
+                "postings": sum(len(p) for p in self._postings_docs),
+                "avg_chunk_tokens": round(self._live_length / self._live, 1) if self._live else 0.0,
+            }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    RRF: score(d) = Σ 1 / (k + rango de d en cada ranking), rango desde 1.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("LIFECYCLE")
+# ---------------------------------------------------------
+
+PENDING, LOADING, READY, FAILED = "pending", "loading", "ready", "failed"
+
+
+class LazyComponent:
+    """
+    Componente que se construye en el primer uso (o al arrancar en segundo
+    plano) y se comporta como el objeto construido: los atributos se
+    delegan, así que `vector_store.query(...)` funciona sin cambios.
+
+    - El primer acceso bloquea hasta que el componente esté listo; varios
+      hilos que lo usan a la vez esperan una única construcción.
+    - Si la construcción falla queda en "failed" y el próximo acceso reintenta.
+    - Los métodos propios llevan "_" para no tapar los del objeto envuelto
+      (p. ej. vector_store.get); solo `ready` es público.
+    - warmup (opcional) recibe el objeto y lo deja en memoria.
+    - close (opcional) libera recursos al apagar.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any],
+                 warmup: Optional[Callable[[Any], None]] = None,
+                 close: Optional[Callable[[Any], Any]] = None):
+        self._name = name
+        self._factory = factory
+        self._warmup = warmup
+        self._close = close
+        self._lock = threading.Lock()
+        self._value: Any = None
+        self._state = PENDING
+        self._error: Optional[str] = None
+        self._init_ms: Optional[float] = None
+        self._warmup_ms: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state == READY
+
+    def _resolve(self) -> Any:
+        if self._state == READY:
+            return self._value
+        with self._lock:
+            if self._state != READY:
+                self._state = LOADING
+                t0 = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                except Exception as e:
+                    self._state = FAILED
+                    self._error = f"{type(e).__name__}: {e}"
+                    logger.error(f"[LIFECYCLE] Falló la inicialización de '{self._name}': {self._error}")
+                    raise
+                self._init_ms = round((time.perf_counter() - t0) * 1000, 2)
+                self._error = None
+                self._state = READY
+                logger.info(f"[LIFECYCLE] '{self._name}' listo en {self._init_ms} ms")
+        return self._value
+
+    def _run_warmup(self):
+        if self._warmup is None or self._warmup_ms is not None:
+            return
+        value = self._resolve()
+        t0 = time.perf_counter()
+        self._warmup(value)
+        self._warmup_ms = round((time.perf_counter() - t0) * 1000, 2)
+        logger.info(f"[LIFECYCLE] Warm-up de '{self._name}' en {self._warmup_ms} ms")
+
+    async def _aclose(self):
+        if self._close is None or self._state != READY:
+            return
+        result = self._close(self._value)
+        if asyncio.iscoroutine(result):
+            await result
+
+    def _status(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"state": self._state}
+        if self._init_ms is not None:
+            out["init_ms"] = self._init_ms
+        if self._warmup_ms is not None:
+            out["warmup_ms"] = self._warmup_ms
+        if self._error:
+            out["error"] = self._error
+        return out
+
+    # --------- Delegación al objeto construido ---------
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __len__(self) -> int:
+        return len(self._resolve())
+
+    def __repr__(self) -> str:
+        return f"<LazyComponent {self._name} {self._state}>"
+
+
+class Lifecycle:
+    """
+    Registro de componentes del proceso y del arranque de la aplicación.
+
+    Modos (STARTUP_MODE):
+    - background: el servidor atiende de inmediato y los componentes se
+      inicializan en un hilo; los requests que los necesitan esperan.
+    - lazy: cada componente se inicializa en el primer request que lo usa
+      (wait_components con los que declara el endpoint).
+    - eager: el arranque espera a que todo esté listo (comportamiento anterior).
+
+    Cada inicialización corre una sola vez en su propio hilo aunque la pidan
+    varios requests a la vez: todos esperan el mismo Future (ver _shared).
+    """
+
+    def __init__(self):
+        self.components: Dict[str, LazyComponent] = {}
+        self.mode: Optional[str] = None
+        self.import_ms: Optional[float] = None
+        self.startup_started: Optional[float] = None
+        self.ready_ms: Optional[float] = None
+        self._futures: Dict[str, Future] = {}
+        self._futures_lock = threading.Lock()
+        self._on_ready: List[Callable[[], None]] = []
+        self._ready_lock = threading.Lock()
+        self._ready_done = False
+        self._on_ready_done = False
+
+    def register(self, name: str, factory: Callable[[], Any],
+                 warmup: Optional[Callable[[Any], None]] = None,
+                 close: Optional[Callable[[Any], Any]] = None) -> LazyComponent:
+        component = LazyComponent(name, factory, warmup, close)
+        self.components[name] = component
+        return component
+
+    def on_ready(self, callback: Callable[[], None]):
+        """
+        Tarea a ejecutar una sola vez cuando todos los componentes están listos
+        (p. ej. reanudar jobs que usan el vector store).
+        """
+        self._on_ready.append(callback)
+
+    def mark_imported(self, started: float):
+        """
+        started: perf_counter() tomado al comenzar a importar la aplicación.
+        """
+        self.import_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"[LIFECYCLE] Módulos importados en {self.import_ms} ms")
+
+    @property
+    def ready(self) -> bool:
+        return self._ready_done
+
+    # --------- Inicialización ---------
+
+    def initialize_all(self, warmup: bool = False):
+        """
+        Inicializa (en orden de registro) todo lo pendiente; bloquea hasta
+        que esté listo. Es idempotente y seguro entre hilos.
+        """
+        for component in self.components.values():
+            component._resolve()
+        if warmup:
+            for component in self.components.values():
+                component._run_warmup()
+
+        with self._ready_lock:
+            if self._ready_done:
+                return
+            self._run_on_ready_locked()
+            self._ready_done = True
+            if self.startup_started is not None:
+                self.ready_ms = round((time.perf_counter() - self.startup_started) * 1000, 2)
+            logger.info(f"[LIFECYCLE] Servicio listo ({self.mode}) en {self.ready_ms} ms desde el arranque")
+
+    async def wait_ready(self, warmup: bool = False):
+        if not self._ready_done:
+            await asyncio.wrap_future(self._shared("startup", lambda: self.initialize_all(warmup)))
+
+    async def wait_components(self, names: Iterable[str]):
+        """
+        Espera sin bloquear el event loop solo los componentes indicados
+        (modo lazy); los que ya están listos no cuestan nada.
+        """
+        pending = [self.components[name] for name in names if not self.components[name].ready]
+        if pending:
+            await asyncio.gather(*(
+                asyncio.wrap_future(self._shared(c._name, c._resolve)) for c in pending
+            ))
+
+    def _shared(self, key: str, fn: Callable[[], Any]) -> Future:
+        """
+        Future de la ejecución de fn en un hilo propio. Mientras corre (o si
+        terminó bien) se devuelve el mismo Future; si falló, el próximo pedido
+        reintenta.
+        """
+        with self._futures_lock:
+            future = self._futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                return future
+            future = self._futures[key] = Future()
+            # En ejecución desde ya: cancelar la espera de un request no cancela la inicialización
+            future.set_running_or_notify_cancel()
+        threading.Thread(target=_run_into, args=(future, fn), name=f"init-{key}", daemon=True).start()
+        return future
+
+    async def start(self, mode: str, warmup: bool):
+        self.mode = mode
+        self.startup_started = time.perf_counter()
+        logger.info(f"[LIFECYCLE] Arranque en modo '{mode}' | warm-up={warmup}")
+
+        if mode == "eager":
+            await self.wait_ready(warmup)
+        elif mode == "background":
+            self._shared("startup", lambda: self.initialize_all(warmup)).add_done_callback(_log_background_failure)
+        elif mode == "lazy":
+            # Nada se inicializa por adelantado: las tareas de arranque (p. ej.
+            # reanudar jobs) resuelven en sus hilos solo lo que usan
+            self._shared("on_ready", self._run_on_ready)
+
+    async def shutdown(self):
+        for component in reversed(list(self.components.values())):
+            try:
+                await component._aclose()
+            except Exception as e:
+                logger.warning(f"[LIFECYCLE] Error cerrando '{component._name}': {e}")
+
+    def _run_on_ready(self):
+        with self._ready_lock:
+            self._run_on_ready_locked()
+
+    def _run_on_ready_locked(self):
+        if self._on_ready_done:
+            return
+        for callback in self._on_ready:
+            callback()
+        self._on_ready_done = True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready_done,
+            "mode": self.mode,
+            "import_ms": self.import_ms,
+            "ready_ms": self.ready_ms,
+            "components": {name: c._status() for name, c in self.components.items()},
+        }
+
+
+def _run_into(future: Future, fn: Callable[[], Any]):
+    try:
+        future.set_result(fn())
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def _log_background_failure(future: Future):
+    if future.exception() is not None:
+        # Queda registrado en el estado del componente; el próximo request reintenta
+        logger.error("[LIFECYCLE] La inicialización en segundo plano no terminó", exc_info=future.exception())
+
+
+# Instancia global del proceso
+lifecycle = Lifecycle()
@@ -1,16 +1,39 @@
-from fastapi import FastAPI, HTTPException
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi import UploadFile, File
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 
 from uuid import uuid4
-import pdfplumber
+import asyncio
+import hashlib
+import json
+import math
+import os
+import shutil
 
 from models import (StatusResponse,
     GenerateEmbeddingsRequest, GenerateEmbeddingsResponse,
     SearchRequest, SearchResponse, SearchResultItem,
-    AskRequest, AskResponse,
+    AskRequest, AskResponse, BatchAskRequest, BatchAskResponse,
+    JobStatusResponse, JobListResponse, IntentRouteItem, IntentRoutesResponse,
+)
+from storage import get_document, list_documents, count_documents, set_document_embeddings, rebuild_catalog
+from config import UPLOADS_DIR, QUERY_BATCH_MAX_QUESTIONS, STARTUP_MODE, STARTUP_MODES, STARTUP_WARMUP, INTENT_ROUTES_PATH
+from ingestion import ingest_documents
+from jobs import job_manager
+from chunking import chunk_document_pages
+from metrics import metrics
+from lifecycle import lifecycle
+from intent_router import load_routes
+from cohere_client import CohereUnavailableError
+from rag_ppal import (reindex_document, document_id_for,
+    search_similar_chunks_async, rag_answer_async, rag_answer_stream,
+    rag_answer_batch, embedding_cache, answer_cache, lexical_index, vector_store,
+    embed_batcher, vector_batcher, intent_router, cohere_client, admission,
 )
-from storage import save_document, get_document, DOCUMENTS
-from rag_ppal import chunk_document, generate_embeddings_for_document, search_similar_chunks, rag_answer
 
 # ------------------------ LOGGING ------------------------
 from logging_config import configure_logging
@@ -20,57 +43,200 @@ configure_logging()
 logger = logging.getLogger("API")
 # ---------------------------------------------------------
 
-app = FastAPI(title="Asistente Tributario Municipal API", version="1.0.0")
+# --------- Arranque ---------
+
+# Catálogo de documentos desde disco (solo headers, sin leer los textos)
+lifecycle.register("document_catalog", rebuild_catalog)
+# Jobs interrumpidos por un reinicio continúan desde el último lote completo
+lifecycle.on_ready(job_manager.resume_pending)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Importar la aplicación no abre clientes ni índices: se inicializan acá
+    según STARTUP_MODE (en segundo plano por defecto) y se cierran al apagar.
+    """
+    if STARTUP_MODE not in STARTUP_MODES:
+        raise ValueError(f"STARTUP_MODE desconocido: {STARTUP_MODE}")
+    await lifecycle.start(STARTUP_MODE, STARTUP_WARMUP)
+    yield
+    await lifecycle.shutdown()
+
+
+app = FastAPI(title="Asistente Tributario Municipal API", version="1.0.0", lifespan=lifespan)
+
+# Endpoints que responden aunque los componentes no estén listos
+NO_WAIT_PATHS = ("/status", "/metrics", "/jobs", "/docs", "/redoc", "/openapi.json")
+
+# Modo lazy: componentes que usa cada endpoint (por prefijo); un endpoint que
+# no figura acá espera a que esté todo listo
+_RETRIEVAL_COMPONENTS = ("cohere", "cohere_async", "embedding_cache", "vector_store",
+                         "lexical_index", "chunk_texts", "intent_router")
+ROUTE_COMPONENTS = (
+    ("/upload-file", ("document_catalog",)),
+    ("/generate-embeddings", ("document_catalog", *_RETRIEVAL_COMPONENTS)),
+    ("/intent", ("intent_router",)),
+    ("/search", _RETRIEVAL_COMPONENTS),
+    ("/query", _RETRIEVAL_COMPONENTS),
+)
+
+
+def _route_components(path: str):
+    return next((names for prefix, names in ROUTE_COMPONENTS if path.startswith(prefix)), None)
+
+
+@app.middleware("http")
+async def wait_until_ready(request: Request, call_next):
+    """
+    Los requests que usan el vector store o Cohere esperan (sin bloquear el
+    event loop) a que termine la inicialización; si falla responden 503.
+    En modo lazy cada endpoint espera solo los componentes que usa.
+    """
+    path = request.url.path
+    if not lifecycle.ready and not path.startswith(NO_WAIT_PATHS):
+        names = _route_components(path) if lifecycle.mode == "lazy" else None
+        try:
+            if names is None:
+                await lifecycle.wait_ready(STARTUP_WARMUP)
+            else:
+                await lifecycle.wait_components(names)
+        except Exception:
+            logger.error("[STARTUP] Servicio no disponible: falló la inicialización", exc_info=True)
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "El servicio se está iniciando y no está disponible todavía."},
+            )
+    return await call_next(request)
+
+
+# Mensaje cuando Cohere no responde a tiempo o está fallando
+UPSTREAM_UNAVAILABLE_DETAIL = "El servicio externo no está disponible en este momento. Intente nuevamente en unos segundos."
+
+
+@app.exception_handler(CohereUnavailableError)
+async def cohere_unavailable(request: Request, error: CohereUnavailableError):
+    """
+    Fallas transitorias de Cohere (reintentos agotados, deadline vencido o
+    circuit breaker abierto) → 503/504 con Retry-After, no un 500.
+    """
+    logger.warning(f"[API] Cohere no disponible en {request.url.path}: {error}")
+    headers = {"Retry-After": str(math.ceil(error.retry_after))} if error.retry_after else None
+    return JSONResponse(status_code=error.status_code, content={"detail": UPSTREAM_UNAVAILABLE_DETAIL},
+                        headers=headers)
+
 
 @app.get("/status", response_model=StatusResponse)
 def status():
-    logger.info("[STATUS] Health check OK")
+    # Responde aunque el arranque no haya terminado: cada sección se incluye
+    # solo si su componente ya está listo
+    readiness = lifecycle.status()
+    logger.info(f"[STATUS] Health check OK | ready={readiness['ready']}")
     return StatusResponse(
         service="asistente_tributario_rag",
-        status="ok",
-        documents_loaded=len(DOCUMENTS)
+        status=_service_status(readiness),
+        documents_loaded=count_documents(),
+        readiness=readiness,
+        embedding_cache=embedding_cache.stats() if embedding_cache.ready else None,
+        answer_cache=answer_cache.stats(),
+        lexical_index=lexical_index.stats() if lexical_index.ready else None,
+        vector_store={"backend": vector_store.name, **vector_store.stats()} if vector_store.ready else None,
+        microbatch={"embed": embed_batcher.stats(), "vector": vector_batcher.stats()},
+        cohere=cohere_client.stats(),
+        admission=admission.stats(),
+        metrics=metrics.summary(),
     )
 
+def _service_status(readiness: dict) -> str:
+    if readiness["ready"]:
+        return "ok"
+    if any(c["state"] == "failed" for c in readiness["components"].values()):
+        return "degraded"
+    # En modo lazy los componentes pendientes se inicializan al usarse
+    return "ok" if readiness["mode"] == "lazy" else "starting"
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Métricas en formato de texto de Prometheus: histogramas de latencia por
+    etapa (rag_stage_duration_seconds) y contadores de respuestas y caches.
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.post("/upload-file")
 async def upload_file(title: str, file: UploadFile = File(...)):
+    """
+    Guarda el PDF y encola un job de extracción + chunking + embeddings.
+    El progreso se consulta en /jobs/{job_id}.
+    """
     logger.info(f"[UPLOAD-FILE] Recibiendo archivo: {file.filename}")
 
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Solo se permiten archivos PDF")
 
-    # ---- Extraer texto ----
+    # ---- Guardar PDF para el worker ----
+    # Copia a disco, catálogo y cola de jobs usan E/S sincrónica: fuera del event loop
     try:
-
-        pdf_text = ""
-        with pdfplumber.open(file.file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                pdf_text += page_text + "\n"
-
-        if not pdf_text.strip():
-            raise HTTPException(status_code=400, detail="No se pudo extraer texto del PDF")
-
+        doc_id, file_path = await asyncio.to_thread(_store_upload, title, file.file)
     except Exception:
-        logger.error("[UPLOAD-FILE] Error leyendo PDF", exc_info=True)
+        logger.error("[UPLOAD-FILE] Error guardando PDF", exc_info=True)
         raise HTTPException(status_code=500, detail="Error procesando el PDF")
 
-    # ---- Guardar documento crudo ----
-    doc_id = str(uuid4())
-
-    save_document(doc_id, title, pdf_text)
-
-    DOCUMENTS[doc_id]["chunks"] = None
-    DOCUMENTS[doc_id]["embedding_ids"] = None
+    job = await asyncio.to_thread(_submit_upload, doc_id, title, file_path)
 
-    logger.info(f"[UPLOAD-FILE] Documento guardado crudo con id={doc_id}")
+    logger.info(f"[UPLOAD-FILE] Documento {doc_id} encolado en job {job['job_id']}")
 
     return {
-        "message": "PDF cargado correctamente. Listo para procesar embeddings luego.",
+        "message": "PDF recibido. El procesamiento continúa en segundo plano.",
         "document_id": doc_id,
         "title": title,
-        "text_length": len(pdf_text)
+        "job_id": job["job_id"],
     }
 
+
+class _HashingWriter:
+    """Archivo de destino que calcula el sha256 de lo que se escribe."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return self.f.write(data)
+
+
+def _store_upload(title: str, source) -> tuple:
+    """
+    Copia el PDF subido a UPLOADS_DIR por bloques (sin cargarlo entero en
+    memoria) calculando su huella, y devuelve (doc_id, ruta).
+    El id depende del título (re-subir una versión corregida re-indexa solo
+    los chunks que cambiaron); el mismo archivo con otro título conserva el
+    id del documento ya cargado.
+    """
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    token = uuid4().hex[:8]
+    partial_path = os.path.join(UPLOADS_DIR, f"upload-{token}.part")
+    try:
+        with open(partial_path, "wb") as f:
+            writer = _HashingWriter(f)
+            shutil.copyfileobj(source, writer)
+        doc_id = document_id_for(title, writer.digest.hexdigest())
+        file_path = os.path.join(UPLOADS_DIR, f"{doc_id}-{token}.pdf")
+        os.replace(partial_path, file_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return doc_id, file_path
+
+
+def _submit_upload(doc_id: str, title: str, file_path: str):
+    # Un solo job por documento: si hay otro en curso, este espera a que termine
+    if doc_id in job_manager.active_document_ids():
+        logger.info(f"[UPLOAD-FILE] Documento {doc_id} con un job en curso: el nuevo job queda en espera")
+    return job_manager.submit_upload(doc_id, title, file_path)
+
 @app.post("/generate-embeddings", response_model=GenerateEmbeddingsResponse)
 def generate_embeddings(payload: GenerateEmbeddingsRequest):
     logger.info(f"[EMBEDDINGS] Solicitud para generar embeddings. document_id={payload.document_id}")
@@ -81,48 +247,107 @@ def generate_embeddings(payload: GenerateEmbeddingsRequest):
             logger.warning(f"[EMBEDDINGS] Documento no encontrado: {payload.document_id}")
             raise HTTPException(status_code=404, detail="Documento no encontrado")
 
+        if payload.background:
+            job = job_manager.submit_embedding(doc["id"], doc["title"])
+            return GenerateEmbeddingsResponse(
+                message=f"Embedding job queued for document {doc['id']}",
+                document_id=doc["id"],
+                job_ids=[job["job_id"]],
+            )
+
         logger.info(f"[EMBEDDINGS] Generando embeddings para documento {doc['id']} - '{doc['title']}'")
-        
-        chunks = chunk_document(doc["content"], doc["title"])
-        ids = generate_embeddings_for_document(doc["id"], doc["title"], chunks)
-        doc["chunks"] = chunks
-        doc["embedding_ids"] = ids
+
+        with job_manager.claim([doc["id"]]) as claimed:
+            if not claimed:
+                raise HTTPException(status_code=409, detail="El documento tiene un job de ingesta en curso")
+            chunks, pages = chunk_document_pages(doc["content"], doc["title"])
+            ids, report = reindex_document(doc["id"], doc["title"], chunks, pages)
+            set_document_embeddings(doc["id"], ids)
 
         logger.info(f"[EMBEDDINGS] Embeddings generados correctamente para {doc['id']}")
 
         return GenerateEmbeddingsResponse(
             message=f"Embeddings generated successfully for document {doc['id']}",
             document_id=doc["id"],
+            stats={"reindex": report},
         )
 
-    # Si viene sin document_id, procesar todos
-    for doc in DOCUMENTS.values():
-        if doc.get("embedding_ids"):
-            continue
-
-        logger.info(f"[EMBEDDINGS] Procesando documento {doc['id']} - '{doc['title']}'")
+    # Si viene sin document_id, procesar todos en pipeline
+    # (se omiten los que ya tienen un job de ingesta en curso)
+    busy = set(job_manager.active_document_ids())
+    pending = [doc for doc in list_documents() if not doc["embedding_ids"] and doc["id"] not in busy]
+    logger.info(f"[EMBEDDINGS] Procesando {len(pending)} documentos sin embeddings")
 
-        chunks = chunk_document(doc["content"], doc["title"])
-        ids = generate_embeddings_for_document(doc["id"], doc["title"], chunks)
-        doc["chunks"] = chunks
-        doc["embedding_ids"] = ids
+    if payload.background:
+        job_ids = [job_manager.submit_embedding(doc["id"], doc["title"])["job_id"] for doc in pending]
+        return GenerateEmbeddingsResponse(
+            message=f"{len(job_ids)} embedding jobs queued",
+            job_ids=job_ids,
+        )
 
-        logger.info(f"[EMBEDDINGS] Embeddings generados para documento {doc['id']}")
+    # Los documentos quedan reservados: un job que llegue mientras tanto espera
+    with job_manager.claim([doc["id"] for doc in pending]) as claimed:
+        claimed = set(claimed)
+        per_doc, report = ingest_documents([doc for doc in pending if doc["id"] in claimed])
+        for doc_id, result in per_doc.items():
+            set_document_embeddings(doc_id, result["embedding_ids"])
 
     logger.info("[EMBEDDINGS] Embeddings generados para todos los documentos sin procesar.")
 
     return GenerateEmbeddingsResponse(
-        message="Embeddings generated successfully for all documents"
+        message="Embeddings generated successfully for all documents",
+        stats=report,
+    )
+
+
+
+@app.get("/jobs", response_model=JobListResponse)
+def list_jobs(limit: int = 100):
+    return JobListResponse(jobs=[JobStatusResponse(**j) for j in job_manager.list(limit)])
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return JobStatusResponse(**job)
+
+
+@app.get("/intent/routes", response_model=IntentRoutesResponse)
+def list_intent_routes():
+    stats = intent_router.stats()
+    return IntentRoutesResponse(
+        routes=[IntentRouteItem(**r) for r in intent_router.describe()],
+        groups=stats["groups"],
+        chunks=stats["chunks"],
     )
 
-logger.info(f"[DEBUG] DOCUMENTS keys: {list(DOCUMENTS.keys())}")
+
+@app.post("/intent/routes/reload", response_model=IntentRoutesResponse)
+def reload_intent_routes():
+    """
+    Vuelve a leer INTENT_ROUTES_PATH: una ruta nueva o editada se aplica sin
+    reiniciar (los centroides por tipo_documento/tramite no se recalculan).
+    """
+    try:
+        routes = load_routes(INTENT_ROUTES_PATH)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Rutas de intención inválidas: {e}")
+    intent_router.set_routes(routes)
+    logger.info(f"[INTENT] Rutas recargadas desde {INTENT_ROUTES_PATH}: {[r['name'] for r in routes]}")
+    return list_intent_routes()
+
 
 @app.post("/search", response_model=SearchResponse)
-def search(payload: SearchRequest):
+async def search(payload: SearchRequest):
     logger.info(f"[SEARCH] Consulta recibida: '{payload.query}'")
 
     try:
-        results_raw = search_similar_chunks(payload.query, n_results=3)
+        timings = {}
+        results_raw = await search_similar_chunks_async(payload.query, n_results=3, mode=payload.mode, timings=timings)
+    except CohereUnavailableError:
+        raise
     except Exception:
         logger.error("[SEARCH] Error al procesar la búsqueda.", exc_info=True)
         raise HTTPException(status_code=500, detail="El servicio externo no pudo procesar la solicitud en este momento.")
@@ -133,21 +358,27 @@ def search(payload: SearchRequest):
             title=r["title"],
             content_snippet=r["content_snippet"],
             similarity_score=r["similarity_score"],
+            page_start=r["page_start"],
+            page_end=r["page_end"],
+            heading_path=r.get("heading_path"),
+            lexical_score=r.get("lexical_score"),
         )
         for r in results_raw
     ]
 
     logger.info(f"[SEARCH] {len(items)} resultados devueltos para la consulta.")
 
-    return SearchResponse(results=items)
+    return SearchResponse(results=items, timings_ms=timings)
 
 
 @app.post("/query", response_model=AskResponse)
-def query(payload: AskRequest):
+async def query(payload: AskRequest):
     logger.info(f"[QUERY] Pregunta recibida: '{payload.question}'")
 
     try:
-        rag_result = rag_answer(payload.question)
+        rag_result = await rag_answer_async(payload.question, payload.mode, payload.priority)
+    except CohereUnavailableError:
+        raise
     except Exception:
         logger.error("[QUERY] Error interno al generar respuesta.", exc_info=True)
         raise HTTPException(
@@ -156,7 +387,8 @@ def query(payload: AskRequest):
         )
 
     logger.info(
-        f"[QUERY] Respuesta generada | grounded={rag_result['grounded']} | similitud={rag_result['similarity_score']:.3f}"
+        f"[QUERY] Respuesta generada | grounded={rag_result['grounded']} | "
+        f"degradada={rag_result.get('degraded', False)} | similitud={rag_result['similarity_score']:.3f}"
     )
 
     return AskResponse(
@@ -165,11 +397,106 @@ def query(payload: AskRequest):
     context_used=rag_result["context_used"],
     similarity_score=rag_result["similarity_score"],
     grounded=rag_result["grounded"],
+    degraded=rag_result.get("degraded", False),
     source_document=rag_result.get("source_document"),
     chunk_id=rag_result.get("chunk_id"),
+    timings_ms=rag_result.get("timings_ms"),
 )
 
 
+@app.post("/query/batch", response_model=BatchAskResponse)
+async def query_batch(payload: BatchAskRequest):
+    """
+    Varias preguntas en un request (integración del call center).
+    Los embeds y las consultas al vector store se agrupan; las respuestas
+    vuelven en el mismo orden que las preguntas.
+    """
+    logger.info(f"[QUERY-BATCH] {len(payload.questions)} preguntas recibidas")
+
+    if len(payload.questions) > QUERY_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {QUERY_BATCH_MAX_QUESTIONS} preguntas por request",
+        )
+
+    t0 = time.perf_counter()
+    try:
+        rag_results = await rag_answer_batch(payload.questions, payload.mode, payload.priority)
+    except CohereUnavailableError:
+        raise
+    except Exception:
+        logger.error("[QUERY-BATCH] Error interno al generar respuestas.", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="El servicio externo no pudo procesar la solicitud en este momento."
+        )
+
+    elapsed_ms = round((time.perf_counter() - t0) * 1000, 2)
+    grounded = sum(1 for r in rag_results if r["grounded"])
+    degraded = sum(1 for r in rag_results if r.get("degraded"))
+    logger.info(
+        f"[QUERY-BATCH] {len(rag_results)} respuestas en {elapsed_ms} ms | grounded={grounded} | degradadas={degraded}"
+    )
+
+    return BatchAskResponse(
+        results=[
+            AskResponse(
+                question=question,
+                answer=r["answer"],
+                context_used=r["context_used"],
+                similarity_score=r["similarity_score"],
+                grounded=r["grounded"],
+                degraded=r.get("degraded", False),
+                source_document=r.get("source_document"),
+                chunk_id=r.get("chunk_id"),
+                timings_ms=r.get("timings_ms"),
+            )
+            for question, r in zip(payload.questions, rag_results)
+        ],
+        elapsed_ms=elapsed_ms,
+    )
+
+
+@app.post("/query/stream")
+async def query_stream(payload: AskRequest):
+    """
+    Igual que /query pero emite la respuesta como Server-Sent Events:
+    eventos `token` con cada fragmento generado y un evento final
+    `metadata` con grounded, degraded, similarity_score, source_document y chunk_id.
+    """
+    logger.info(f"[QUERY-STREAM] Pregunta recibida: '{payload.question}'")
+
+    async def event_stream():
+        try:
+            async for event in rag_answer_stream(payload.question, payload.mode, payload.priority):
+                if event["event"] == "metadata":
+                    logger.info(
+                        f"[QUERY-STREAM] Respuesta generada | grounded={event['data']['grounded']} | "
+                        f"similitud={event['data']['similarity_score']:.3f}"
+                    )
+                yield _sse(event["event"], event["data"])
+        except CohereUnavailableError as e:
+            # Los headers ya se enviaron: el status va en el evento de error
+            logger.warning(f"[QUERY-STREAM] Cohere no disponible: {e}")
+            yield _sse("error", {"detail": UPSTREAM_UNAVAILABLE_DETAIL, "status": e.status_code,
+                                 "retry_after": e.retry_after})
+        except Exception:
+            logger.error("[QUERY-STREAM] Error interno al generar respuesta.", exc_info=True)
+            yield _sse("error", {"detail": "El servicio externo no pudo procesar la solicitud en este momento."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+lifecycle.mark_imported(_IMPORT_STARTED)
+
 
 if __name__ == '__main__':
     import uvicorn
@@ -0,0 +1,207 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import METRICS_WINDOW
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("METRICS")
+# ---------------------------------------------------------
+
+# Límites (segundos) de los buckets de los histogramas, estilo Prometheus
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_METRIC = "rag_stage_duration_seconds"
+
+# Muestra de un collector: (nombre, tipo, ayuda, etiquetas, valor)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+class _Histogram:
+    """
+    Buckets acumulativos para Prometheus más una ventana de las últimas
+    observaciones para calcular percentiles exactos en /status.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...], window: int):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+        self.recent: deque = deque(maxlen=window)
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        if not self.recent:
+            return {"count": self.total}
+        p50, p95, p99 = np.percentile(np.fromiter(self.recent, dtype=np.float64), [50, 95, 99])
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum / self.total * 1000, 2),
+            "p50_ms": round(p50 * 1000, 2),
+            "p95_ms": round(p95 * 1000, 2),
+            "p99_ms": round(p99 * 1000, 2),
+        }
+
+
+class Metrics:
+    """
+    Registro de métricas del proceso:
+    - histogramas de duración por etapa (span / observe)
+    - contadores con etiquetas (inc)
+    - collectors: funciones que devuelven muestras al momento de exportar,
+      para valores que ya cuentan otros componentes (caches, batchers)
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = METRICS_WINDOW):
+        self.buckets = buckets
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    # --------- Registro ---------
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = _Histogram(self.buckets, self.window)
+            hist.observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str, timings: Optional[Dict[str, float]] = None):
+        """
+        Mide el bloque y lo registra en el histograma de la etapa.
+        Si se pasa timings, deja además la duración en timings[f"{stage}_ms"].
+        Funciona igual dentro de corutinas (mide tiempo de reloj).
+        """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.observe(stage, elapsed)
+            if timings is not None:
+                timings[f"{stage}_ms"] = round(elapsed * 1000, 2)
+
+    def timed_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """
+        Recorre iterable registrando solo el tiempo que pasa produciendo
+        elementos (no el del consumidor). Se registra al agotarse.
+        """
+        iterator = iter(iterable)
+        busy = 0.0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                busy += time.perf_counter() - t0
+                break
+            busy += time.perf_counter() - t0
+            yield item
+        self.observe(stage, busy)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0, help: str = ""):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    # --------- Exportación ---------
+
+    def _collect(self) -> List[Sample]:
+        samples: List[Sample] = []
+        for collector in self._collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.warning(f"[METRICS] Falló un collector: {e}")
+        return samples
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Resumen para /status: percentiles por etapa (ms) y contadores.
+        """
+        with self._lock:
+            stages = {stage: hist.summary() for stage, hist in sorted(self._stages.items())}
+            counters = {
+                _series(name, dict(labels)): value
+                for (name, labels), value in sorted(self._counters.items())
+            }
+        for name, _, _, labels, value in self._collect():
+            counters[_series(name, labels)] = value
+        return {"stages": stages, "counters": counters}
+
+    def render_prometheus(self) -> str:
+        """
+        Formato de texto de Prometheus (version 0.0.4).
+        """
+        lines: List[str] = []
+
+        with self._lock:
+            if self._stages:
+                lines.append(f"# HELP {STAGE_METRIC} Duración de cada etapa del pipeline RAG")
+                lines.append(f"# TYPE {STAGE_METRIC} histogram")
+            for stage, hist in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="+Inf"}} {hist.total}')
+                lines.append(f'{STAGE_METRIC}_sum{{stage="{stage}"}} {hist.sum:.6f}')
+                lines.append(f'{STAGE_METRIC}_count{{stage="{stage}"}} {hist.total}')
+
+            families: Dict[str, List[Tuple[str, str, Dict[str, str], float]]] = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                families.setdefault(name, []).append(("counter", self._help.get(name, ""), dict(labels), value))
+
+        for name, kind, help_text, labels, value in self._collect():
+            families.setdefault(name, []).append((kind, help_text, labels, value))
+
+        for name, samples in families.items():
+            kind, help_text = samples[0][0], samples[0][1]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for _, _, labels, value in samples:
+                lines.append(f"{_series(name, labels)} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _series(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{_escape(str(v))}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Instancia global del proceso
+metrics = Metrics()
+span = metrics.span
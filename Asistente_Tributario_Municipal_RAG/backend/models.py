@@ -1,11 +1,26 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Annotated, Any, List, Literal, Optional, Dict
+
+RetrievalMode = Literal["vector", "lexical", "hybrid"]
+# Carril del control de admisión de la etapa LLM (ver admission.py)
+Priority = Literal["interactive", "batch"]
 
 # /status
 class StatusResponse(BaseModel):
     service: str
     status: str
     documents_loaded: int
+    readiness: Optional[Dict[str, Any]] = None
+    embedding_cache: Optional[Dict[str, float]] = None
+    answer_cache: Optional[Dict[str, float]] = None
+    lexical_index: Optional[Dict[str, float]] = None
+    vector_store: Optional[Dict[str, Any]] = None
+    microbatch: Optional[Dict[str, Dict[str, float]]] = None
+    # Estado de los circuit breakers y requests en vuelo por operación (embed, chat)
+    cohere: Optional[Dict[str, Dict[str, Any]]] = None
+    # Lugares, colas y rechazos del control de admisión por carril
+    admission: Optional[Dict[str, Any]] = None
+    metrics: Optional[Dict[str, Any]] = None
 
 # /generate-embeddings
 class GenerateEmbeddingsRequest(BaseModel): 
@@ -14,27 +29,53 @@ class GenerateEmbeddingsRequest(BaseModel):
         default=None,
         description="ID del documento a procesar; si se omite, se pueden procesar todos"
     ) 
+    background: bool = Field(
+        default=False,
+        description="Si es True se encolan jobs y la respuesta trae sus ids"
+    )
 
 class GenerateEmbeddingsResponse(BaseModel):
     message: str
     document_id: Optional[str] = None
+    # Throughput por etapa de la ingesta masiva
+    stats: Optional[Dict[str, Any]] = None
+    job_ids: Optional[List[str]] = None
 
 # /search
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=1, description="Texto de búsqueda")
+    mode: Optional[RetrievalMode] = Field(
+        default=None,
+        description="Modo de recuperación; si se omite se usa RETRIEVAL_MODE"
+    )
 
 class SearchResultItem(BaseModel):
     document_id: str
     title: str
     content_snippet: str
     similarity_score: float
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    # Artículo/título/apartado del chunk (chunking "structure")
+    heading_path: Optional[str] = None
+    lexical_score: Optional[float] = None
 
 class SearchResponse(BaseModel):
     results: List[SearchResultItem]
+    # Latencia por etapa (embed, vector, lexical, fusión, lectura)
+    timings_ms: Optional[Dict[str, float]] = None
 
 # /query
 class AskRequest(BaseModel):
     question: str = Field(..., min_length=1, description="Pregunta del usuario")
+    mode: Optional[RetrievalMode] = Field(
+        default=None,
+        description="Modo de recuperación; si se omite se usa RETRIEVAL_MODE"
+    )
+    priority: Priority = Field(
+        default="interactive",
+        description="Carril de admisión al LLM; las integraciones automáticas usan batch"
+    )
 
 class AskResponse(BaseModel):
     question: str
@@ -42,5 +83,55 @@ class AskResponse(BaseModel):
     context_used: str
     similarity_score: float
     grounded: bool
+    # Servicio saturado: respuesta sin LLM con el chunk más relevante
+    degraded: bool = False
     source_document: Optional[str] = None
     chunk_id: Optional[str] = None
+    timings_ms: Optional[Dict[str, float]] = None
+
+# /query/batch
+class BatchAskRequest(BaseModel):
+    questions: List[Annotated[str, Field(min_length=1)]] = Field(
+        ..., min_length=1, description="Preguntas a responder en un solo request"
+    )
+    mode: Optional[RetrievalMode] = Field(
+        default=None,
+        description="Modo de recuperación; si se omite se usa RETRIEVAL_MODE"
+    )
+    priority: Priority = Field(default="batch", description="Carril de admisión al LLM")
+
+class BatchAskResponse(BaseModel):
+    results: List[AskResponse]
+    elapsed_ms: float
+
+# /jobs
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    document_id: str
+    title: str
+    status: str
+    stage: str
+    percent_done: float
+    total_chunks: int
+    chunks_embedded: int
+    elapsed_seconds: float
+    error: Optional[str] = None
+
+class JobListResponse(BaseModel):
+    jobs: List[JobStatusResponse]
+
+# /intent/routes
+class IntentRouteItem(BaseModel):
+    name: str
+    description: str = ""
+    where: Dict[str, Any]
+    examples: int
+    chunks: int
+    min_score: float
+    min_margin: float
+
+class IntentRoutesResponse(BaseModel):
+    routes: List[IntentRouteItem]
+    groups: int
+    chunks: int
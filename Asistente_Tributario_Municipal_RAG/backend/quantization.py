@@ -0,0 +1,87 @@
+from typing import Tuple
+
+import numpy as np
+
+# Cuantizaciones soportadas por el store numpy
+QUANTIZATIONS = ("float", "int8", "binary")
+
+# Filas por bloque al puntuar: acota la memoria temporal de las conversiones.
+# Los bloques int8 se convierten a float32 en un buffer chico que queda en cache.
+_BLOCK_ROWS = 16384
+_INT8_BLOCK_ROWS = 256
+
+
+def code_width(quantization: str, dim: int) -> int:
+    """
+    Bytes por vector en la representación cuantizada.
+    """
+    if quantization == "int8":
+        return dim
+    if quantization == "binary":
+        return (dim + 7) // 8
+    return dim * 4
+
+
+def code_dtype(quantization: str):
+    return np.int8 if quantization == "int8" else np.uint8
+
+
+# --------- Codificación ---------
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    int8 simétrico con una escala por fila: v ≈ codes * scale.
+    Devuelve (codes int8, scales float32).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """
+    Un bit por dimensión (1 si la componente es positiva), empaquetado en
+    bytes; es el mismo criterio que el tipo ubinary de Cohere.
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+# --------- Puntuación aproximada ---------
+
+def int8_scores(Q: np.ndarray, codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """
+    Producto punto aproximado de cada consulta (float32) con cada fila
+    cuantizada: (len(Q), len(codes)).
+    """
+    out = np.empty((len(Q), len(codes)), dtype=np.float32)
+    buffer = np.empty((min(_INT8_BLOCK_ROWS, len(codes)), codes.shape[1]), dtype=np.float32)
+    for start in range(0, len(codes), _INT8_BLOCK_ROWS):
+        end = min(start + _INT8_BLOCK_ROWS, len(codes))
+        block = buffer[:end - start]
+        np.copyto(block, codes[start:end], casting="unsafe")
+        out[:, start:end] = Q @ block.T
+    out *= np.asarray(scales, dtype=np.float32)
+    return out
+
+
+def binary_scores(Q: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    Bits coincidentes menos bits distintos (dim - 2 * Hamming) entre cada
+    consulta binarizada y cada fila: crece con la similitud coseno.
+    """
+    width = codes.shape[1]
+    q_bits = quantize_binary(Q)
+    # Con filas múltiplo de 8 bytes el XOR y el conteo se hacen de a 64 bits
+    word = np.uint64 if width % 8 == 0 else np.uint8
+    q_words = np.ascontiguousarray(q_bits).view(word)
+
+    out = np.empty((len(Q), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        end = min(start + _BLOCK_ROWS, len(codes))
+        block = np.ascontiguousarray(codes[start:end]).view(word)
+        for i, q in enumerate(q_words):
+            distance = np.bitwise_count(block ^ q).sum(axis=1, dtype=np.int32)
+            out[i, start:end] = width * 8 - 2 * distance
+    return out
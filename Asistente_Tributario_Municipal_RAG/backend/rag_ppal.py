@@ -1,15 +1,47 @@
 import os
 import re
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+import json
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator
 
 import numpy as np
-import chromadb
-from chromadb.config import Settings
 import cohere
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import httpx
 from dotenv import load_dotenv
 
-from storage import get_document
+from storage import get_document, find_document_by_source
+from config import (
+    EMBED_MODEL, CHAT_MODEL, MAX_EMBED_TEXTS,
+    COHERE_BASE_URL, COHERE_TIMEOUT_SECONDS, COHERE_MAX_CONNECTIONS,
+    COHERE_EMBED_DEADLINE_SECONDS, COHERE_CHAT_DEADLINE_SECONDS, COHERE_MAX_RETRIES, COHERE_BACKOFF_BASE_SECONDS,
+    COHERE_EMBED_CONCURRENCY, COHERE_CHAT_CONCURRENCY, COHERE_EMBED_HEDGE_AFTER_MS, COHERE_HEDGE_MAX_RATIO,
+    COHERE_BREAKER_FAILURES, COHERE_BREAKER_RESET_SECONDS,
+    ADMISSION_MAX_CONCURRENT, ADMISSION_INTERACTIVE_QUEUE, ADMISSION_INTERACTIVE_MAX_WAIT_MS,
+    ADMISSION_BATCH_QUEUE, ADMISSION_BATCH_MAX_WAIT_MS, ADMISSION_BATCH_MAX_SHARE, DEGRADED_ANSWER_CHARS,
+    EMBED_CACHE_PATH, EMBED_CACHE_MEMORY_ITEMS, EMBED_CACHE_DISK_ITEMS,
+    CHUNK_TEXTS_PATH, CHUNK_TEXTS_MEMORY_ITEMS,
+    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES,
+    RETRIEVAL_MODE, RETRIEVAL_MODES, RETRIEVAL_CANDIDATES, RRF_K, MMR_LAMBDA, MMR_CANDIDATES,
+    MICROBATCH_MAX_WAIT_MS, MICROBATCH_MAX_SIZE,
+    CONTEXT_TOKEN_BUDGET, CONTEXT_CHARS_PER_TOKEN, CONTEXT_MERGE_ADJACENT,
+    INTENT_ROUTES_PATH, INTENT_MIN_SCORE, INTENT_MIN_MARGIN,
+)
+from chunking import limpiar_texto, infer_document_metadata, chunk_document
+from embedding_cache import EmbeddingCache, normalizar_para_cache
+from chunk_texts import ChunkTextStore
+from answer_cache import SemanticAnswerCache
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from vector_store import create_vector_store
+from batching import MicroBatcher
+from metrics import metrics, span
+from lifecycle import lifecycle
+from context_assembly import assemble_context
+from intent_router import IntentRouter, load_routes
+from cohere_client import ResilientCohere
+from admission import AdmissionController, AdmissionRejected
+from diversity import mmr_select
 
 # ------------------------ LOGGING ------------------------
 import logging
@@ -18,199 +50,766 @@ logger = logging.getLogger("RAG")
 
 load_dotenv()
 
-# --------- Inicialización de Cohere y Chroma ---------
+# --------- Inicialización de Cohere y vector store ---------
+
+# Los clientes y los índices se construyen al arrancar el servidor (en
+# segundo plano) o en el primer uso, no al importar: ver lifecycle.py.
+# Cada componente se usa igual que el objeto que envuelve.
 
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
-co = cohere.ClientV2()  
 
-chroma_client = chromadb.PersistentClient(path="chroma_db")
+# Clientes httpx propios, para cerrarlos al apagar
+_http_clients: Dict[str, httpx.AsyncClient] = {}
 
-collection = chroma_client.get_or_create_collection(
-    name="asistente_tributario_municipal",
-    metadata={"hnsw:space": "cosine"},
-)
 
-# --------- Utilidades de texto ---------
+def _make_async_client():
+    # Cliente async compartido por todos los requests, con pool de conexiones acotado
+    http_client = httpx.AsyncClient(
+        timeout=COHERE_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=COHERE_MAX_CONNECTIONS,
+            max_keepalive_connections=COHERE_MAX_CONNECTIONS,
+        ),
+    )
+    _http_clients["cohere_async"] = http_client
+    return cohere.AsyncClientV2(base_url=COHERE_BASE_URL, httpx_client=http_client)
+
+
+async def _close_async_client(_client):
+    http_client = _http_clients.pop("cohere_async", None)
+    if http_client is not None:
+        await http_client.aclose()
+
+
+def _make_embedding_cache():
+    return EmbeddingCache(
+        EMBED_CACHE_PATH,
+        max_memory_items=EMBED_CACHE_MEMORY_ITEMS,
+        max_disk_items=EMBED_CACHE_DISK_ITEMS,
+    )
+
+
+def _load_lexical_index(page_size: int = 1000) -> BM25Index:
+    """
+    Construye el índice BM25 a partir de los chunks ya guardados en el vector store.
+    """
+    t0 = time.perf_counter()
+    index = BM25Index()
+    offset = 0
+    while True:
+        page = vector_store.get(include=("documents", "metadatas"), limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        index.add(page["ids"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+
+    logger.info(
+        f"[LEXICAL] Índice BM25 construido en {(time.perf_counter() - t0) * 1000:.1f} ms | {index.stats()}"
+    )
+    return index
+
 
+def _open_chunk_texts(page_size: int = 1000) -> ChunkTextStore:
+    """
+    Abre el store local chunk_id → texto. Si tiene menos chunks que el vector
+    store (primer arranque o chunks guardados antes de que existiera) copia
+    los textos desde el vector store.
+    """
+    store = ChunkTextStore(CHUNK_TEXTS_PATH, max_memory_items=CHUNK_TEXTS_MEMORY_ITEMS)
+    # El snapshot ya sirve los textos desde el archivo mapeado: no se copian al
+    # arranque, se cachean a medida que load_chunk_texts los pide
+    if vector_store.name == "snapshot" or store.count() >= vector_store.count():
+        return store
+
+    t0 = time.perf_counter()
+    offset = 0
+    while True:
+        page = vector_store.get(include=("documents",), limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        store.put_many(page["ids"], page["documents"])
+        offset += len(page["ids"])
+
+    logger.info(
+        f"[CHUNK_TEXTS] {offset} textos copiados del vector store en {(time.perf_counter() - t0) * 1000:.1f} ms"
+    )
+    return store
 
-def limpiar_texto(texto: str) -> str:
+
+def _build_intent_router(page_size: int = 1000) -> IntentRouter:
     """
-    Normaliza saltos de línea y espacios.
+    Carga las rutas de INTENT_ROUTES_PATH y calcula los centroides por
+    tipo_documento/tramite a partir de los embeddings del vector store.
     """
-    texto = texto.replace("\r\n", "\n").replace("\r", "\n")
-    texto = re.sub(r"\n{3,}", "\n\n", texto)
-    texto = re.sub(r"[ \t]+", " ", texto)
-    return texto.strip() 
+    t0 = time.perf_counter()
+    router = IntentRouter(
+        load_routes(INTENT_ROUTES_PATH),
+        embed_examples=lambda texts: embed_texts(texts, input_type="search_query"),
+        min_score=INTENT_MIN_SCORE,
+        min_margin=INTENT_MIN_MARGIN,
+    )
+    offset = 0
+    while True:
+        page = vector_store.get(include=("metadatas", "embeddings"), limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        router.add(page["ids"], page["embeddings"], page["metadatas"])
+        offset += len(page["ids"])
 
-# --------- SPLITTERS ---------
+    logger.info(
+        f"[INTENT] Router de intención construido en {(time.perf_counter() - t0) * 1000:.1f} ms | {router.stats()}"
+    )
+    return router
 
-# Diferentes configuraciones para distintos tipos de documentos
 
-# textos cortos
-splitter_guias = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=80,
-    separators=["\n\n", "\n", " ", ""],
+co = lifecycle.register(
+    "cohere", lambda: cohere.ClientV2(base_url=COHERE_BASE_URL, timeout=COHERE_TIMEOUT_SECONDS),
 )
+aco = lifecycle.register("cohere_async", _make_async_client, close=_close_async_client)
+
+# Todos los llamados a Cohere pasan por acá: deadline, reintentos, hedging,
+# circuit breaker y límite de concurrencia (ver cohere_client.py)
+cohere_client = ResilientCohere(
+    co, aco,
+    deadlines={"embed": COHERE_EMBED_DEADLINE_SECONDS, "chat": COHERE_CHAT_DEADLINE_SECONDS},
+    concurrency={"embed": COHERE_EMBED_CONCURRENCY, "chat": COHERE_CHAT_CONCURRENCY},
+    max_retries=COHERE_MAX_RETRIES,
+    backoff_base_seconds=COHERE_BACKOFF_BASE_SECONDS,
+    hedge_after_ms=COHERE_EMBED_HEDGE_AFTER_MS,
+    hedge_max_ratio=COHERE_HEDGE_MAX_RATIO,
+    breaker_failures=COHERE_BREAKER_FAILURES,
+    breaker_reset_seconds=COHERE_BREAKER_RESET_SECONDS,
+)
+
+# Cupo de la etapa LLM con carriles de prioridad: saturado, se responde
+# degradado con el chunk más relevante en vez de encolar sin límite
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENT,
+    queue_limits={"interactive": ADMISSION_INTERACTIVE_QUEUE, "batch": ADMISSION_BATCH_QUEUE},
+    max_wait_ms={"interactive": ADMISSION_INTERACTIVE_MAX_WAIT_MS, "batch": ADMISSION_BATCH_MAX_WAIT_MS},
+    batch_max_share=ADMISSION_BATCH_MAX_SHARE,
+)
+
+# Chroma o matriz numpy en memoria mapeada, según VECTOR_STORE
+vector_store = lifecycle.register("vector_store", create_vector_store, warmup=lambda store: store.warmup())
 
-# textos largos
-splitter_codigo = RecursiveCharacterTextSplitter(
-    chunk_size=3000,
-    chunk_overlap=350,
-    separators=["\n\n", "\n", " ", ""],
+embedding_cache = lifecycle.register("embedding_cache", _make_embedding_cache)
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
 )
 
-def infer_document_metadata(title: str) -> Dict[str, str]:
-    t = title.lower()
-    
-    if "codigo" in t or "tributario" in t:
-        return {"tipo_documento": "normativa", "tramite": "general"}
+# Índice BM25 sobre los mismos chunks que el vector store (se mantiene en store_chunks)
+lexical_index = lifecycle.register("lexical_index", _load_lexical_index)
+
+# Textos de los mismos chunks por id (se mantienen en store_chunks y finalize_reindex)
+chunk_texts = lifecycle.register("chunk_texts", _open_chunk_texts)
+
+# Centroides de intención sobre los mismos chunks (se mantienen en store_chunks y finalize_reindex)
+intent_router = lifecycle.register("intent_router", _build_intent_router)
+
+# --------- Embeddings (con cache) ---------
 
-    if "guia" in t:
-        return {"tipo_documento": "procedimiento", "tramite": "general"}
+def _cache_lookup(texts: List[str], input_type: str):
+    """
+    Consulta la cache y agrupa los textos faltantes (sin repetir)
+    con las posiciones que ocupan en la lista original.
+    """
+    cached = embedding_cache.get_many(EMBED_MODEL, input_type, texts)
 
-    if "art" in t and "25" in t:
-        return {"tipo_documento": "protocolo_reclamo", "tramite": "reclamo"}
+    missing: Dict[str, List[int]] = {}
+    for i, vec in enumerate(cached):
+        if vec is None:
+            missing.setdefault(texts[i], []).append(i)
 
-    if "autoridad" in t:
-        return {"tipo_documento": "autoridad_operativa", "tramite": "general"}
+    if missing:
+        logger.info(f"[EMBED] Cache miss para {len(missing)} de {len(texts)} textos ({input_type})")
 
-    if "plan" in t:
-        return {"tipo_documento": "regularizacion", "tramite": "general"}
+    return cached, missing
 
-    return {"tipo_documento": "desconocido", "tramite": "general"}
 
+def _cache_fill(cached: List[Optional[np.ndarray]], missing: Dict[str, List[int]],
+                batch: List[str], response, input_type: str):
+    vectors = np.array(response.embeddings.float, dtype=np.float32)
+    embedding_cache.put_many(EMBED_MODEL, input_type, batch, vectors)
 
-def chunk_document(content: str, title: str) -> List[str]:
-    logger.info(f"[CHUNK] Iniciando chunking del documento. Longitud={len(content)} caracteres")
+    for text, vec in zip(batch, vectors):
+        for i in missing[text]:
+            cached[i] = vec
 
-    limpio = limpiar_texto(content)
-    meta = infer_document_metadata(title)
 
-    if meta["tipo_documento"] == "normativa":
-        chunks = splitter_codigo.split_text(limpio)
-    else:
-        chunks = splitter_guias.split_text(limpio)
+def embed_texts(texts: List[str], input_type: str) -> np.ndarray:
+    """
+    Devuelve una matriz float32 (len(texts), dim) con los embeddings.
+    Todos los llamados a embed pasan por aquí: primero se consulta la
+    cache y solo se envían a Cohere los textos faltantes (sin repetir).
+    """
+    cached, missing = _cache_lookup(texts, input_type)
+    pending = list(missing.keys())
+
+    for start in range(0, len(pending), MAX_EMBED_TEXTS):
+        batch = pending[start:start + MAX_EMBED_TEXTS]
+
+        with span("embed_batch"):
+            response = cohere_client.embed(
+                texts=batch,
+                model=EMBED_MODEL,
+                input_type=input_type,
+                embedding_types=["float"],
+            )
+        _cache_fill(cached, missing, batch, response, input_type)
 
-    logger.info(f"[CHUNK] Documento dividido en {len(chunks)} chunks ({meta})")
-    return chunks
+    return np.vstack(cached)
 
-# --------- Embeddings y almacenamiento en Chroma ---------
 
-def generate_embeddings_for_document(doc_id: str, title: str, chunks: List[str]) -> List[str]:
+async def embed_texts_async(texts: List[str], input_type: str) -> np.ndarray:
     """
-    Genera embeddings en lotes (batch) para evitar la limitación de Cohere
-    que permite máximo 96 textos por request.
-    Guarda embeddings y metadatos en Chroma.
+    Igual que embed_texts pero con el cliente async; los lotes faltantes
+    se envían en paralelo.
     """
+    cached, missing = _cache_lookup(texts, input_type)
+    pending = list(missing.keys())
+    batches = [pending[start:start + MAX_EMBED_TEXTS] for start in range(0, len(pending), MAX_EMBED_TEXTS)]
+
+    async def embed_batch(batch: List[str]):
+        with span("embed_batch"):
+            return await cohere_client.embed_async(
+                texts=batch,
+                model=EMBED_MODEL,
+                input_type=input_type,
+                embedding_types=["float"],
+            )
 
-    logger.info(f"[EMBED] Generando embeddings para documento {doc_id} - '{title}' | {len(chunks)} chunks")
-    
-    MAX_BATCH = 90
-    all_chunk_ids = []
+    responses = await asyncio.gather(*[embed_batch(batch) for batch in batches])
+
+    for batch, response in zip(batches, responses):
+        _cache_fill(cached, missing, batch, response, input_type)
+
+    return np.vstack(cached)
+
+# --------- Embeddings y almacenamiento en el vector store ---------
+
+# Tamaño de lote por request de embed (Cohere permite máximo 96)
+MAX_BATCH = 90
+
+
+# --------- Identidad de documentos y chunks ---------
+
+def document_id_for(title: str, source_sha256: Optional[str] = None) -> str:
+    """
+    Id estable de un documento a partir de su título normalizado: volver a
+    subir una versión corregida del mismo documento reutiliza el id y permite
+    re-indexar de forma incremental.
+    Antes se busca en el catálogo la huella del archivo (source_sha256): el
+    mismo PDF subido con otro título conserva el id del documento existente.
+    """
+    if source_sha256:
+        existing = find_document_by_source(source_sha256)
+        if existing:
+            logger.info(f"[EMBED] Archivo ya cargado como {existing}: se reutiliza su id")
+            return existing
+
+    normalizado = normalizar_para_cache(title).lower()
+    normalizado = re.sub(r"(\.pdf)+$", "", normalizado)
+    return "doc_" + hashlib.sha256(normalizado.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def plan_reindex(doc_id: str, title: str, chunks: List[str],
+                 pages: Optional[List[tuple]] = None) -> Dict[str, Any]:
+    """
+    Compara los chunks nuevos de un documento con los que ya están en el vector store
+    (buscados por título, así también se reconocen chunks de versiones
+    anteriores sin chunk_hash) y decide:
+    - to_add: índices de chunks nuevos o modificados → se embeben
+    - to_update: chunks sin cambios cuya metadata cambió (p. ej. chunk_index)
+    - to_delete: ids de chunks que ya no existen en el documento
+    Los chunks sin cambios conservan su id y su embedding.
+    pages: (página inicial, página final[, heading_path]) de cada chunk, si se conocen.
+    """
+    existing = _existing_chunks(doc_id, title)
+
+    # Chunks antiguos sin hash: se calcula a partir del texto guardado
+    legacy_ids = [cid for cid, meta in zip(existing["ids"], existing["metadatas"]) if not meta.get("chunk_hash")]
+    legacy_hashes: Dict[str, str] = {}
+    if legacy_ids:
+        legacy = vector_store.get(ids=legacy_ids, include=("documents",))
+        legacy_hashes = {cid: chunk_hash(doc) for cid, doc in zip(legacy["ids"], legacy["documents"])}
+
+    by_hash: Dict[str, List[tuple]] = {}
+    for cid, meta in zip(existing["ids"], existing["metadatas"]):
+        h = meta.get("chunk_hash") or legacy_hashes[cid]
+        by_hash.setdefault(h, []).append((cid, meta))
 
     meta_doc = infer_document_metadata(title)
+    used_ids = set(existing["ids"])
+    ids: List[str] = []
+    metadatas: List[Dict[str, Any]] = []
+    to_add: List[int] = []
+    to_update: List[int] = []
+
+    for i, text in enumerate(chunks):
+        h = chunk_hash(text)
+        meta = {
+            "document_id": doc_id,
+            "title": title,
+            "tipo_documento": meta_doc["tipo_documento"],
+            "tramite": meta_doc["tramite"],
+            "chunk_index": i,
+            "chunk_hash": h,
+        }
+        if pages:
+            meta["page_start"], meta["page_end"] = pages[i][:2]
+            # Ubicación en la estructura del documento (chunking "structure")
+            if len(pages[i]) > 2 and pages[i][2]:
+                meta["heading_path"] = pages[i][2]
+
+        matches = by_hash.get(h)
+        if matches:
+            old_id, old_meta = matches.pop(0)
+            ids.append(old_id)
+            if old_meta != meta:
+                to_update.append(i)
+        else:
+            new_id = f"{doc_id}_{h[:16]}"
+            n = 1
+            while new_id in used_ids:
+                new_id = f"{doc_id}_{h[:16]}_{n}"
+                n += 1
+            used_ids.add(new_id)
+            ids.append(new_id)
+            to_add.append(i)
+
+        metadatas.append(meta)
+
+    to_delete = [cid for matches in by_hash.values() for cid, _ in matches]
 
-    for start in range(0, len(chunks), MAX_BATCH):
-        batch = chunks[start:start + MAX_BATCH]
+    return {
+        "ids": ids,
+        "metadatas": metadatas,
+        "to_add": to_add,
+        "to_update": to_update,
+        "to_delete": to_delete,
+    }
 
-        logger.info(f"[EMBED] Procesando batch {start} - {start+len(batch)}")
 
-        # === EMBEDDINGS ===
-        response = co.embed(
-            texts=batch,
-            model="embed-multilingual-v3.0",
-            input_type="search_document",
-            embedding_types=["float"],
+def _existing_chunks(doc_id: str, title: str) -> Dict[str, list]:
+    """
+    Chunks actuales del documento: los de su id (pudo cambiar de título) y
+    los de su título que no pertenecen a otro documento con id propio
+    (versiones anteriores indexadas con ids aleatorios).
+    """
+    by_id = vector_store.get(where={"document_id": doc_id}, include=("metadatas",))
+    by_title = vector_store.get(where={"title": title}, include=("metadatas",))
+
+    ids, metadatas = list(by_id["ids"]), list(by_id["metadatas"])
+    seen = set(ids)
+    for cid, meta in zip(by_title["ids"], by_title["metadatas"]):
+        owner = meta.get("document_id") or ""
+        if cid in seen or (owner.startswith("doc_") and owner != doc_id):
+            continue
+        ids.append(cid)
+        metadatas.append(meta)
+    return {"ids": ids, "metadatas": metadatas}
+
+
+def finalize_reindex(plan: Dict[str, Any]):
+    """
+    Aplica la parte del plan que no requiere embeddings: actualiza metadatos
+    de chunks sin cambios y elimina los chunks que desaparecieron.
+    Se ejecuta después de guardar los chunks nuevos.
+    """
+    if plan["to_update"]:
+        vector_store.update_metadata(
+            [plan["ids"][i] for i in plan["to_update"]],
+            [plan["metadatas"][i] for i in plan["to_update"]],
+        )
+        lexical_index.update_metadata(
+            [plan["ids"][i] for i in plan["to_update"]],
+            [plan["metadatas"][i] for i in plan["to_update"]],
         )
 
-        embeddings_np = np.array(response.embeddings.float, dtype=np.float32)
-
-        # === IDS ===
-        batch_ids = [f"{doc_id}_chunk_{start+i}" for i in range(len(batch))]
-        all_chunk_ids.extend(batch_ids)
-
-        # === METADATA ===
-        metadatas = []
-        for i in range(len(batch)):
-            metadatas.append({
-                "document_id": doc_id,
-                "title": title,
-                "tipo_documento": meta_doc["tipo_documento"],
-                "tramite": meta_doc["tramite"],
-                "chunk_index": start + i
-            })
-
-        # === Guardar en Chroma ===
-        collection.add(
-            ids=batch_ids,
-            documents=batch,
-            embeddings=embeddings_np.tolist(),
-            metadatas=metadatas,
+    if plan["to_delete"]:
+        # Los vectores borrados se restan de los centroides de intención
+        removed = vector_store.get(ids=plan["to_delete"], include=("embeddings",))
+        intent_router.remove(removed["ids"], removed["embeddings"])
+        vector_store.delete(plan["to_delete"])
+        lexical_index.remove(plan["to_delete"])
+        chunk_texts.delete(plan["to_delete"])
+        # Respuestas fundamentadas en chunks que ya no existen
+        answer_cache.invalidate_chunks(plan["to_delete"])
+
+
+def reindex_report(plan: Dict[str, Any], chunks: List[str]) -> Dict[str, int]:
+    added = set(plan["to_add"])
+    total = len(chunks)
+
+    def requests_for(n):
+        return -(-n // MAX_BATCH)
+
+    return {
+        "chunks": total,
+        "embedded": len(added),
+        "unchanged": total - len(added),
+        "deleted": len(plan["to_delete"]),
+        "metadata_updated": len(plan["to_update"]),
+        "embed_requests_saved": requests_for(total) - requests_for(len(added)),
+        "bytes_saved": sum(len(chunks[i].encode("utf-8")) for i in range(total) if i not in added),
+    }
+
+
+def store_chunks(ids: List[str], documents: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]]):
+    """
+    Único punto de escritura en el vector store: guarda los chunks, los indexa en
+    BM25 y en el store de textos e invalida las respuestas cacheadas que se
+    fundamentaron en ellos.
+    """
+    with span("store_write"):
+        vector_store.add(ids, documents, np.asarray(embeddings, dtype=np.float32), metadatas)
+
+    lexical_index.add(ids, documents, metadatas)
+    chunk_texts.put_many(ids, documents)
+    intent_router.add(ids, embeddings, metadatas)
+
+    # Las respuestas cacheadas fundamentadas en estos chunks quedan obsoletas
+    answer_cache.invalidate_chunks(ids)
+
+
+def reindex_document(doc_id: str, title: str, chunks: List[str],
+                     pages: Optional[List[tuple]] = None):
+    """
+    Re-indexación incremental de un documento:
+    embebe solo los chunks nuevos o modificados (en lotes de MAX_BATCH,
+    Cohere permite máximo 96 textos por request), conserva los que no
+    cambiaron y elimina los que desaparecieron.
+    Devuelve (ids de todos los chunks del documento, reporte).
+    """
+
+    logger.info(f"[EMBED] Generando embeddings para documento {doc_id} - '{title}' | {len(chunks)} chunks")
+
+    plan = plan_reindex(doc_id, title, chunks, pages)
+    to_add = plan["to_add"]
+
+    for start in range(0, len(to_add), MAX_BATCH):
+        positions = to_add[start:start + MAX_BATCH]
+        batch = [chunks[i] for i in positions]
+
+        logger.info(f"[EMBED] Procesando batch {start} - {start+len(batch)} de {len(to_add)} chunks nuevos")
+
+        # === EMBEDDINGS ===
+        embeddings_np = embed_texts(batch, input_type="search_document")
+
+        # === Guardar en el vector store ===
+        store_chunks(
+            [plan["ids"][i] for i in positions],
+            batch,
+            embeddings_np,
+            [plan["metadatas"][i] for i in positions],
         )
 
-        logger.info(f"[EMBED] Guardado batch con {len(batch)} chunks en Chroma")
+        logger.info(f"[EMBED] Guardado batch con {len(batch)} chunks en {vector_store.name}")
 
-    logger.info(f"[EMBED] Embeddings almacenados en Chroma para doc={doc_id}")
-    return all_chunk_ids
+    finalize_reindex(plan)
 
+    report = reindex_report(plan, chunks)
+    logger.info(f"[EMBED] Re-indexación de doc={doc_id} completa: {report}")
+    return plan["ids"], report
 
-def search_similar_chunks(query: str, n_results: int = 5) -> List[Dict[str, Any]]:
+
+def generate_embeddings_for_document(doc_id: str, title: str, chunks: List[str],
+                                     pages: Optional[List[tuple]] = None) -> List[str]:
     """
-    Busca los n chunks más similares para la consulta.
-    Devuelve además los metadatos necesarios para grounding inteligente.
+    Genera (incrementalmente) los embeddings de un documento y los guarda
+    en el vector store. Devuelve los ids de sus chunks.
     """
-    logger.info(f"[SEARCH] Buscando contexto para consulta: '{query}'")
+    ids, _ = reindex_document(doc_id, title, chunks, pages)
+    return ids
 
-    # ---- Embed de la query ----
-    embed_resp = co.embed(
-        texts=[query],
-        model="embed-multilingual-v3.0",
-        input_type="search_query",
-        embedding_types=["float"],
-    )
 
-    query_emb = np.array(embed_resp.embeddings.float[0], dtype=np.float32)
+def _elapsed_ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
 
-    # ---- Búsqueda en Chroma ----
-    result = collection.query(
-        query_embeddings=[query_emb.tolist()],
-        n_results=n_results,
-    )
 
-    docs = result["documents"][0]
-    ids = result["ids"][0]
-    distances = result["distances"][0]
-    metadatas = result["metadatas"][0]
+def _make_item(chunk_id: str, meta: Dict[str, Any], similarity: float) -> Dict[str, Any]:
+    # Sin texto: full_chunk y content_snippet se agregan en load_chunk_texts
+    return {
+        "chunk_id": chunk_id,
+        "document_id": meta.get("document_id"),
+        "title": meta.get("title"),
+        "tipo_documento": meta.get("tipo_documento"),
+        "tramite": meta.get("tramite"),
+        "chunk_index": meta.get("chunk_index"),
+        "page_start": meta.get("page_start"),
+        "page_end": meta.get("page_end"),
+        "heading_path": meta.get("heading_path"),
+        "similarity_score": float(similarity),
+    }
+
 
-    items: List[Dict[str, Any]] = []
+def _item_from_hit(hit: Dict[str, Any]) -> Dict[str, Any]:
+    item = _make_item(hit["id"], hit["metadata"], hit["similarity"])
+    if "embedding" in hit:
+        # Solo para el re-rankeo MMR; _diversify lo quita antes de devolver
+        item["embedding"] = hit["embedding"]
+    return item
+
+
+def _query_collection(query_emb: np.ndarray, n_results: int, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Consulta el vector store con un embedding ya calculado y arma los
+    resultados con los metadatos necesarios para grounding (sin los textos).
+    """
+    hits = vector_store.query(query_emb, n_results, where, include_embeddings=MMR_ENABLED, include_documents=False)
 
     # ---- Construcción de resultados ----
-    for i in range(len(docs)):
-        similarity = 1 - distances[i]
-
-        items.append(
-            {
-                "chunk_id": ids[i],
-                "document_id": metadatas[i].get("document_id"),
-                "title": metadatas[i].get("title"),
-                "tipo_documento": metadatas[i].get("tipo_documento"),
-                "tramite": metadatas[i].get("tramite"),
-                "chunk_index": metadatas[i].get("chunk_index"),
-                "content_snippet": docs[i][:200],
-                "similarity_score": float(similarity),
-                "full_chunk": docs[i],
-            }
+    return [_item_from_hit(h) for h in hits]
+
+
+def _fetch_items(chunk_ids: List[str], query_emb: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """
+    Trae del vector store los chunks que encontró solo BM25 y calcula su similitud
+    coseno con la query, así el gate de grounding usa la misma escala.
+    """
+    if not chunk_ids:
+        return {}
+
+    got = vector_store.get(ids=chunk_ids, include=("metadatas", "embeddings"))
+    embeddings = np.asarray(got["embeddings"], dtype=np.float32)
+    q = query_emb / max(float(np.linalg.norm(query_emb)), 1e-12)
+    sims = embeddings @ q / np.maximum(np.linalg.norm(embeddings, axis=1), 1e-12)
+
+    items = {}
+    for cid, meta, sim, emb in zip(got["ids"], got["metadatas"], sims, embeddings):
+        items[cid] = _make_item(cid, meta, sim)
+        items[cid]["embedding"] = emb
+    return items
+
+
+# --------- Diversidad (MMR) ---------
+
+MMR_ENABLED = MMR_LAMBDA < 1.0
+
+
+def _pool_size(n_results: int) -> int:
+    # Con MMR se sobreconsulta para tener de dónde elegir chunks distintos
+    return max(n_results, MMR_CANDIDATES) if MMR_ENABLED else n_results
+
+
+def _diversify(items: List[Dict[str, Any]], relevance: List[float], n_results: int,
+               timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    """
+    Re-rankea el pool con MMR (ver diversity.mmr_select) usando los
+    embeddings que trajo el vector store y se queda con n_results.
+    """
+    if MMR_ENABLED and len(items) > n_results and all("embedding" in item for item in items):
+        with span("mmr", timings):
+            order = mmr_select(np.asarray(relevance, dtype=np.float32),
+                               np.vstack([item["embedding"] for item in items]), n_results, MMR_LAMBDA)
+        items = [items[i] for i in order]
+    items = items[:n_results]
+    for item in items:
+        item.pop("embedding", None)
+    return items
+
+
+def hybrid_search(query: str, query_emb: np.ndarray, n_results: int,
+                  where: Optional[Dict[str, Any]] = None, mode: Optional[str] = None,
+                  timings: Optional[Dict[str, float]] = None,
+                  vector_items: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Recuperación según el modo:
+    - vector: solo el vector store
+    - lexical: solo BM25
+    - hybrid: RETRIEVAL_CANDIDATES de cada uno, fusionados con RRF
+    Con MMR activo se toman los MMR_CANDIDATES mejores y se re-rankean por
+    diversidad (ver _diversify) antes de devolver n_results.
+    similarity_score es siempre el coseno con la query; lexical_score el BM25.
+    Los items no traen el texto del chunk (ver load_chunk_texts).
+    vector_items permite pasar la consulta vectorial ya resuelta (micro-batcher).
+    La latencia de cada etapa se registra en timings (ms).
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo de recuperación desconocido: {mode}")
+    timings = timings if timings is not None else {}
+    pool = _pool_size(n_results)
+
+    if mode == "vector":
+        if vector_items is None:
+            with span("vector", timings):
+                vector_items = _query_collection(query_emb, pool, where)
+        items = vector_items[:pool]
+        return _diversify(items, [item["similarity_score"] for item in items], n_results, timings)
+
+    n_candidates = max(pool, RETRIEVAL_CANDIDATES)
+
+    if mode == "hybrid" and vector_items is None:
+        with span("vector", timings):
+            vector_items = _query_collection(query_emb, n_candidates, where)
+    vector_items = vector_items or []
+
+    with span("lexical", timings):
+        lexical_hits = lexical_index.search(query, n_candidates, where)
+
+    with span("fusion", timings):
+        if mode == "lexical":
+            scored = lexical_hits[:pool]
+        else:
+            scored = reciprocal_rank_fusion(
+                [[item["chunk_id"] for item in vector_items], [cid for cid, _ in lexical_hits]],
+                k=RRF_K,
+            )[:pool]
+        ranked = [cid for cid, _ in scored]
+
+    with span("fetch", timings):
+        known = {item["chunk_id"]: item for item in vector_items}
+        known.update(_fetch_items([cid for cid in ranked if cid not in known], query_emb))
+
+    lexical_scores = dict(lexical_hits)
+    items, relevance = [], []
+    for cid, score in scored:
+        item = known.get(cid)
+        if item is None:
+            # Borrado entre la búsqueda y la lectura
+            continue
+        item["lexical_score"] = lexical_scores.get(cid, 0.0)
+        items.append(item)
+        relevance.append(score)
+
+    return _diversify(items, relevance, n_results, timings)
+
+
+def load_chunk_texts(items: List[Dict[str, Any]],
+                     timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Segunda fase del retrieval: agrega full_chunk y content_snippet a los
+    items desde el store local de textos. Los ids que falten ahí se leen del
+    vector store y se guardan; los chunks borrados entre las dos fases se
+    descartan.
+    """
+    with span("texts", timings):
+        texts = chunk_texts.get_many([item["chunk_id"] for item in items])
+        missing = [item["chunk_id"] for item in items if item["chunk_id"] not in texts]
+        if missing:
+            got = vector_store.get(ids=missing, include=("documents",))
+            chunk_texts.put_many(got["ids"], got["documents"])
+            texts.update(zip(got["ids"], got["documents"]))
+
+    loaded = []
+    for item in items:
+        text = texts.get(item["chunk_id"])
+        if text is None:
+            continue
+        item["full_chunk"] = text
+        item["content_snippet"] = text[:200]
+        loaded.append(item)
+    return loaded
+
+
+def search_similar_chunks(query: str, n_results: int = 5, query_emb: Optional[np.ndarray] = None,
+                          mode: Optional[str] = None, where: Optional[Dict[str, Any]] = None,
+                          timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Busca los n chunks más relevantes para la consulta (ver hybrid_search).
+    Devuelve además los metadatos necesarios para grounding inteligente.
+    Si ya se calculó el embedding de la query puede pasarse en query_emb.
+    """
+    logger.info(f"[SEARCH] Buscando contexto para consulta: '{query}' | modo={mode or RETRIEVAL_MODE}")
+    timings = timings if timings is not None else {}
+
+    # ---- Embed de la query ----
+    if query_emb is None:
+        with span("embed", timings):
+            query_emb = embed_texts([query], input_type="search_query")[0]
+
+    # ---- Búsqueda ----
+    items = hybrid_search(query, query_emb, n_results, where=where, mode=mode, timings=timings)
+    items = load_chunk_texts(items, timings)
+
+    if items:
+        logger.info(
+            f"[SEARCH] Resultados encontrados: {len(items)} | "
+            f"Mejor similitud={max(i['similarity_score'] for i in items):.3f} | etapas={timings}"
         )
 
-    logger.info(
-        f"[SEARCH] Resultados encontrados: {len(items)} | "
-        f"Mejor similitud={max(i['similarity_score'] for i in items):.3f}"
-    )
+    return items
+
 
+async def search_similar_chunks_async(query: str, n_results: int = 5, mode: Optional[str] = None,
+                                      timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Versión async de search_similar_chunks: el embed y la consulta vectorial
+    pasan por los micro-batchers y el resto corre fuera del event loop.
+    """
+    timings = timings if timings is not None else {}
+    with span("embed", timings):
+        query_emb = await embed_batcher.submit(query)
+
+    vector_items = await _batched_vector_query(query_emb, n_results, mode, None, timings)
+    items = await asyncio.to_thread(hybrid_search, query, query_emb, n_results, None, mode, timings, vector_items)
+    items = await asyncio.to_thread(load_chunk_texts, items, timings)
+
+    logger.info(f"[SEARCH] Resultados encontrados: {len(items)} para '{query}' | etapas={timings}")
+    return items
+
+
+# --------- Micro-batching de consultas concurrentes ---------
+
+async def _embed_query_batch(questions: List[str]) -> List[np.ndarray]:
+    # Un solo embed (hasta MICROBATCH_MAX_SIZE textos) para todas las preguntas del lote
+    return list(await embed_texts_async(questions, input_type="search_query"))
+
+
+async def _vector_query_batch(requests: List[tuple]) -> List[List[Dict[str, Any]]]:
+    """
+    requests: [(query_emb, n_results, where)]. Las consultas con el mismo
+    filtro se resuelven con un único query_many al vector store.
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, (_, _, where) in enumerate(requests):
+        groups.setdefault(json.dumps(where, sort_keys=True), []).append(i)
+
+    def run():
+        out: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        for positions in groups.values():
+            where = requests[positions[0]][2]
+            n_results = max(requests[i][1] for i in positions)
+            with span("vector_batch"):
+                hits = vector_store.query_many(np.vstack([requests[i][0] for i in positions]), n_results, where,
+                                               include_embeddings=MMR_ENABLED, include_documents=False)
+            for i, row in zip(positions, hits):
+                out[i] = [_item_from_hit(h) for h in row[:requests[i][1]]]
+        return out
+
+    return await asyncio.to_thread(run)
+
+
+embed_batcher = MicroBatcher(
+    "embed", _embed_query_batch, max_batch=MICROBATCH_MAX_SIZE, max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+)
+vector_batcher = MicroBatcher(
+    "vector", _vector_query_batch, max_batch=MICROBATCH_MAX_SIZE, max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+)
+
+
+async def _batched_vector_query(query_emb: np.ndarray, n_results: int, mode: Optional[str],
+                                where: Optional[Dict[str, Any]],
+                                timings: Dict[str, float]) -> Optional[List[Dict[str, Any]]]:
+    mode = mode or RETRIEVAL_MODE
+    if mode == "lexical":
+        return None
+
+    n = _pool_size(n_results) if mode == "vector" else max(_pool_size(n_results), RETRIEVAL_CANDIDATES)
+    with span("vector", timings):
+        items = await vector_batcher.submit((query_emb, n, where))
     return items
 
-# --------- RAG completo: usado por /ask ---------
+# --------- Prompt del sistema ---------
 
 SYSTEM_PROMPT = f"""
 Eres un Asistente de Orientación Tributaria Municipal especializado en resolver dudas sobre:
@@ -279,68 +878,38 @@ SI EL USUARIO SOLICITA DEFINICIÓN:
 
 """
 
-def rag_answer(question: str) -> Dict[str, Any]:
-    """
-    Pipeline RAG completo con grounding robusto:
-    - Detecta intención de "nota"
-    - Si aplica → restringe búsqueda SOLO a Art 25
-    - Sino → retrieval normal
-    - Evalúa grounding
-    - Genera respuesta segura
-    """
-    logger.info(f"[RAG] Pregunta recibida: '{question}'")
+# --------- Etapas del pipeline RAG ---------
 
-    # -------- DETECCIÓN DE INTENCIÓN DE NOTA --------
-    requires_note = any(w in question.lower() for w in [
-        "nota",
-        "presentar nota",
-        "nota formal",
-        "nota de reclamo",
-        "nota para reclamo",
-        "escribir nota",
-        "carta",
-        "como hago la nota"
-    ])
-
-    # -------- MODO ESPECIAL ART 25 / NOTAS --------
-    if requires_note:
-        logger.info("[RAG] INTENCIÓN DETECTADA: MODO NOTA ACTIVADO")
-
-        # Embedding del query con Cohere (MISMA dimensión que Chroma)
-        emb = co.embed(
-            texts=[question],
-            model="embed-multilingual-v3.0",
-            input_type="search_query",
-            embedding_types=["float"],
-        )
+NO_INFO_ANSWER = "No cuento con información suficiente para responder a esta consulta."
+DEGRADED_ANSWER = (
+    "En este momento hay mucha demanda y no puedo elaborar la respuesta. "
+    "Este es el fragmento más relevante que encontré{source}:"
+)
 
-        query_emb = np.array(emb.embeddings.float, dtype=np.float32).tolist()
 
-        chroma_results = collection.query(
-            query_embeddings=query_emb,
-            n_results=5,
-            where={
-                "tipo_documento": "protocolo_reclamo"     # <-- Art 25
-            }
+def context_filter(question: str, query_emb: np.ndarray,
+                   timings: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Clasifica la intención con el embedding de la consulta (ver intent_router.py):
+    - Si cae en una ruta (p. ej. "nota" → solo el protocolo del Art 25),
+      devuelve su filtro para el retrieval
+    - Sino → retrieval normal (sin filtro)
+    """
+    with span("intent", timings):
+        match = intent_router.classify(query_emb)
+    metrics.inc("rag_intent_total", {"route": match["route"] or "ninguna"},
+                help="Consultas clasificadas por ruta de intención")
+    if match["route"]:
+        logger.info(
+            f"[RAG] INTENCIÓN DETECTADA: ruta '{match['route']}' "
+            f"(score={match['score']:.3f}, margen={match['margin']:.3f}) | '{question[:60]}'"
         )
+        logger.info(f"[RAG] CONTEXTO RESTRINGIDO A {match['where']}")
+        return match["where"]
+    return None
 
-        results = []
-        for i in range(len(chroma_results["ids"][0])):
-            results.append({
-                "full_chunk": chroma_results["documents"][0][i],
-                "similarity_score": 1 - chroma_results["distances"][0][i],
-                "tramite": chroma_results["metadatas"][0][i].get("tramite"),
-                "tipo_documento": chroma_results["metadatas"][0][i].get("tipo_documento"),
-                "title": chroma_results["metadatas"][0][i].get("title"),
-                "chunk_id": chroma_results["ids"][0][i]
-            })
-
-        logger.info("[RAG] CONTEXTO RESTRINGIDO EXCLUSIVAMENTE A ART 25")
-
-    # -------- FLUJO NORMAL --------
-    else:
-        results = search_similar_chunks(question, n_results=5)
 
+def _log_context(results: List[Dict[str, Any]]):
     # ---- DEBUG ----
     logger.info("[RAG] Contexto recuperado para responder:")
     for i, r in enumerate(results):
@@ -353,22 +922,64 @@ def rag_answer(question: str) -> Dict[str, Any]:
         except Exception as e:
             logger.warning(f"[RAG] No se pudo loguear chunk {i}: {e}")
 
+
+def answer_scope(mode: Optional[str], where: Optional[Dict[str, Any]]) -> str:
+    """
+    Scope de la cache semántica: una respuesta solo se reutiliza para una
+    pregunta recuperada con el mismo modo y el mismo filtro de intención.
+    """
+    return json.dumps({"mode": mode or RETRIEVAL_MODE, "where": where}, sort_keys=True, ensure_ascii=False)
+
+
+def retrieve_context(question: str, query_emb: np.ndarray, mode: Optional[str] = None,
+                     timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Primera fase de la recuperación de contexto (en el modo pedido, ver
+    hybrid_search), con el filtro de intención si corresponde: ids, scores y
+    metadatos, suficientes para el gate de grounding. Los textos se cargan
+    después con build_context, solo si el gate pasa.
+    """
+    where = context_filter(question, query_emb, timings)
+    return _retrieve(question, query_emb, where, mode, timings)
+
+
+async def retrieve_context_async(question: str, query_emb: np.ndarray, mode: Optional[str] = None,
+                                 timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Igual que retrieve_context, pero la consulta vectorial pasa por el
+    micro-batcher y se agrupa con las de otros requests concurrentes.
+    """
+    timings = timings if timings is not None else {}
+    where = context_filter(question, query_emb, timings)
+    return await _retrieve_async(question, query_emb, where, mode, timings)
+
+
+def _retrieve(question: str, query_emb: np.ndarray, where: Optional[Dict[str, Any]], mode: Optional[str],
+              timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    return hybrid_search(question, query_emb, 5, where=where, mode=mode, timings=timings)
+
+
+async def _retrieve_async(question: str, query_emb: np.ndarray, where: Optional[Dict[str, Any]],
+                          mode: Optional[str], timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    vector_items = await _batched_vector_query(query_emb, 5, mode, where, timings)
+    return await asyncio.to_thread(hybrid_search, question, query_emb, 5, where, mode, timings, vector_items)
+
+
+def evaluate_grounding(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Evalúa si el contexto recuperado alcanza para responder:
+    mejor score, promedio y consistencia de metadatos.
+    Solo usa scores y metadatos: context_text queda vacío hasta build_context.
+    """
     if not results:
         logger.warning("[RAG] No se encontraron resultados. Respuesta sin grounding.")
-        return {
-            "answer": "No cuento con información suficiente para responder a esta consulta.",
-            "context_used": "",
-            "similarity_score": 0.0,
-            "grounded": False,
-        }
+        return {"confianza": False, "best_score": 0.0, "avg_score": 0.0, "context_text": ""}
 
     # -------- SIMILITUD ---------- 
     scores = [r["similarity_score"] for r in results]
     best_score = max(scores)
     avg_score = sum(scores) / len(scores)
 
-    context_text = "\n\n".join(r["full_chunk"] for r in results)
-
     # -------- CONSISTENCIA DE METADATOS --------
     tramites = [r["tramite"] for r in results if r.get("tramite")]
     tipo_docs = [r["tipo_documento"] for r in results if r.get("tipo_documento")]
@@ -387,48 +998,391 @@ def rag_answer(question: str) -> Dict[str, Any]:
         f"tramite_consistente={tramite_consistente} | tipo_consistente={tipo_consistente}"
     )
 
-    # -------- Grounding insuficiente --------
     if not confianza:
         logger.warning("[RAG] Grounding insuficiente. Se responde seguro sin inventar.")
-        return {
-            "answer": "No cuento con información suficiente para responder a esta consulta.",
-            "context_used": context_text[:400],
-            "similarity_score": float(best_score),
-            "grounded": False,
-        }
 
-    # -------- LLM --------
+    return {
+        "confianza": confianza,
+        "best_score": float(best_score),
+        "avg_score": float(avg_score),
+        "context_text": "",
+    }
+
+
+def build_context(results: List[Dict[str, Any]], grounding: Dict[str, Any],
+                  timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Segunda fase, solo con grounding suficiente: carga los textos de los
+    chunks y arma el contexto del prompt (ver context_assembly) en
+    grounding["context_text"]. Devuelve los resultados con texto.
+    """
+    results = load_chunk_texts(results, timings)
+    _log_context(results)
+
+    # Chunks consecutivos unidos sin solapamiento y recortados al presupuesto de tokens
+    with span("context", timings):
+        context_text, context_stats = assemble_context(
+            results,
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            chars_per_token=CONTEXT_CHARS_PER_TOKEN,
+            merge_adjacent=CONTEXT_MERGE_ADJACENT,
+        )
+    metrics.inc("rag_context_chars_total", {"kind": "retrieved"}, context_stats["raw_chars"],
+                help="Caracteres de contexto recuperados y enviados al LLM")
+    metrics.inc("rag_context_chars_total", {"kind": "sent"}, context_stats["chars"])
+
+    grounding["context_text"] = context_text
+    grounding["context_stats"] = context_stats
+    return results
+
+
+def ungrounded_result(grounding: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "answer": NO_INFO_ANSWER,
+        "context_used": grounding["context_text"][:400],
+        "similarity_score": grounding["best_score"],
+        "grounded": False,
+    }
+
+
+def build_chat_messages(question: str, context_text: str) -> List[Dict[str, str]]:
     user_prompt = f"""
 Contexto de las historias:
 \"\"\"{context_text}\"\"\"\n
 Pregunta:
 {question}
 """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    logger.info("[RAG] Enviando prompt al modelo Cohere.")
 
-    chat_resp = co.chat(
-        model="command-r-plus-08-2024",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0,
-        max_tokens=400,
-    )
+def grounded_result(answer_text: str, grounding: Dict[str, Any], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Vacío solo si todos los chunks se borraron entre las dos fases del retrieval
+    best_chunk = max(results, key=lambda r: r["similarity_score"], default={})
 
-    answer_text = chat_resp.message.content[0].text.strip()
+    return {
+        "answer": answer_text,
+        "context_used": grounding["context_text"][:400],
+        "similarity_score": grounding["best_score"],
+        "grounded": True,
+        "source_document": best_chunk.get("title"),
+        "chunk_id": best_chunk.get("chunk_id")
+    }
 
-    logger.info("[RAG] Respuesta generada con grounding=True")
 
-    best_chunk = max(results, key=lambda r: r["similarity_score"])
+def degraded_result(grounding: Dict[str, Any], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Respuesta sin LLM cuando el control de admisión rechaza el request:
+    el texto del chunk más relevante, con su documento de origen.
+    """
+    best_chunk = max(results, key=lambda r: r["similarity_score"], default={})
+    source = f" en «{best_chunk['title']}»" if best_chunk.get("title") else ""
+    excerpt = best_chunk.get("full_chunk", "")[:DEGRADED_ANSWER_CHARS].strip()
 
     return {
-        "answer": answer_text,
-        "context_used": context_text[:400],
-        "similarity_score": float(best_score),
+        "answer": f"{DEGRADED_ANSWER.format(source=source)}\n\n{excerpt}",
+        "context_used": grounding["context_text"][:400],
+        "similarity_score": grounding["best_score"],
         "grounded": True,
+        "degraded": True,
         "source_document": best_chunk.get("title"),
         "chunk_id": best_chunk.get("chunk_id")
     }
 
+# --------- RAG completo ---------
+
+def rag_answer(question: str, mode: Optional[str] = None, priority: str = "interactive") -> Dict[str, Any]:
+    """
+    Pipeline RAG completo con grounding robusto:
+    - Detecta intención de "nota"
+    - Si aplica → restringe búsqueda SOLO a Art 25
+    - Sino → retrieval normal
+    - Evalúa grounding
+    - Genera respuesta segura (con lugar en el carril priority del control
+      de admisión; sin lugar, respuesta degradada con el chunk más relevante)
+    Las respuestas fundamentadas se guardan en la cache semántica.
+    La latencia por etapa se devuelve en timings_ms.
+    """
+    logger.info(f"[RAG] Pregunta recibida: '{question}'")
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    # -------- EMBEDDING DE LA PREGUNTA + CACHE SEMÁNTICA --------
+    with span("embed", timings):
+        query_emb = embed_texts([question], input_type="search_query")[0]
+
+    # La intención se clasifica antes de la cache: su filtro forma parte del scope
+    where = context_filter(question, query_emb, timings)
+    scope = answer_scope(mode, where)
+    cached = answer_cache.lookup(query_emb, scope)
+    if cached is not None:
+        logger.info("[RAG] Respuesta servida desde cache semántica.")
+        return _with_timings(cached, timings, started, cache_hit=True)
+
+    results = _retrieve(question, query_emb, where, mode, timings)
+    with span("grounding", timings):
+        grounding = evaluate_grounding(results)
+
+    # -------- Grounding insuficiente: no se leen los textos --------
+    if not grounding["confianza"]:
+        return _with_timings(ungrounded_result(grounding), timings, started)
+
+    results = build_context(results, grounding, timings)
+
+    # -------- LLM --------
+    logger.info("[RAG] Enviando prompt al modelo Cohere.")
+
+    try:
+        with admission.slot(priority) as waited:
+            timings["admission_ms"] = round(waited * 1000, 2)
+            with span("chat", timings):
+                chat_resp = cohere_client.chat(
+                    model=CHAT_MODEL,
+                    messages=build_chat_messages(question, grounding["context_text"]),
+                    temperature=0,
+                    max_tokens=400,
+                )
+    except AdmissionRejected as e:
+        timings["admission_ms"] = round(e.waited * 1000, 2)
+        return _with_timings(degraded_result(grounding, results), timings, started)
+
+    answer_text = chat_resp.message.content[0].text.strip()
+
+    logger.info("[RAG] Respuesta generada con grounding=True")
+
+    result = grounded_result(answer_text, grounding, results)
+    answer_cache.store(question, query_emb, result, [r["chunk_id"] for r in results], scope)
+
+    return _with_timings(result, timings, started)
+
+
+async def rag_answer_async(question: str, mode: Optional[str] = None,
+                           priority: str = "interactive") -> Dict[str, Any]:
+    """
+    Mismo pipeline que rag_answer pero sin bloquear el event loop:
+    embed y chat con el cliente async de Cohere, retrieval en un hilo.
+    """
+    logger.info(f"[RAG] Pregunta recibida (async): '{question}'")
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    with span("embed", timings):
+        query_emb = await embed_batcher.submit(question)
+
+    where = context_filter(question, query_emb, timings)
+    scope = answer_scope(mode, where)
+    cached = answer_cache.lookup(query_emb, scope)
+    if cached is not None:
+        logger.info("[RAG] Respuesta servida desde cache semántica.")
+        return _with_timings(cached, timings, started, cache_hit=True)
+
+    results = await _retrieve_async(question, query_emb, where, mode, timings)
+    with span("grounding", timings):
+        grounding = evaluate_grounding(results)
+
+    if not grounding["confianza"]:
+        return _with_timings(ungrounded_result(grounding), timings, started)
+
+    results = await asyncio.to_thread(build_context, results, grounding, timings)
+
+    logger.info("[RAG] Enviando prompt al modelo Cohere (async).")
+
+    try:
+        async with admission.slot_async(priority) as waited:
+            timings["admission_ms"] = round(waited * 1000, 2)
+            with span("chat", timings):
+                chat_resp = await cohere_client.chat_async(
+                    model=CHAT_MODEL,
+                    messages=build_chat_messages(question, grounding["context_text"]),
+                    temperature=0,
+                    max_tokens=400,
+                )
+    except AdmissionRejected as e:
+        timings["admission_ms"] = round(e.waited * 1000, 2)
+        return _with_timings(degraded_result(grounding, results), timings, started)
+
+    answer_text = chat_resp.message.content[0].text.strip()
+
+    logger.info("[RAG] Respuesta generada con grounding=True")
+
+    result = grounded_result(answer_text, grounding, results)
+    answer_cache.store(question, query_emb, result, [r["chunk_id"] for r in results], scope)
+
+    return _with_timings(result, timings, started)
+
+
+async def rag_answer_stream(question: str, mode: Optional[str] = None,
+                            priority: str = "interactive") -> AsyncIterator[Dict[str, Any]]:
+    """
+    Variante streaming de rag_answer_async.
+    Ejecuta retrieval y gate de grounding igual que rag_answer y luego emite
+    eventos {"event": "token", "data": {"text": ...}} a medida que el LLM
+    genera, terminando con {"event": "metadata", "data": {...}} que lleva
+    grounded, degraded, similarity_score, source_document, chunk_id,
+    context_used y timings_ms.
+    """
+    logger.info(f"[RAG] Pregunta recibida (stream): '{question}'")
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    with span("embed", timings):
+        query_emb = await embed_batcher.submit(question)
+
+    where = context_filter(question, query_emb, timings)
+    scope = answer_scope(mode, where)
+    cached = answer_cache.lookup(query_emb, scope)
+    if cached is not None:
+        logger.info("[RAG] Respuesta servida desde cache semántica.")
+        yield {"event": "token", "data": {"text": cached["answer"]}}
+        yield {"event": "metadata", "data": _stream_metadata(_with_timings(cached, timings, started, cache_hit=True))}
+        return
+
+    results = await _retrieve_async(question, query_emb, where, mode, timings)
+    with span("grounding", timings):
+        grounding = evaluate_grounding(results)
+
+    if not grounding["confianza"]:
+        result = _with_timings(ungrounded_result(grounding), timings, started)
+        yield {"event": "token", "data": {"text": result["answer"]}}
+        yield {"event": "metadata", "data": _stream_metadata(result)}
+        return
+
+    results = await asyncio.to_thread(build_context, results, grounding, timings)
+
+    logger.info("[RAG] Enviando prompt al modelo Cohere (stream).")
+
+    parts: List[str] = []
+    try:
+        async with admission.slot_async(priority) as waited:
+            timings["admission_ms"] = round(waited * 1000, 2)
+            with span("chat", timings):
+                t0 = time.perf_counter()
+                async for event in cohere_client.chat_stream(
+                    model=CHAT_MODEL,
+                    messages=build_chat_messages(question, grounding["context_text"]),
+                    temperature=0,
+                    max_tokens=400,
+                ):
+                    if event.type == "content-delta":
+                        text = event.delta.message.content.text
+                        if text:
+                            if not parts:
+                                metrics.observe("first_token", time.perf_counter() - t0)
+                                timings["first_token_ms"] = _elapsed_ms(t0)
+                            parts.append(text)
+                            yield {"event": "token", "data": {"text": text}}
+    except AdmissionRejected as e:
+        timings["admission_ms"] = round(e.waited * 1000, 2)
+        result = _with_timings(degraded_result(grounding, results), timings, started)
+        yield {"event": "token", "data": {"text": result["answer"]}}
+        yield {"event": "metadata", "data": _stream_metadata(result)}
+        return
+
+    logger.info("[RAG] Respuesta generada con grounding=True (stream)")
+
+    result = grounded_result("".join(parts).strip(), grounding, results)
+    answer_cache.store(question, query_emb, result, [r["chunk_id"] for r in results], scope)
+
+    yield {"event": "metadata", "data": _stream_metadata(_with_timings(result, timings, started))}
+
+
+async def rag_answer_batch(questions: List[str], mode: Optional[str] = None,
+                           priority: str = "batch") -> List[Dict[str, Any]]:
+    """
+    Responde varias preguntas a la vez. Al lanzarse en paralelo, los embeds
+    y las consultas vectoriales se agrupan en los micro-batchers (un embed
+    de hasta MICROBATCH_MAX_SIZE textos y un query_many por filtro); los
+    llamados al LLM corren concurrentemente dentro del carril priority.
+    """
+    logger.info(f"[RAG] Lote de {len(questions)} preguntas recibido")
+    return list(await asyncio.gather(*[rag_answer_async(q, mode, priority) for q in questions]))
+
+
+def _with_timings(result: Dict[str, Any], timings: Dict[str, float], started: float,
+                  cache_hit: bool = False) -> Dict[str, Any]:
+    """
+    Copia del resultado con la latencia por etapa; la copia evita que los
+    tiempos queden guardados en la cache semántica.
+    Registra la latencia total y el desenlace de la respuesta en las métricas.
+    """
+    elapsed = time.perf_counter() - started
+    metrics.observe("total", elapsed)
+    source = "cache" if cache_hit else "degraded" if result.get("degraded") else "pipeline"
+    metrics.inc(
+        "rag_answers_total",
+        {"grounded": str(result["grounded"]).lower(), "source": source},
+        help="Respuestas del pipeline RAG por desenlace",
+    )
+    timings["total_ms"] = round(elapsed * 1000, 2)
+    logger.info(f"[RAG] Latencia por etapa (ms): {timings}")
+    return {**result, "timings_ms": timings}
+
+
+def _stream_metadata(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "grounded": result["grounded"],
+        "degraded": result.get("degraded", False),
+        "similarity_score": result["similarity_score"],
+        "source_document": result.get("source_document"),
+        "chunk_id": result.get("chunk_id"),
+        "context_used": result["context_used"],
+        "timings_ms": result.get("timings_ms"),
+    }
+
+
+# --------- Métricas exportadas desde los componentes ---------
+
+def _component_metrics():
+    """
+    Valores que ya cuentan las caches, los micro-batchers y los índices;
+    se leen al exportar en vez de duplicar los contadores.
+    """
+    answers = answer_cache.stats()
+    yield ("rag_cache_hits_total", "counter", "Aciertos de cache", {"cache": "answer"}, answers["hits"])
+    yield ("rag_cache_misses_total", "counter", "Fallos de cache", {"cache": "answer"}, answers["misses"])
+    # Los componentes que todavía se están inicializando no se esperan
+    if embedding_cache.ready:
+        embeds = embedding_cache.stats()
+        yield ("rag_cache_hits_total", "counter", "Aciertos de cache", {"cache": "embedding"},
+               embeds["memory_hits"] + embeds["disk_hits"])
+        yield ("rag_cache_misses_total", "counter", "Fallos de cache", {"cache": "embedding"}, embeds["misses"])
+
+    for batcher in (embed_batcher, vector_batcher):
+        stats = batcher.stats()
+        yield ("rag_microbatch_batches_total", "counter", "Lotes despachados por micro-batcher",
+               {"batcher": batcher.name}, stats["batches"])
+        yield ("rag_microbatch_items_total", "counter", "Items agrupados por micro-batcher",
+               {"batcher": batcher.name}, stats["items"])
+
+    if vector_store.ready:
+        yield ("rag_indexed_chunks", "gauge", "Chunks indexados", {"index": vector_store.name}, vector_store.count())
+    if lexical_index.ready:
+        yield ("rag_indexed_chunks", "gauge", "Chunks indexados", {"index": "bm25"}, len(lexical_index))
+    for op, stats in cohere_client.stats().items():
+        yield ("rag_cohere_circuit_open", "gauge", "Circuit breaker de Cohere abierto (1) o no (0)",
+               {"op": op}, 1.0 if stats["circuit"] == "open" else 0.0)
+        yield ("rag_cohere_in_flight", "gauge", "Requests a Cohere en vuelo", {"op": op}, stats["in_flight"])
+
+    if chunk_texts.ready:
+        texts = chunk_texts.stats()
+        yield ("rag_cache_hits_total", "counter", "Aciertos de cache", {"cache": "chunk_text"},
+               texts["memory_hits"] + texts["disk_hits"])
+        yield ("rag_cache_misses_total", "counter", "Fallos de cache", {"cache": "chunk_text"}, texts["misses"])
+        yield ("rag_indexed_chunks", "gauge", "Chunks indexados", {"index": "chunk_texts"}, texts["chunks"])
+
+    admitted = admission.stats()
+    for lane, depth in admitted["queued"].items():
+        yield ("rag_admission_queue_depth", "gauge", "Requests esperando lugar para el LLM", {"lane": lane}, depth)
+        yield ("rag_admission_in_flight", "gauge", "Requests usando el LLM", {"lane": lane},
+               admitted["in_flight"][lane])
+        yield ("rag_admission_admitted_total", "counter", "Requests admitidos a la etapa LLM", {"lane": lane},
+               admitted["admitted"][lane])
+
+    if intent_router.ready:
+        yield ("rag_intent_centroids", "gauge", "Centroides tipo_documento/tramite del router de intención",
+               {}, intent_router.stats()["groups"])
+
+
+metrics.add_collector(_component_metrics)
@@ -0,0 +1,370 @@
+"""
+Snapshot portable del índice en un solo archivo versionado, para levantar
+réplicas sin copiar chroma_db/ ni volver a embeber el corpus.
+
+Formato (versión 1, enteros little-endian):
+
+    [MAGIC 8 bytes][reservado 8 bytes]
+    secciones, cada una alineada a 64 bytes:
+      vectors          float32 (count, dim), filas normalizadas, contiguas
+      ids.offsets      uint64 (count + 1)  ┐
+      ids.data         utf-8               │ fila i = data[offsets[i]:offsets[i + 1]]
+      documents.*      ídem con el texto   │
+      metadatas.*      ídem con JSON       ┘
+    manifest JSON: formato, versión, modelo de embeddings, dim, count y
+      {offset, length, dtype, sha256} de cada sección
+    trailer: [offset del manifest u64][largo del manifest u64][MAGIC 8 bytes]
+
+Abrir un snapshot (SnapshotReader) lee solo el trailer y el manifest y
+mapea el archivo con mmap: los vectores son un np.frombuffer sobre el
+mapa y los textos se decodifican por fila cuando se piden. Las sumas
+sha256 se verifican aparte (verify), porque recorren todo el archivo.
+
+    python -m snapshot export indice.ragsnap     # desde el VECTOR_STORE configurado
+    python -m snapshot info indice.ragsnap
+    python -m snapshot verify indice.ragsnap
+    python -m snapshot import indice.ragsnap     # copia al VECTOR_STORE configurado
+
+Con VECTOR_STORE=snapshot y SNAPSHOT_PATH el servicio lo abre directamente
+(ver vector_store.SnapshotVectorStore).
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("SNAPSHOT")
+# ---------------------------------------------------------
+
+FORMAT = "rag-index-snapshot"
+VERSION = 1
+MAGIC = b"RAGSNAP\x01"
+_HEADER = MAGIC + b"\x00" * 8
+_TRAILER = struct.Struct("<QQ8s")
+_ALIGN = 64
+
+BLOB_SECTIONS = ("ids", "documents", "metadatas")
+
+
+class SnapshotError(Exception):
+    """Archivo que no es un snapshot, de otra versión o con checksums inválidos."""
+
+
+# --------- Escritura ---------
+
+class _SectionWriter:
+    def __init__(self, f):
+        self.f = f
+        self.sections: Dict[str, Dict[str, Any]] = {}
+
+    def begin(self, name: str, dtype: str):
+        padding = -self.f.tell() % _ALIGN
+        self.f.write(b"\x00" * padding)
+        self.sections[name] = {"offset": self.f.tell(), "length": 0, "dtype": dtype}
+        self._hash = hashlib.sha256()
+        self._name = name
+
+    def write(self, data: bytes):
+        self.f.write(data)
+        self._hash.update(data)
+        self.sections[self._name]["length"] += len(data)
+
+    def end(self):
+        self.sections[self._name]["sha256"] = self._hash.hexdigest()
+
+    def blob(self, name: str, values: List[bytes]):
+        offsets = np.zeros(len(values) + 1, dtype="<u8")
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+        self.begin(f"{name}.offsets", "uint64")
+        self.write(offsets.tobytes())
+        self.end()
+        self.begin(f"{name}.data", "utf-8")
+        for value in values:
+            self.write(value)
+        self.end()
+
+
+def write_snapshot(path: str, pages: Iterable[Dict[str, Any]], embed_model: str,
+                   extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Escribe el snapshot a partir de páginas al estilo VectorStore.get
+    (ids, documents, metadatas, embeddings). Los vectores se escriben a
+    medida que llegan; textos y metadatos se acumulan hasta el final.
+    Se escribe en un temporal y se renombra, así nunca queda un snapshot a medias.
+    Devuelve el manifest.
+    """
+    ids: List[bytes] = []
+    documents: List[bytes] = []
+    metadatas: List[bytes] = []
+    dim = None
+    tmp = f"{path}.tmp"
+
+    with open(tmp, "wb") as f:
+        f.write(_HEADER)
+        writer = _SectionWriter(f)
+        writer.begin("vectors", "float32")
+        for page in pages:
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if not len(vectors):
+                continue
+            if dim is None:
+                dim = int(vectors.shape[1])
+            elif vectors.shape[1] != dim:
+                raise SnapshotError(f"Dimensión inconsistente: {vectors.shape[1]} != {dim}")
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            writer.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+            ids.extend(i.encode("utf-8") for i in page["ids"])
+            documents.extend(d.encode("utf-8") for d in page["documents"])
+            metadatas.extend(json.dumps(m, ensure_ascii=False).encode("utf-8") for m in page["metadatas"])
+        writer.end()
+
+        writer.blob("ids", ids)
+        writer.blob("documents", documents)
+        writer.blob("metadatas", metadatas)
+
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "embed_model": embed_model,
+            "dim": dim or 0,
+            "count": len(ids),
+            "sections": writer.sections,
+            **(extra or {}),
+        }
+        padding = -f.tell() % _ALIGN
+        f.write(b"\x00" * padding)
+        manifest_offset = f.tell()
+        raw = json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")
+        f.write(raw)
+        f.write(_TRAILER.pack(manifest_offset, len(raw), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+    return manifest
+
+
+# --------- Lectura ---------
+
+class SnapshotReader:
+    """
+    Snapshot abierto con mmap (solo lectura). vectors es una vista sobre el
+    archivo; ids, textos y metadatos se decodifican por fila.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError(f"{path}: archivo vacío")
+
+        size = len(self._map)
+        if size < len(_HEADER) + _TRAILER.size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise SnapshotError(f"{path}: no es un snapshot del índice (versión {VERSION})")
+        manifest_offset, manifest_len, magic = _TRAILER.unpack(self._map[size - _TRAILER.size:])
+        if magic != MAGIC or manifest_offset + manifest_len > size - _TRAILER.size:
+            self.close()
+            raise SnapshotError(f"{path}: trailer inválido (¿archivo truncado?)")
+
+        self.manifest: Dict[str, Any] = json.loads(self._map[manifest_offset:manifest_offset + manifest_len])
+        if self.manifest.get("format") != FORMAT or self.manifest.get("version") != VERSION:
+            self.close()
+            raise SnapshotError(
+                f"{path}: formato {self.manifest.get('format')} v{self.manifest.get('version')} no soportado"
+            )
+
+        self.count: int = self.manifest["count"]
+        self.dim: int = self.manifest["dim"]
+        self.embed_model: str = self.manifest["embed_model"]
+        self.vectors = self._array("vectors", "<f4").reshape(self.count, self.dim)
+        self._offsets = {name: self._array(f"{name}.offsets", "<u8") for name in BLOB_SECTIONS}
+
+    def _array(self, name: str, dtype: str) -> np.ndarray:
+        section = self.manifest["sections"][name]
+        count = section["length"] // np.dtype(dtype).itemsize
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=section["offset"])
+
+    def _value(self, name: str, row: int) -> str:
+        offsets = self._offsets[name]
+        start = self.manifest["sections"][f"{name}.data"]["offset"]
+        return self._map[start + int(offsets[row]):start + int(offsets[row + 1])].decode("utf-8")
+
+    def ids(self) -> List[str]:
+        section = self.manifest["sections"]["ids.data"]
+        raw = self._map[section["offset"]:section["offset"] + section["length"]]
+        text = raw.decode("utf-8")
+        if len(text) != len(raw):
+            # Con caracteres multibyte los offsets en bytes no sirven sobre el str
+            return [self._value("ids", row) for row in range(self.count)]
+        offsets = self._offsets["ids"].tolist()
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def document(self, row: int) -> str:
+        return self._value("documents", row)
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._value("metadatas", row))
+
+    def metadatas(self) -> "LazyMetadatas":
+        return LazyMetadatas(self)
+
+    def pages(self, page_size: int = 1000):
+        """
+        Páginas al estilo VectorStore.get, para importar en otro store.
+        """
+        ids = self.ids()
+        for start in range(0, self.count, page_size):
+            rows = range(start, min(start + page_size, self.count))
+            yield {
+                "ids": ids[start:rows.stop],
+                "documents": [self.document(r) for r in rows],
+                "metadatas": [self.metadata(r) for r in rows],
+                "embeddings": np.array(self.vectors[start:rows.stop]),
+            }
+
+    def verify(self) -> List[str]:
+        """
+        Recalcula la sha256 de cada sección; devuelve las que no coinciden.
+        """
+        bad = []
+        for name, section in self.manifest["sections"].items():
+            data = self._map[section["offset"]:section["offset"] + section["length"]]
+            if hashlib.sha256(data).hexdigest() != section["sha256"]:
+                bad.append(name)
+        return bad
+
+    def close(self):
+        # Las vistas numpy sobre el mapa deben soltarse antes de cerrarlo
+        self.vectors = None
+        self._offsets = {}
+        try:
+            self._map.close()
+        except (AttributeError, BufferError):
+            pass
+        self._file.close()
+
+
+class LazyMetadatas:
+    """
+    Secuencia de los metadatos del snapshot que decodifica cada fila la
+    primera vez que se pide: abrir el snapshot no parsea el JSON de todas
+    las filas, solo las que devuelve una búsqueda (o todas, la primera vez
+    que se arma la máscara de un filtro).
+    """
+
+    def __init__(self, reader: SnapshotReader):
+        self._reader = reader
+        self._rows: List[Optional[Dict[str, Any]]] = [None] * reader.count
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        meta = self._rows[row]
+        if meta is None:
+            meta = self._rows[row] = self._reader.metadata(row)
+        return meta
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self._rows)))
+
+    def decoded(self) -> int:
+        return sum(1 for meta in self._rows if meta is not None)
+
+
+# --------- CLI ---------
+
+def _export(path: str, page_size: int) -> Dict[str, Any]:
+    from config import EMBED_MODEL
+    from vector_store import create_vector_store
+
+    store = create_vector_store()
+
+    def pages():
+        offset = 0
+        while True:
+            page = store.get(include=("documents", "metadatas", "embeddings"), limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
+
+    return write_snapshot(path, pages(), EMBED_MODEL, extra={"source_store": store.name})
+
+
+def _import(path: str, page_size: int) -> Tuple[int, str]:
+    from config import EMBED_MODEL, VECTOR_STORE
+    from vector_store import create_vector_store
+
+    if VECTOR_STORE == "snapshot":
+        raise SnapshotError("VECTOR_STORE=snapshot es de solo lectura; importar en chroma o numpy")
+    reader = SnapshotReader(path)
+    try:
+        if reader.embed_model != EMBED_MODEL:
+            raise SnapshotError(f"El snapshot usa {reader.embed_model} y el servicio {EMBED_MODEL}")
+        bad = reader.verify()
+        if bad:
+            raise SnapshotError(f"Checksums inválidos en: {', '.join(bad)}")
+
+        store = create_vector_store()
+        if store.count():
+            # Chroma ignora ids repetidos: importar sobre un índice con datos lo mezclaría
+            raise SnapshotError(f"El store {store.name} ya tiene {store.count()} chunks; importar en uno vacío")
+        imported = 0
+        for page in reader.pages(page_size):
+            store.add(page["ids"], page["documents"], page["embeddings"], page["metadatas"])
+            imported += len(page["ids"])
+    finally:
+        reader.close()
+    return imported, store.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshots portables del índice")
+    parser.add_argument("command", choices=("export", "import", "verify", "info"))
+    parser.add_argument("path")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+
+    t0 = time.perf_counter()
+    if args.command == "export":
+        manifest = _export(args.path, args.page_size)
+        logger.info(
+            f"[SNAPSHOT] {manifest['count']} chunks exportados a {args.path} "
+            f"({os.path.getsize(args.path) / 1e6:.1f} MB) en {time.perf_counter() - t0:.2f}s"
+        )
+    elif args.command == "import":
+        imported, store_name = _import(args.path, args.page_size)
+        logger.info(f"[SNAPSHOT] {imported} chunks importados al store {store_name} en {time.perf_counter() - t0:.2f}s")
+    else:
+        reader = SnapshotReader(args.path)
+        opened_ms = (time.perf_counter() - t0) * 1000
+        try:
+            if args.command == "info":
+                info = {k: v for k, v in reader.manifest.items() if k != "sections"}
+                print(json.dumps({**info, "opened_ms": round(opened_ms, 2)}, ensure_ascii=False, indent=1))
+            else:
+                bad = reader.verify()
+                print(f"{args.path}: " + (f"checksums inválidos en {', '.join(bad)}" if bad else "checksums OK"))
+                if bad:
+                    raise SystemExit(1)
+        finally:
+            reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,331 @@
-from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from chunking import PAGE_BREAK, chunk_document_pages_timed
+from config import DOCUMENTS_DB_PATH, DOCUMENTS_DIR, DOCUMENTS_COMPRESSION_LEVEL
 
 # ------------------------ LOGGING ------------------------
 import logging
 logger = logging.getLogger("STORAGE")
 # ---------------------------------------------------------
 
-# Diccionario global donde guardamos los documentos subidos.
-# Clave: document_id (str)
-# Valor: dict con title, content, chunks, embedding_ids
+# Formato de cada archivo de documento:
+#   MAGIC | largo del header (uint32) | header JSON | texto comprimido con zlib
+# El header alcanza para reconstruir el catálogo sin descomprimir el texto.
+_MAGIC = b"ATMDOC1\n"
+_HEADER_LEN = struct.Struct(">I")
+
+
+class StoredDocument(dict):
+    """
+    Documento del catálogo: dict con los metadatos (id, title, embedding_ids...).
+    El texto completo se lee de disco recién al acceder a doc["content"]
+    y no queda retenido en memoria.
+    """
+
+    def __init__(self, store: "DocumentStore", meta: Dict[str, Any]):
+        super().__init__(meta)
+        self._store = store
+
+    def __getitem__(self, key):
+        if key == "content":
+            return self._store.read_content(self["id"])
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key == "content":
+            return self._store.read_content(self["id"])
+        return super().get(key, default)
+
+    @property
+    def path(self) -> str:
+        return self._store._path(self["id"])
+
+
+class DocumentStore:
+    """
+    Almacenamiento persistente de documentos:
+    - Catálogo en SQLite (título, tamaño, hash, ids de chunks, archivo de origen y su sha256)
+    - Texto comprimido con zlib en DOCUMENTS_DIR/{doc_id}.doc
+
+    Los textos se escriben de forma atómica (archivo temporal + rename).
+    """
+
+    def __init__(self, db_path: str, documents_dir: str, compression_level: int = 6):
+        self.documents_dir = documents_dir
+        self.compression_level = compression_level
+        os.makedirs(documents_dir, exist_ok=True)
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                content_sha256 TEXT NOT NULL,
+                content_chars INTEGER NOT NULL,
+                stored_bytes INTEGER NOT NULL,
+                source_file TEXT,
+                source_sha256 TEXT,
+                embedding_ids TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # Catálogos creados antes de guardar la huella del archivo de origen
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(documents)")}
+        if "source_sha256" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN source_sha256 TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_source_sha256 ON documents(source_sha256)")
+        self._conn.commit()
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.documents_dir, f"{doc_id}.doc")
+
+    # --------- Escritura ---------
+
+    def save(self, doc_id: str, title: str, content: Union[str, List[str]], source_file: Optional[str] = None,
+             source_sha256: Optional[str] = None):
+        """
+        content puede ser el texto completo o la lista de páginas; las páginas
+        se comprimen de a una, separadas por PAGE_BREAK, sin concatenarlas.
+        source_sha256: huella del archivo de origen (ver find_by_source).
+        """
+        now = time.time()
+        parts = [content] if isinstance(content, str) else _with_page_breaks(content)
+
+        digest = hashlib.sha256()
+        compressor = zlib.compressobj(self.compression_level)
+        body: List[bytes] = []
+        chars = 0
+        for part in parts:
+            raw = part.encode("utf-8")
+            digest.update(raw)
+            chars += len(part)
+            body.append(compressor.compress(raw))
+        body.append(compressor.flush())
+
+        header = {
+            "id": doc_id,
+            "title": title,
+            "content_sha256": digest.hexdigest(),
+            "content_chars": chars,
+            "source_file": source_file,
+            "source_sha256": source_sha256,
+            "created_at": now,
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        blob = b"".join([_MAGIC, _HEADER_LEN.pack(len(header_bytes)), header_bytes, *body])
+
+        path = self._path(doc_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO documents (id, title, content_sha256, content_chars, stored_bytes,
+                                       source_file, source_sha256, embedding_ids, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title,
+                    content_sha256 = excluded.content_sha256,
+                    content_chars = excluded.content_chars,
+                    stored_bytes = excluded.stored_bytes,
+                    source_file = excluded.source_file,
+                    source_sha256 = excluded.source_sha256,
+                    embedding_ids = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (doc_id, title, header["content_sha256"], chars, len(blob), source_file, source_sha256, now, now),
+            )
+            self._conn.commit()
+
+        logger.info(
+            f"[STORAGE] Documento guardado: id={doc_id}, titulo='{title[:40]}' | "
+            f"{chars} caracteres → {len(blob)} bytes en disco"
+        )
+
+    def set_embedding_ids(self, doc_id: str, embedding_ids: List[str]):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET embedding_ids = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(embedding_ids), time.time(), doc_id),
+            )
+            self._conn.commit()
+
+    # --------- Lectura ---------
+
+    def get(self, doc_id: str) -> Optional[StoredDocument]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return self._to_document(row) if row else None
+
+    def find_by_source(self, source_sha256: str) -> Optional[str]:
+        """
+        Id del documento cargado desde un archivo con esa huella, si existe.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM documents WHERE source_sha256 = ? ORDER BY updated_at DESC LIMIT 1",
+                (source_sha256,),
+            ).fetchone()
+        return row["id"] if row else None
+
+    def list(self) -> List[StoredDocument]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents ORDER BY created_at").fetchall()
+        return [self._to_document(r) for r in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def read_content(self, doc_id: str) -> str:
+        return _read_content(self._path(doc_id))
+
+    def _to_document(self, row: sqlite3.Row) -> StoredDocument:
+        return StoredDocument(self, {
+            "id": row["id"],
+            "title": row["title"],
+            "content_chars": row["content_chars"],
+            "content_sha256": row["content_sha256"],
+            "stored_bytes": row["stored_bytes"],
+            "source_file": row["source_file"],
+            "source_sha256": row["source_sha256"],
+            "embedding_ids": json.loads(row["embedding_ids"]) if row["embedding_ids"] else None,
+        })
 
-DOCUMENTS: Dict[str, dict] = {}
+    # --------- Arranque ---------
 
-def save_document(doc_id: str, title: str, content: str):
-    DOCUMENTS[doc_id] = {
-        "id": doc_id,
-        "title": title,
-        "content": content,
-        "chunks": None,  # se llena después de generar embeddings
-        "embedding_ids": None,  # IDs de los chunks en el vector store
-    }
-    logger.info(f"[STORAGE] Documento guardado: id={doc_id}, titulo='{title[:40]}'")
+    def rebuild_catalog(self) -> Dict[str, int]:
+        """
+        Sincroniza el catálogo con los archivos en disco leyendo solo los
+        headers (no se descomprime ningún texto):
+        - archivos sin fila en SQLite (p. ej. base borrada) → se agregan
+        - filas cuyo archivo ya no existe → se eliminan
+        """
+        t0 = time.perf_counter()
+        with self._lock:
+            known = {r["id"] for r in self._conn.execute("SELECT id FROM documents")}
+
+        on_disk = set()
+        added = 0
+        for name in os.listdir(self.documents_dir):
+            if not name.endswith(".doc"):
+                continue
+            doc_id = name[:-len(".doc")]
+            on_disk.add(doc_id)
+            if doc_id in known:
+                continue
+
+            path = self._path(doc_id)
+            try:
+                header = _read_header(path)
+            except (OSError, ValueError):
+                logger.warning(f"[STORAGE] Archivo de documento inválido, se ignora: {name}")
+                continue
+
+            with self._lock:
+                self._conn.execute(
+                    """
+                    INSERT INTO documents (id, title, content_sha256, content_chars, stored_bytes,
+                                           source_file, source_sha256, embedding_ids, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?)
+                    """,
+                    (doc_id, header["title"], header["content_sha256"], header["content_chars"],
+                     os.path.getsize(path), header.get("source_file"), header.get("source_sha256"),
+                     header["created_at"], time.time()),
+                )
+            added += 1
+
+        missing = known - on_disk
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE id = ?", [(d,) for d in missing])
+            self._conn.commit()
+
+        summary = {"documents": self.count(), "added": added, "removed": len(missing)}
+        logger.info(
+            f"[STORAGE] Catálogo reconstruido en {(time.perf_counter() - t0) * 1000:.1f} ms | "
+            f"documentos={summary['documents']} | agregados={added} | eliminados={len(missing)}"
+        )
+        return summary
+
+
+def _with_page_breaks(pages: List[str]) -> Iterator[str]:
+    for i, page in enumerate(pages):
+        if i:
+            yield PAGE_BREAK
+        yield page
+
+
+def _read_content(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    header_len = _HEADER_LEN.unpack_from(data, len(_MAGIC))[0]
+    body = data[len(_MAGIC) + _HEADER_LEN.size + header_len:]
+    return zlib.decompress(body).decode("utf-8")
+
+
+def chunk_stored_document(path: str, title: str) -> Tuple[List[str], List[Tuple[int, int, str]], float]:
+    """
+    Worker de ingesta: lee y divide el documento guardado en path dentro del
+    proceso hijo, así el proceso principal no carga los textos en memoria.
+    Devuelve (chunks, páginas, segundos de chunking) como chunk_document_pages_timed.
+    """
+    return chunk_document_pages_timed(_read_content(path), title)
+
+
+def _read_header(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        prefix = f.read(len(_MAGIC) + _HEADER_LEN.size)
+        if len(prefix) < len(_MAGIC) + _HEADER_LEN.size or not prefix.startswith(_MAGIC):
+            raise ValueError("Formato de documento desconocido")
+        header_len = _HEADER_LEN.unpack_from(prefix, len(_MAGIC))[0]
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+
+document_store = DocumentStore(DOCUMENTS_DB_PATH, DOCUMENTS_DIR, DOCUMENTS_COMPRESSION_LEVEL)
+
+
+def save_document(doc_id: str, title: str, content: Union[str, List[str]], source_file: Optional[str] = None,
+                  source_sha256: Optional[str] = None):
+    document_store.save(doc_id, title, content, source_file, source_sha256)
+
+
+def find_document_by_source(source_sha256: str) -> Optional[str]:
+    return document_store.find_by_source(source_sha256)
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 def get_document(doc_id: str) -> Optional[dict]:
-    doc = DOCUMENTS.get(doc_id)
+    doc = document_store.get(doc_id)
     if doc:
         logger.info(f"[STORAGE] Documento recuperado: id={doc_id}")
     else:
@@ -31,9 +333,23 @@ def get_document(doc_id: str) -> Optional[dict]:
     return doc
 
 
+def set_document_embeddings(doc_id: str, embedding_ids: List[str]):
+    document_store.set_embedding_ids(doc_id, embedding_ids)
+
+
 def list_documents() -> List[dict]:
-    logger.info(f"[STORAGE] Listando {len(DOCUMENTS)} documentos almacenados.")
-    return list(DOCUMENTS.values())
+    docs = document_store.list()
+    logger.info(f"[STORAGE] Listando {len(docs)} documentos almacenados.")
+    return docs
+
+
+def count_documents() -> int:
+    return document_store.count()
+
+
+def rebuild_catalog() -> Dict[str, int]:
+    return document_store.rebuild_catalog()
+
 
 def debug_documents():
-    return DOCUMENTS
\ No newline at end of file
+    return {doc["id"]: dict(doc) for doc in document_store.list()}
@@ -0,0 +1,338 @@
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Este módulo no usa clientes externos (se importa desde procesos worker).
+
+# --------- Reconocimiento de estructura ---------
+
+# Niveles del heading path (de mayor a menor)
+LEVEL_BOOK, LEVEL_TITLE, LEVEL_CHAPTER, LEVEL_SECTION, LEVEL_UNIT = range(5)
+
+# Separador de niveles en la metadata heading_path
+PATH_SEPARATOR = " > "
+
+# Encabezados de la ordenanza (en mayúsculas, con o sin tilde)
+_BOOK = re.compile(r"^LIBRO\s+[A-ZÁÉÍÓÚ]+\b")
+_TITLE = re.compile(r"^T[IÍ]TULO\s+([IVXLCDM]+|[ÚU]NICO|PRELIMINAR)\b(\s+[Bb][Ii][Ss])?")
+_CHAPTER = re.compile(r"^CAP[IÍ]TULO\s+([IVXLCDM]+|[ÚU]NICO)\b(\s+[Bb][Ii][Ss])?")
+_SECTION = re.compile(r"^SECCI[OÓ]N\s+\S+")
+# "Art. 12º.-", "“Art. 26º bis.-", "ARTÍCULO 5.-": el ".-" distingue el
+# comienzo de un artículo de una cita ("conforme al Art. 112º, ...")
+_ARTICLE = re.compile(
+    r"^[“\"]?(?P<label>(?:Art\.|ART\.|Art[ií]culo|ART[IÍ]CULO)\s*\d+\s*[º°]?(?:\s*(?:bis|ter|qu[aá]ter))?)\s*\.?\s*-",
+)
+
+# Guías y protocolos
+_DOCUMENT = re.compile(r"^Documento\s+\d+\s*:")
+_NUMBERED = re.compile(r"^\d{1,2}\.\s+[A-ZÁÉÍÓÚ¿]")
+_LABEL = re.compile(
+    r"^(?P<label>Descripción|Requisitos|Paso a paso|Información general|Atención y forma de contacto|"
+    r"Comunicación y resultado|Propósito)\s*:",
+)
+# Un título numerado solo es encabezado si a pocas líneas aparece una de estas etiquetas
+_OPENING_LABELS = ("Descripción", "Propósito")
+_NUMBERED_LOOKAHEAD = 2
+
+# El extractor de PDF a veces pega el encabezado al final de la línea anterior
+_GLUED = re.compile(
+    r"(?<=[a-záéíóúñ\.\)\-])(?=[“\"]?Art\.\s*\d+\s*[º°]?(?:\s*(?:bis|ter))?\s*\.-)"
+    r"|(?<=[a-záéíóú]\.)(?=\d{1,2}\.\s+[A-ZÁÉÍÓÚ])"
+    r"|(?<=[a-z\.\)])(?=(?:Descripción|Requisitos|Paso a paso|Información general|Atención y forma de contacto|"
+    r"Comunicación y resultado):)",
+)
+
+_CAPTION_MAX_CHARS = 90
+_NAME_MAX_CHARS = 120
+
+
+def _is_upper(line: str) -> bool:
+    letters = [c for c in line if c.isalpha()]
+    return bool(letters) and sum(c.isupper() for c in letters) >= 0.7 * len(letters)
+
+
+def _is_caption(line: str) -> bool:
+    """
+    Epígrafe de artículo ("Principio de Legalidad"): línea corta que empieza
+    en mayúscula y no termina una oración.
+    """
+    line = line.strip()
+    return (
+        0 < len(line) <= _CAPTION_MAX_CHARS
+        and (line[0].isupper() or line[0] in "¿“\"")
+        and line[-1] not in ".;:,-–"
+    )
+
+
+# --------- Unidades y chunks ---------
+
+class _Unit:
+    """
+    Fragmento entre dos límites estructurales: las líneas con su página y
+    el heading path vigente. Las primeras `headings` líneas son encabezados;
+    una unidad con solo encabezados se emite junto con la siguiente.
+    """
+
+    __slots__ = ("path", "lines", "pages", "size", "headings")
+
+    def __init__(self, path: Tuple[str, ...]):
+        self.path = path
+        self.lines: List[str] = []
+        self.pages: List[int] = []
+        self.size = 0
+        self.headings = 0
+
+    @property
+    def header(self) -> bool:
+        return len(self.lines) <= self.headings
+
+    def append(self, line: str, page: int, heading: bool = False):
+        if heading and self.header:
+            self.headings += 1
+        self.lines.append(line)
+        self.pages.append(page)
+        self.size += len(line) + 1
+
+    def pop(self) -> Tuple[str, int]:
+        line, page = self.lines.pop(), self.pages.pop()
+        self.size -= len(line) + 1
+        return line, page
+
+
+def _common_path(paths: List[Tuple[str, ...]]) -> Tuple[str, ...]:
+    """
+    Prefijo común; si las unidades difieren en el último nivel se indica el
+    rango ("Art. 3º – Art. 5º").
+    """
+    first, last = paths[0], paths[-1]
+    common: List[str] = []
+    for parts in zip(*paths):
+        if any(p != parts[0] for p in parts):
+            break
+        common.append(parts[0])
+    if len(paths) > 1 and len(first) > len(common) and len(last) > len(common):
+        common.append(f"{first[len(common)]} – {last[len(common)]}" if first != last else first[len(common)])
+    return tuple(common)
+
+
+class StructureChunker:
+    """
+    Divide documentos normativos y guías por su estructura: libro, título,
+    capítulo y sección de la ordenanza; artículos con su epígrafe; trámites
+    numerados y sus apartados (Descripción:, Requisitos:, ...) en las guías.
+
+    - Cada artículo o apartado es una unidad; las menores a min_chars se
+      unen con las siguientes (sin cruzar un título o capítulo) y las
+      mayores a max_chars se cortan entre líneas, prefiriendo fin de oración.
+    - Cada chunk lleva el heading path de sus unidades ("LIBRO PRIMERO ... >
+      TÍTULO I ... > Art. 1º (Ámbito de aplicación)").
+    - Recorre el texto una sola vez, línea por línea, con una ventana de
+      _NUMBERED_LOOKAHEAD líneas: tiempo lineal y memoria acotada al chunk en curso.
+    """
+
+    def __init__(self, min_chars: int = 400, max_chars: int = 2000):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+
+        self._levels: List[Optional[str]] = [None] * (LEVEL_UNIT + 1)
+        self._pending_name: Optional[int] = None   # nivel que espera su nombre en la línea siguiente
+        self._name_lines = 0                       # líneas de nombre ya leídas para ese nivel
+        self._lookahead: List[Tuple[str, int]] = []
+        self._unit: Optional[_Unit] = None
+        self._group: List[_Unit] = []
+        self._group_size = 0
+
+    # --------- Entrada ---------
+
+    def feed(self, text: str, page: int) -> Iterator[Tuple[str, int, int, str]]:
+        """
+        Procesa una página (ya normalizada) y genera los chunks que quedaron
+        cerrados: (texto, página inicial, página final, heading_path).
+        """
+        for raw in text.split("\n"):
+            for line in _GLUED.split(raw):
+                line = line.strip()
+                if line:
+                    yield from self._push(line, page)
+
+    def finish(self) -> Iterator[Tuple[str, int, int, str]]:
+        while self._lookahead:
+            line, page = self._lookahead.pop(0)
+            yield from self._classify(line, page, confirmed=False)
+        yield from self._close_unit(None)
+        yield from self._flush_group()
+
+    def _push(self, line: str, page: int) -> Iterator[Tuple[str, int, int, str]]:
+        # Los títulos numerados esperan unas líneas para confirmar que abren un trámite
+        if self._lookahead or _NUMBERED.match(line):
+            self._lookahead.append((line, page))
+            label = _LABEL.match(line)
+            if label and label.group("label") in _OPENING_LABELS:
+                head, middle = self._lookahead[0], self._lookahead[1:-1]
+                self._lookahead = []
+                yield from self._classify(*head, confirmed=True)
+                # Las líneas entre el título y la etiqueta son la continuación del título
+                for text, text_page in middle:
+                    self._extend_heading(LEVEL_TITLE, text, text_page)
+                yield from self._classify(line, page, confirmed=False)
+            elif len(self._lookahead) > _NUMBERED_LOOKAHEAD:
+                head = self._lookahead.pop(0)
+                yield from self._classify(*head, confirmed=False)
+                # La línea siguiente puede ser otro candidato: se vuelve a evaluar
+                rest, self._lookahead = self._lookahead, []
+                for pending in rest:
+                    yield from self._push(*pending)
+            return
+        yield from self._classify(line, page, confirmed=False)
+
+    # --------- Clasificación de líneas ---------
+
+    def _classify(self, line: str, page: int, confirmed: bool) -> Iterator[Tuple[str, int, int, str]]:
+        heading = self._heading(line, confirmed)
+        if self._pending_name is not None:
+            level = self._pending_name
+            # El nombre puede ocupar varias líneas en mayúsculas ("CONTRIBUCIÓN QUE INCIDE SOBRE / LOS INMUEBLES")
+            if (heading is None and len(self._levels[level]) + len(line) <= _NAME_MAX_CHARS
+                    and _is_upper(line) and not _ARTICLE.match(line)):
+                self._extend_heading(level, line, page, joiner=" - " if self._name_lines == 0 else " ")
+                self._name_lines += 1
+                return
+            self._pending_name, self._name_lines = None, 0
+
+        if heading is None:
+            article = _ARTICLE.match(line)
+            if article:
+                yield from self._start_article(article.group("label"), line, page)
+                return
+            label = _LABEL.match(line)
+            if label:
+                yield from self._start(LEVEL_UNIT, label.group("label"), line, page, header=False)
+                return
+            if self._unit is None:
+                self._unit = _Unit(self._path())
+            self._unit.append(line, page)
+            yield from self._split_if_large()
+            return
+
+        level, label, expects_name = heading
+        yield from self._start(level, label, line, page, header=True)
+        if expects_name:
+            self._pending_name = level
+
+    def _extend_heading(self, level: int, line: str, page: int, joiner: str = " "):
+        self._levels[level] = f"{self._levels[level]}{joiner}{line}"
+        self._unit.path = self._path()
+        self._unit.append(line, page, heading=True)
+
+    def _heading(self, line: str, confirmed: bool) -> Optional[Tuple[int, str, bool]]:
+        """
+        (nivel, etiqueta, espera nombre en la línea siguiente) o None.
+        """
+        if _BOOK.match(line) or _DOCUMENT.match(line):
+            return LEVEL_BOOK, line, False
+        for level, pattern in ((LEVEL_TITLE, _TITLE), (LEVEL_CHAPTER, _CHAPTER), (LEVEL_SECTION, _SECTION)):
+            match = pattern.match(line)
+            if match:
+                return level, line, match.end() >= len(line.rstrip(" :.-"))
+        if confirmed:
+            return LEVEL_TITLE, line, False
+        return None
+
+    def _path(self) -> Tuple[str, ...]:
+        return tuple(label for label in self._levels if label)
+
+    def _start(self, level: int, label: str, line: str, page: int, header: bool):
+        self._levels[level] = label
+        for deeper in range(level + 1, len(self._levels)):
+            self._levels[deeper] = None
+        yield from self._close_unit(level)
+        self._unit = _Unit(self._path())
+        self._unit.append(line, page, heading=header)
+
+    def _start_article(self, label: str, line: str, page: int):
+        # El epígrafe quedó como última línea de la unidad anterior: pasa al artículo
+        caption = None
+        unit = self._unit
+        if unit is not None and not unit.header and _is_caption(unit.lines[-1]):
+            caption = unit.pop()
+        title = f"{label} ({caption[0]})" if caption else label
+        yield from self._start(LEVEL_UNIT, title, line, page, header=False)
+        if caption:
+            self._unit.lines.insert(0, caption[0])
+            self._unit.pages.insert(0, caption[1])
+            self._unit.size += len(caption[0]) + 1
+
+    # --------- Armado de chunks ---------
+
+    def _close_unit(self, next_level: Optional[int]):
+        """
+        Cierra la unidad en curso. Las unidades chicas se acumulan en el
+        grupo; el grupo se emite al superar min_chars o antes de un título o
+        capítulo nuevo (next_level <= LEVEL_CHAPTER).
+        """
+        unit, self._unit = self._unit, None
+        if unit is not None and unit.lines:
+            self._group.append(unit)
+            self._group_size += unit.size
+        if not self._group:
+            return
+        # Solo encabezados: se emiten con el contenido que sigue
+        if next_level is not None and all(u.header for u in self._group):
+            return
+        if next_level is None or next_level <= LEVEL_CHAPTER or self._group_size >= self.min_chars:
+            yield from self._flush_group()
+
+    def _flush_group(self):
+        group, self._group, self._group_size = self._group, [], 0
+        if not group:
+            return
+        content = [u.path for u in group if not u.header] or [group[-1].path]
+        path = PATH_SEPARATOR.join(_common_path(content))
+        lines = [line for u in group for line in u.lines]
+        pages = [p for u in group for p in u.pages]
+        yield from self._emit(lines, pages, path)
+
+    def _split_if_large(self):
+        """
+        Corta la unidad en curso cuando supera max_chars: emite hasta la
+        última línea que cierra una oración (o todo salvo la última línea).
+        """
+        unit = self._unit
+        if unit.size + self._group_size <= self.max_chars or len(unit.lines) < 2:
+            return
+        cut = len(unit.lines) - 1
+        for i in range(len(unit.lines) - 2, 0, -1):
+            if unit.lines[i].rstrip().endswith((".", ":", ";")):
+                cut = i + 1
+                break
+        head = _Unit(unit.path)
+        for line, page in zip(unit.lines[:cut], unit.pages[:cut]):
+            head.append(line, page)
+        self._group.append(head)
+        yield from self._flush_group()
+
+        unit.lines, unit.pages = unit.lines[cut:], unit.pages[cut:]
+        unit.size -= head.size
+        unit.headings = max(0, unit.headings - cut)
+
+    def _emit(self, lines: List[str], pages: List[int], path: str):
+        text = "\n".join(lines)
+        # Una línea sin cortes más larga que max_chars se divide por espacios
+        while len(text) > self.max_chars * 2:
+            cut = text.rfind(" ", 0, self.max_chars)
+            cut = cut if cut > 0 else self.max_chars
+            yield text[:cut].rstrip(), pages[0], pages[-1], path
+            text = text[cut:].lstrip()
+        if text:
+            yield text, pages[0], pages[-1], path
+
+
+def iter_structured_chunks(pages: Iterable[Tuple[int, str]], min_chars: int = 400,
+                           max_chars: int = 2000) -> Iterator[Tuple[str, int, int, str]]:
+    """
+    (chunk, página inicial, página final, heading_path) a partir de páginas
+    ya normalizadas, en orden.
+    """
+    chunker = StructureChunker(min_chars=min_chars, max_chars=max_chars)
+    for page_no, text in pages:
+        yield from chunker.feed(text, page_no)
+    yield from chunker.finish()
@@ -0,0 +1,51 @@
+"""
+Fixtures compartidos. Los tests corren contra el servidor Cohere simulado de
+bench/ y un directorio de datos temporal (no tocan chroma_db ni data/):
+    cd backend && python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import setup_bench_env
+
+# Antes de que los módulos de test importen config (lee el entorno al importarse)
+BENCH_WORKDIR = setup_bench_env()
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    from lifecycle import lifecycle
+
+    with TestClient(main.app) as c:
+        # Que el arranque (warmup incluido) no compita con las fallas que inyectan los tests
+        deadline = time.monotonic() + 60
+        while not lifecycle.ready and time.monotonic() < deadline:
+            time.sleep(0.05)
+        yield c
+
+
+# Documento sintético: todos sus chunks comparten vocabulario con la
+# pregunta, así el grounding pasa con los embeddings del servidor simulado
+GROUNDED_TITLE = "Guía de prueba de la tasa de alumbrado"
+GROUNDED_QUESTION = "Cómo se paga la tasa de alumbrado público en el cedulón municipal"
+
+
+@pytest.fixture(scope="session")
+def grounded_question(client):
+    """Indexa el documento sintético y devuelve una pregunta que pasa el grounding."""
+    import rag_ppal
+
+    chunks = [
+        f"{GROUNDED_QUESTION}: la tasa de alumbrado público figura en el cedulón municipal, punto {i}."
+        for i in range(6)
+    ]
+    rag_ppal.generate_embeddings_for_document(rag_ppal.document_id_for(GROUNDED_TITLE), GROUNDED_TITLE, chunks)
+    return GROUNDED_QUESTION
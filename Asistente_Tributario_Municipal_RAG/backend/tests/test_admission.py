@@ -0,0 +1,277 @@
+"""
+Control de admisión de la etapa LLM: prioridad de carriles, cupo batch,
+rechazos por cola llena o espera vencida, la carrera entre abandonar la
+cola y recibir el lugar, y la respuesta degradada del pipeline.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def controller(max_concurrent=1, interactive_queue=8, batch_queue=8,
+               interactive_wait_ms=2000, batch_wait_ms=2000, batch_max_share=0.75) -> AdmissionController:
+    return AdmissionController(
+        max_concurrent,
+        queue_limits={"interactive": interactive_queue, "batch": batch_queue},
+        max_wait_ms={"interactive": interactive_wait_ms, "batch": batch_wait_ms},
+        batch_max_share=batch_max_share,
+    )
+
+
+def hold(admission: AdmissionController, lane: str = "interactive"):
+    """Ocupa un lugar hasta llamar a __exit__ (como un request en vuelo)."""
+    slot = admission.slot(lane)
+    slot.__enter__()
+    return slot
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        time.sleep(0.005)
+
+
+def in_background(admission: AdmissionController, lane: str, admitted: list, errors: list):
+    def run():
+        try:
+            with admission.slot(lane):
+                admitted.append(lane)
+        except AdmissionRejected as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+# --------- Carriles ---------
+
+def test_interactive_lane_is_served_before_batch():
+    admission = controller(max_concurrent=1)
+    holder = hold(admission)
+    admitted, errors = [], []
+
+    batch = in_background(admission, "batch", admitted, errors)
+    wait_until(lambda: admission.stats()["queued"]["batch"] == 1)
+    interactive = in_background(admission, "interactive", admitted, errors)
+    wait_until(lambda: admission.stats()["queued"]["interactive"] == 1)
+
+    holder.__exit__(None, None, None)
+    batch.join()
+    interactive.join()
+
+    # El batch llegó primero pero el lugar liberado fue para el interactivo
+    assert admitted == ["interactive", "batch"]
+    assert not errors
+
+
+def test_batch_share_caps_batch_slots():
+    admission = controller(max_concurrent=4, batch_max_share=0.5, batch_wait_ms=50)
+    holders = [hold(admission, "batch") for _ in range(2)]
+    assert admission.stats()["batch_limit"] == 2
+
+    # Hay lugares libres, pero no para un tercer batch
+    with pytest.raises(AdmissionRejected) as error:
+        with admission.slot("batch"):
+            pass
+    assert error.value.reason == "timeout"
+
+    # Los interactivos siguen entrando sin esperar
+    with admission.slot("interactive") as waited:
+        assert waited < 0.05
+        assert admission.stats()["in_flight"] == {"interactive": 1, "batch": 2}
+
+    for holder in holders:
+        holder.__exit__(None, None, None)
+    assert admission.stats()["in_flight"] == {"interactive": 0, "batch": 0}
+
+
+def test_batch_waits_while_interactive_is_queued():
+    admission = controller(max_concurrent=2, batch_max_share=1.0)
+    holders = [hold(admission), hold(admission)]
+    admitted, errors = [], []
+
+    interactive = in_background(admission, "interactive", admitted, errors)
+    wait_until(lambda: admission.stats()["queued"]["interactive"] == 1)
+    batch = in_background(admission, "batch", admitted, errors)
+    wait_until(lambda: admission.stats()["queued"]["batch"] == 1)
+
+    holders[0].__exit__(None, None, None)
+    interactive.join()
+    holders[1].__exit__(None, None, None)
+    batch.join()
+
+    assert admitted == ["interactive", "batch"]
+
+
+# --------- Rechazos ---------
+
+def test_full_queue_is_rejected_without_waiting():
+    admission = controller(max_concurrent=1, interactive_queue=0)
+    holder = hold(admission)
+
+    t0 = time.monotonic()
+    with pytest.raises(AdmissionRejected) as error:
+        with admission.slot("interactive"):
+            pass
+
+    assert error.value.reason == "queue_full"
+    assert time.monotonic() - t0 < 0.05
+    assert admission.stats()["shed"]["interactive"] == {"queue_full": 1, "timeout": 0}
+    holder.__exit__(None, None, None)
+
+
+def test_expired_wait_leaves_the_queue():
+    admission = controller(max_concurrent=1, interactive_wait_ms=50)
+    holder = hold(admission)
+
+    with pytest.raises(AdmissionRejected) as error:
+        with admission.slot("interactive"):
+            pass
+
+    assert error.value.reason == "timeout"
+    assert error.value.waited >= 0.05
+    stats = admission.stats()
+    assert stats["queued"]["interactive"] == 0
+    assert stats["in_flight"]["interactive"] == 1
+    assert stats["shed"]["interactive"]["timeout"] == 1
+    holder.__exit__(None, None, None)
+    assert admission.stats()["in_flight"]["interactive"] == 0
+
+
+def test_unknown_lane_is_an_error():
+    with pytest.raises(ValueError):
+        with controller().slot("urgente"):
+            pass
+
+
+# --------- Abandonar la cola vs. recibir el lugar ---------
+
+def grant_on_abandon(admission: AdmissionController, holder):
+    """
+    El lugar se libera justo cuando vence la espera: cuando el request
+    abandona la cola el lugar ya es suyo.
+    """
+    abandon = admission._abandon
+
+    def late_grant(waiter):
+        holder.__exit__(None, None, None)
+        return abandon(waiter)
+
+    admission._abandon = late_grant
+
+
+def test_sync_wait_expired_after_grant_keeps_the_slot():
+    admission = controller(max_concurrent=1, interactive_wait_ms=20)
+    grant_on_abandon(admission, hold(admission))
+
+    with admission.slot("interactive"):
+        assert admission.stats()["in_flight"]["interactive"] == 1
+
+    stats = admission.stats()
+    assert stats["in_flight"]["interactive"] == 0
+    assert stats["queued"]["interactive"] == 0
+    assert stats["admitted"]["interactive"] == 2
+    assert stats["shed"]["interactive"]["timeout"] == 0
+
+
+def test_async_wait_expired_after_grant_keeps_the_slot():
+    admission = controller(max_concurrent=1, interactive_wait_ms=20)
+    grant_on_abandon(admission, hold(admission))
+
+    async def run():
+        async with admission.slot_async("interactive"):
+            assert admission.stats()["in_flight"]["interactive"] == 1
+
+    asyncio.run(run())
+    stats = admission.stats()
+    assert stats["in_flight"]["interactive"] == 0
+    assert stats["admitted"]["interactive"] == 2
+    assert stats["shed"]["interactive"]["timeout"] == 0
+
+
+def test_async_cancelled_while_queued_leaves_the_queue():
+    admission = controller(max_concurrent=1)
+    holder = hold(admission)
+
+    async def run():
+        task = asyncio.ensure_future(_enter_async(admission))
+        while admission.stats()["queued"]["interactive"] == 0:
+            await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    stats = admission.stats()
+    assert stats["queued"]["interactive"] == 0
+    assert stats["in_flight"]["interactive"] == 1
+    holder.__exit__(None, None, None)
+    assert admission.stats()["in_flight"]["interactive"] == 0
+
+
+def test_async_cancelled_after_grant_returns_the_slot():
+    admission = controller(max_concurrent=1)
+    holder = hold(admission)
+
+    async def run():
+        task = asyncio.ensure_future(_enter_async(admission))
+        while admission.stats()["queued"]["interactive"] == 0:
+            await asyncio.sleep(0.005)
+        # Se cancela y, antes de que despierte, el lugar pasa a ese request
+        task.cancel()
+        holder.__exit__(None, None, None)
+        assert admission.stats()["in_flight"]["interactive"] == 1
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    stats = admission.stats()
+    assert stats["in_flight"]["interactive"] == 0
+    assert stats["queued"]["interactive"] == 0
+
+
+async def _enter_async(admission: AdmissionController):
+    async with admission.slot_async("interactive"):
+        pass
+
+
+# --------- Respuesta degradada ---------
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """Etapa LLM sin lugar: el único lugar está ocupado y la espera es corta."""
+    import rag_ppal
+
+    admission = controller(max_concurrent=1, interactive_wait_ms=20, batch_wait_ms=20)
+    monkeypatch.setattr(rag_ppal, "admission", admission)
+    holder = hold(admission)
+    yield admission
+    holder.__exit__(None, None, None)
+
+
+def _assert_degraded(result):
+    assert result["degraded"] is True
+    assert result["grounded"] is True
+    assert result["chunk_id"]
+    assert result["source_document"]
+    assert result["timings_ms"]["admission_ms"] >= 20
+
+
+def test_rag_answer_degrades_when_wait_expires(grounded_question, saturated):
+    import rag_ppal
+
+    _assert_degraded(rag_ppal.rag_answer(grounded_question))
+    assert saturated.stats()["shed"]["interactive"]["timeout"] == 1
+
+
+def test_rag_answer_async_degrades_when_wait_expires(grounded_question, saturated):
+    import rag_ppal
+
+    _assert_degraded(asyncio.run(rag_ppal.rag_answer_async(grounded_question, priority="batch")))
+    assert saturated.stats()["shed"]["batch"]["timeout"] == 1
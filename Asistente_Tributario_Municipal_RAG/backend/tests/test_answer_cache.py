@@ -0,0 +1,181 @@
+"""
+Cache semántica de respuestas: umbral, aislamiento por scope, vencimiento
+por TTL e invalidación por chunk_id, sola y dentro del pipeline (una
+respuesta deja de servirse cuando se re-indexa un chunk en que se fundamentó).
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import answer_cache as answer_cache_module
+from answer_cache import SemanticAnswerCache
+
+SCOPE = '{"mode": "hybrid", "where": null}'
+NOTA_SCOPE = '{"mode": "hybrid", "where": {"tramite": "nota"}}'
+
+
+def vec(*values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float32)
+
+
+def result(answer: str) -> dict:
+    return {"answer": answer, "grounded": True}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj controlado para el TTL."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(answer_cache_module, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+# --------- Lectura ---------
+
+def test_hit_only_above_threshold():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=8)
+    cache.store("pregunta", vec(1, 0, 0), result("respuesta"), ["c1"], SCOPE)
+
+    # Misma dirección, otra norma: similitud 1
+    assert cache.lookup(vec(3, 0, 0), SCOPE)["answer"] == "respuesta"
+    assert cache.lookup(vec(1, 1, 0), SCOPE) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_scopes_are_isolated():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=8)
+    cache.store("pregunta", vec(1, 0, 0), result("general"), ["c1"], SCOPE)
+
+    assert cache.lookup(vec(1, 0, 0), NOTA_SCOPE) is None
+
+    # La misma pregunta con otro filtro de intención tiene su propia respuesta
+    cache.store("pregunta", vec(1, 0, 0), result("nota"), ["c2"], NOTA_SCOPE)
+    assert cache.lookup(vec(1, 0, 0), SCOPE)["answer"] == "general"
+    assert cache.lookup(vec(1, 0, 0), NOTA_SCOPE)["answer"] == "nota"
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=8)
+    cache.store("pregunta", vec(1, 0, 0), result("respuesta"), ["c1"], SCOPE)
+
+    clock[0] += 59
+    assert cache.lookup(vec(1, 0, 0), SCOPE) is not None
+    clock[0] += 2
+    assert cache.lookup(vec(1, 0, 0), SCOPE) is None
+    assert cache.stats()["entries"] == 0
+
+    # El slot vencido se reutiliza y la entrada vieja ya no responde a su chunk
+    cache.store("otra", vec(0, 1, 0), result("otra"), ["c2"], SCOPE)
+    assert cache.invalidate_chunks(["c1"]) == 0
+    assert cache.lookup(vec(0, 1, 0), SCOPE)["answer"] == "otra"
+
+
+# --------- Invalidación ---------
+
+def test_invalidate_chunks_drops_only_grounded_entries():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=8)
+    cache.store("a", vec(1, 0, 0), result("a"), ["c1", "c2"], SCOPE)
+    cache.store("b", vec(0, 1, 0), result("b"), ["c3"], SCOPE)
+    cache.store("c", vec(0, 0, 1), result("c"), ["c2"], NOTA_SCOPE)
+
+    assert cache.invalidate_chunks(["c2", "inexistente"]) == 2
+
+    assert cache.lookup(vec(1, 0, 0), SCOPE) is None
+    assert cache.lookup(vec(0, 0, 1), NOTA_SCOPE) is None
+    assert cache.lookup(vec(0, 1, 0), SCOPE)["answer"] == "b"
+    assert cache.invalidate_chunks(["c1", "c2"]) == 0
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_rotated_entry_leaves_the_chunk_index():
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=2)
+    cache.store("a", vec(1, 0, 0), result("a"), ["c1"], SCOPE)
+    cache.store("b", vec(0, 1, 0), result("b"), ["c2"], SCOPE)
+    cache.store("c", vec(0, 0, 1), result("c"), ["c3"], SCOPE)
+
+    assert cache.lookup(vec(1, 0, 0), SCOPE) is None
+    assert cache.invalidate_chunks(["c1"]) == 0
+    assert cache.invalidate_chunks(["c3"]) == 1
+
+
+# --------- Pipeline ---------
+
+CACHE_TITLE = "Guía de prueba de la cache de respuestas"
+CACHE_QUESTION = "Qué requisitos tiene la exención de la tasa de cementerio para jubilados"
+
+
+@pytest.fixture
+def pipeline_cache(client, monkeypatch):
+    """Cache con umbral real en rag_ppal (el entorno de tests la desactiva)."""
+    import rag_ppal
+
+    cache = SemanticAnswerCache(threshold=0.95, ttl_seconds=60, max_entries=16)
+    monkeypatch.setattr(rag_ppal, "answer_cache", cache)
+    return cache
+
+
+def index_cache_document(chunks):
+    import rag_ppal
+
+    return rag_ppal.generate_embeddings_for_document(rag_ppal.document_id_for(CACHE_TITLE), CACHE_TITLE, chunks)
+
+
+def cache_chunks(suffix=""):
+    return [
+        f"{CACHE_QUESTION}: la exención de la tasa de cementerio para jubilados pide el recibo de haberes, punto {i}.{suffix}"
+        for i in range(6)
+    ]
+
+
+def answer_and_cache(cache):
+    import rag_ppal
+
+    first = rag_ppal.rag_answer(CACHE_QUESTION)
+    assert first["grounded"] is True
+    assert first["source_document"] == CACHE_TITLE
+    assert cache.stats()["misses"] == 1
+
+    second = rag_ppal.rag_answer(CACHE_QUESTION)
+    assert cache.stats()["hits"] == 1
+    assert second["answer"] == first["answer"]
+    return first
+
+
+def test_reindexed_chunk_invalidates_cached_answer(pipeline_cache):
+    import rag_ppal
+
+    chunks = cache_chunks()
+    ids = index_cache_document(chunks)
+    first = answer_and_cache(pipeline_cache)
+
+    # El chunk principal de la respuesta cambia: nuevo id, el viejo se borra (finalize_reindex)
+    changed = list(chunks)
+    changed[ids.index(first["chunk_id"])] += " Texto actualizado por la ordenanza."
+    new_ids = index_cache_document(changed)
+    assert first["chunk_id"] not in new_ids
+    assert pipeline_cache.stats()["invalidations"] == 1
+
+    third = rag_ppal.rag_answer(CACHE_QUESTION)
+    assert pipeline_cache.stats()["hits"] == 1
+    assert pipeline_cache.stats()["misses"] == 2
+    assert third["chunk_id"] != first["chunk_id"]
+
+    # Se deja el documento como estaba para los demás tests
+    index_cache_document(chunks)
+
+
+def test_rewritten_chunk_invalidates_cached_answer(pipeline_cache):
+    import rag_ppal
+
+    index_cache_document(cache_chunks())
+    first = answer_and_cache(pipeline_cache)
+
+    # Re-escribir el chunk con el mismo id también pasa por store_chunks
+    stored = rag_ppal.vector_store.get(ids=[first["chunk_id"]], include=("documents", "metadatas", "embeddings"))
+    rag_ppal.store_chunks(stored["ids"], stored["documents"], stored["embeddings"], stored["metadatas"])
+
+    assert pipeline_cache.stats()["invalidations"] == 1
+    rag_ppal.rag_answer(CACHE_QUESTION)
+    assert pipeline_cache.stats()["misses"] == 2
@@ -0,0 +1,287 @@
+"""
+Cliente resiliente de Cohere contra el servidor simulado con fallas
+inyectadas: reintentos, backoff, deadline, circuit breaker, hedging y el
+mapeo a 503/504 de la API.
+"""
+import asyncio
+import os
+import time
+
+import cohere
+import pytest
+from cohere.core.api_error import ApiError
+
+from bench.common import free_port, get_faults, set_faults
+from bench.fake_cohere_server import start_server_process
+from cohere_client import CircuitOpenError, CohereUnavailableError, DeadlineExceededError, ResilientCohere
+
+EMBED_ARGS = {"model": "embed-multilingual-v3.0", "input_type": "search_query", "embedding_types": ["float"]}
+# Con esta latencia el stream emite el primer evento enseguida y el resto a lo largo de ~2 s
+STREAM_CHAT_LATENCY_MS = 2000
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    return start_server_process(port=free_port(), chat_latency_ms=STREAM_CHAT_LATENCY_MS)
+
+
+@pytest.fixture(autouse=True)
+def no_faults(base_url):
+    set_faults(base_url, fail_rate=0.0, fail_status=503, slow_rate=0.0, slow_ms=0.0, fail_next=0, slow_next=0)
+    yield
+
+
+def resilient(base_url, **overrides) -> ResilientCohere:
+    options = dict(
+        deadlines={"embed": 5.0, "chat": 5.0},
+        concurrency={"embed": 4, "chat": 4},
+        max_retries=2, backoff_base_seconds=0.01,
+        breaker_failures=5, breaker_reset_seconds=30.0,
+    )
+    options.update(overrides)
+    sync_client = cohere.ClientV2(base_url=base_url, api_key="fake-key")
+    async_client = cohere.AsyncClientV2(base_url=base_url, api_key="fake-key")
+    return ResilientCohere(sync_client, async_client, **options)
+
+
+def embed(client: ResilientCohere, text: str = "pago duplicado de la tasa"):
+    return client.embed(texts=[text], **EMBED_ARGS)
+
+
+# --------- Reintentos y deadline ---------
+
+def test_transient_errors_are_retried_until_success(base_url):
+    client = resilient(base_url)
+    set_faults(base_url, fail_next=2)
+
+    response = embed(client)
+
+    assert len(response.embeddings.float_) == 1
+    assert get_faults(base_url)["requests"] == 3
+    assert client.stats()["embed"]["retries"] == 2
+
+
+def test_exhausted_retries_raise_unavailable(base_url):
+    client = resilient(base_url)
+    set_faults(base_url, fail_next=10)
+
+    with pytest.raises(CohereUnavailableError) as error:
+        embed(client)
+
+    assert error.value.status_code == 503
+    assert get_faults(base_url)["requests"] == 3
+
+
+def test_retry_after_of_429_is_respected(base_url):
+    client = resilient(base_url)
+    set_faults(base_url, fail_status=429, fail_next=1)
+
+    t0 = time.monotonic()
+    embed(client)
+
+    # El servidor pide Retry-After: 1 y el jitter lo deja entre 0.5 y 1.5 s
+    assert time.monotonic() - t0 >= 0.5
+    assert get_faults(base_url)["requests"] == 2
+
+
+def test_client_errors_are_not_retried(base_url):
+    client = resilient(base_url, breaker_failures=1)
+    set_faults(base_url, fail_status=400, fail_next=1)
+
+    with pytest.raises(ApiError) as error:
+        embed(client)
+
+    assert error.value.status_code == 400
+    assert get_faults(base_url)["requests"] == 1
+    assert client.breakers["embed"].state == "closed"
+
+
+def test_slow_request_exceeds_deadline(base_url):
+    client = resilient(base_url, deadlines={"embed": 0.3, "chat": 0.3})
+    set_faults(base_url, slow_next=1, slow_ms=2000)
+
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceededError) as error:
+        embed(client)
+
+    assert error.value.status_code == 504
+    assert time.monotonic() - t0 < 1.5
+
+
+# --------- Circuit breaker ---------
+
+def test_breaker_opens_rejects_and_closes_after_probe(base_url):
+    client = resilient(base_url, max_retries=0, breaker_failures=2, breaker_reset_seconds=0.3)
+    breaker = client.breakers["embed"]
+    set_faults(base_url, fail_next=2)
+
+    for _ in range(2):
+        with pytest.raises(CohereUnavailableError):
+            embed(client)
+    assert breaker.state == "open"
+
+    # Abierto: se rechaza sin llamar al servidor
+    with pytest.raises(CircuitOpenError) as error:
+        embed(client)
+    assert error.value.retry_after is not None
+    assert get_faults(base_url)["requests"] == 2
+    assert client.stats()["embed"]["rejected_by_circuit"] == 1
+
+    time.sleep(0.35)
+    assert breaker.state == "half_open"
+    embed(client)
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_breaker(base_url):
+    client = resilient(base_url, max_retries=0, breaker_failures=1, breaker_reset_seconds=0.2)
+    breaker = client.breakers["embed"]
+    set_faults(base_url, fail_next=2)
+
+    with pytest.raises(CohereUnavailableError):
+        embed(client)
+    time.sleep(0.25)
+    assert breaker.state == "half_open"
+
+    with pytest.raises(CohereUnavailableError):
+        embed(client)
+    assert breaker.state == "open"
+    assert breaker.opened_total == 2
+
+
+def test_half_open_lets_a_single_probe_through():
+    from cohere_client import CircuitBreaker
+
+    breaker = CircuitBreaker("embed", failure_threshold=1, reset_seconds=0.05)
+    breaker.on_failure()
+    time.sleep(0.06)
+
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.on_success()
+    assert breaker.before_call() is False
+
+
+def test_cancelled_probe_is_released(base_url):
+    client = resilient(base_url, breaker_failures=1, breaker_reset_seconds=0.05)
+    breaker = client.breakers["embed"]
+    set_faults(base_url, slow_next=1, slow_ms=2000)
+
+    async def run():
+        breaker.on_failure()
+        await asyncio.sleep(0.06)
+        task = asyncio.ensure_future(client.embed_async(texts=["consulta"], **EMBED_ARGS))
+        await asyncio.sleep(0.1)
+        # La prueba está en vuelo: nadie más pasa
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    # Cancelada sin resultado: el próximo llamado puede hacer la prueba
+    assert breaker.before_call() is True
+
+
+def test_cancelled_call_does_not_release_another_probe(base_url):
+    # hedge_max_ratio=0: el llamado pasa por _hedged pero nunca duplica
+    client = resilient(base_url, breaker_failures=1, breaker_reset_seconds=0.05,
+                       hedge_after_ms=20, hedge_max_ratio=0.0)
+    breaker = client.breakers["embed"]
+    set_faults(base_url, slow_next=1, slow_ms=2000)
+
+    async def run():
+        # Arranca con el circuito cerrado (no es la prueba) y queda esperando
+        task = asyncio.ensure_future(client.embed_async(texts=["consulta"], **EMBED_ARGS))
+        await asyncio.sleep(0.1)
+        breaker.on_failure()
+        await asyncio.sleep(0.06)
+        assert breaker.before_call() is True
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+# --------- Hedging ---------
+
+def test_hedge_answers_before_slow_request(base_url):
+    client = resilient(base_url, hedge_after_ms=50, hedge_max_ratio=1.0)
+    set_faults(base_url, slow_next=1, slow_ms=2000)
+
+    async def run():
+        t0 = time.monotonic()
+        response = await client.embed_async(texts=["consulta"], **EMBED_ARGS)
+        return response, time.monotonic() - t0
+
+    response, elapsed = asyncio.run(run())
+
+    assert len(response.embeddings.float_) == 1
+    assert elapsed < 1.0
+    assert client.stats()["embed"]["hedges"] == 1
+
+
+def test_hedges_stay_within_budget(base_url):
+    client = resilient(base_url, hedge_after_ms=50, hedge_max_ratio=0.0)
+    set_faults(base_url, slow_next=1, slow_ms=300)
+
+    asyncio.run(client.embed_async(texts=["consulta"], **EMBED_ARGS))
+
+    assert client.stats()["embed"]["hedges"] == 0
+    assert get_faults(base_url)["requests"] == 1
+
+
+# --------- Streaming ---------
+
+def test_stream_cut_after_first_event_is_a_deadline(base_url):
+    client = resilient(base_url, deadlines={"embed": 5.0, "chat": 0.5}, breaker_failures=1)
+
+    async def run():
+        events = []
+        with pytest.raises(DeadlineExceededError):
+            async for event in client.chat_stream(model="command-r-plus-08-2024", temperature=0,
+                                                  messages=[{"role": "user", "content": "Pregunta: hola"}]):
+                events.append(event)
+        return events
+
+    events = asyncio.run(run())
+
+    assert events
+    assert client.breakers["chat"].state == "open"
+
+
+# --------- API ---------
+
+@pytest.fixture
+def api_faults(client):
+    import rag_ppal
+
+    yield os.environ["COHERE_BASE_URL"]
+    set_faults(os.environ["COHERE_BASE_URL"], fail_rate=0.0, fail_status=503, slow_ms=0.0, fail_next=0, slow_next=0)
+    for breaker in rag_ppal.cohere_client.breakers.values():
+        breaker.on_success()
+
+
+def test_api_answers_503_with_retry_after(client, api_faults):
+    set_faults(api_faults, fail_status=429, fail_next=10)
+
+    r = client.post("/search", json={"query": "consulta sin cache para el 503"})
+
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+
+
+def test_api_answers_504_on_deadline(client, api_faults, monkeypatch):
+    import rag_ppal
+
+    monkeypatch.setitem(rag_ppal.cohere_client.deadlines, "embed", 0.3)
+    set_faults(api_faults, slow_next=1, slow_ms=2000)
+
+    r = client.post("/search", json={"query": "consulta sin cache para el 504"})
+
+    assert r.status_code == 504
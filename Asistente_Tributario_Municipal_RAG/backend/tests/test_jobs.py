@@ -0,0 +1,111 @@
+"""
+Jobs de ingesta: un solo trabajo por documento a la vez.
+"""
+import os
+import time
+
+import pytest
+
+from bench.common import corpus_pdfs
+
+
+def _wait_jobs(client, job_ids, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        jobs = [client.get(f"/jobs/{job_id}").json() for job_id in job_ids]
+        if all(j["status"] in ("completed", "failed") for j in jobs):
+            return jobs
+        time.sleep(0.1)
+    pytest.fail(f"Los jobs no terminaron en {timeout} s: {jobs}")
+
+
+def _upload(client, title, pdf):
+    with open(pdf, "rb") as f:
+        r = client.post("/upload-file", params={"title": title},
+                        files={"file": (os.path.basename(pdf), f, "application/pdf")})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_same_title_uploads_run_one_after_another(client):
+    import rag_ppal
+    from chunking import iter_page_chunks
+    from extraction import iter_pdf_pages
+    from storage import get_document
+
+    title = "Guía de prueba duplicada"
+    first_pdf, second_pdf = sorted(corpus_pdfs(), key=os.path.getsize)[:2]
+
+    first = _upload(client, title, first_pdf)
+    second = _upload(client, title, second_pdf)
+    assert first["document_id"] == second["document_id"]
+
+    jobs = _wait_jobs(client, [first["job_id"], second["job_id"]])
+    assert [j["status"] for j in jobs] == ["completed", "completed"]
+
+    # El segundo job arrancó recién cuando terminó el primero: el documento
+    # y sus chunks son los del último PDF, sin restos del anterior
+    doc = get_document(second["document_id"])
+    expected = [chunk for chunk, *_ in iter_page_chunks(iter_pdf_pages(second_pdf), title)]
+
+    stored = rag_ppal.vector_store.get(where={"title": title}, include=("documents", "metadatas"))
+    assert sorted(stored["ids"]) == sorted(doc["embedding_ids"])
+    assert sorted(stored["documents"]) == sorted(expected)
+    assert {m["document_id"] for m in stored["metadatas"]} == {second["document_id"]}
+
+
+def test_reupload_keeps_only_the_current_pdf(client):
+    from config import UPLOADS_DIR
+    from storage import get_document
+
+    title = "Guía con versiones"
+    pdfs = sorted(corpus_pdfs(), key=os.path.getsize)
+    first_pdf, second_pdf = pdfs[3], pdfs[0]
+    first = _upload(client, title, first_pdf)
+    _wait_jobs(client, [first["job_id"]])
+    second = _upload(client, title, second_pdf)
+    assert second["document_id"] == first["document_id"]
+    _wait_jobs(client, [second["job_id"]])
+
+    # El PDF reemplazado se borra; el subido se copió entero y sin restos parciales
+    doc = get_document(second["document_id"])
+    uploads = [name for name in os.listdir(UPLOADS_DIR) if name.startswith(second["document_id"])]
+    assert [os.path.join(UPLOADS_DIR, name) for name in uploads] == [doc["source_file"]]
+    with open(doc["source_file"], "rb") as stored, open(second_pdf, "rb") as original:
+        assert stored.read() == original.read()
+    assert not [name for name in os.listdir(UPLOADS_DIR) if name.endswith(".part")]
+
+
+def test_same_file_with_new_title_keeps_document_id(client):
+    import rag_ppal
+    from storage import get_document
+
+    pdf = sorted(corpus_pdfs(), key=os.path.getsize)[2]
+    first = _upload(client, "Guía original", pdf)
+    _wait_jobs(client, [first["job_id"]])
+
+    renamed = _upload(client, "Guía renombrada", pdf)
+    assert renamed["document_id"] == first["document_id"]
+    jobs = _wait_jobs(client, [renamed["job_id"]])
+    assert jobs[0]["status"] == "completed"
+
+    # Los chunks del título anterior pasan al nuevo: no quedan duplicados
+    doc = get_document(renamed["document_id"])
+    stored = rag_ppal.vector_store.get(where={"document_id": renamed["document_id"]}, include=("metadatas",))
+    assert doc["title"] == "Guía renombrada"
+    assert sorted(stored["ids"]) == sorted(doc["embedding_ids"])
+    assert {m["title"] for m in stored["metadatas"]} == {"Guía renombrada"}
+    assert not rag_ppal.vector_store.get(where={"title": "Guía original"}, include=("metadatas",))["ids"]
+
+
+def test_sync_embeddings_conflict_with_running_job(client):
+    import main
+
+    doc_id = main.document_id_for("Guía de prueba duplicada")
+    with main.job_manager.claim([doc_id]) as claimed:
+        assert claimed == [doc_id]
+        r = client.post("/generate-embeddings", json={"document_id": doc_id})
+        assert r.status_code == 409
+
+    r = client.post("/generate-embeddings", json={"document_id": doc_id})
+    assert r.status_code == 200, r.text
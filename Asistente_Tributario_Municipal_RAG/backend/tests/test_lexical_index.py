@@ -0,0 +1,171 @@
+"""
+Índice BM25: reemplazo de ids, compactación de postings y máscaras,
+máscaras cacheadas al actualizar metadatos y filtros where.
+
+Después de cada secuencia de escrituras el índice tiene que responder igual
+que uno nuevo construido solo con los chunks vivos.
+"""
+import random
+
+import pytest
+
+from lexical_index import BM25Index, _COMPACT_RATIO
+
+VOCAB = ["tasa", "cedulon", "reclamo", "pago", "duplicado", "plan", "deuda", "nota",
+         "titular", "inmueble", "comercio", "vencimiento", "recargo", "municipal"]
+TRAMITES = ["reclamo", "general", "regularizacion"]
+QUERIES = ["pago duplicado", "plan de pago deuda", "reclamo titular", "tasa municipal cedulon", "recargo"]
+
+
+def make_chunks(n, seed=0, prefix="c"):
+    rng = random.Random(seed)
+    return {
+        f"{prefix}{i}": (
+            " ".join(rng.choice(VOCAB) for _ in range(rng.randint(3, 12))),
+            {"tramite": TRAMITES[i % len(TRAMITES)], "chunk_index": i},
+        )
+        for i in range(n)
+    }
+
+
+def build(chunks, **kwargs) -> BM25Index:
+    index = BM25Index(**kwargs)
+    index.add(list(chunks), [text for text, _ in chunks.values()], [meta for _, meta in chunks.values()])
+    return index
+
+
+def assert_same_results(index, chunks, where=None):
+    fresh = build(chunks)
+    for query in QUERIES:
+        got = index.search(query, n_results=len(chunks) + 5, where=where)
+        expected = fresh.search(query, n_results=len(chunks) + 5, where=where)
+        # Con empates el orden entre iguales no está definido: se compara id -> score
+        assert dict(got) == pytest.approx(dict(expected), rel=1e-5), (query, where)
+        assert [score for _, score in got] == sorted((score for _, score in got), reverse=True)
+
+
+# --------- Escritura ---------
+
+def test_add_replaces_existing_id():
+    index = build({"a": ("reclamo por pago duplicado", {"tramite": "reclamo"})})
+    index.add(["a"], ["plan de pago de deuda"], [{"tramite": "general"}])
+
+    assert len(index) == 1
+    assert index.search("reclamo duplicado") == []
+    assert [chunk_id for chunk_id, _ in index.search("deuda")] == ["a"]
+    assert index.search("deuda", where={"tramite": "reclamo"}) == []
+    assert [chunk_id for chunk_id, _ in index.search("deuda", where={"tramite": "general"})] == ["a"]
+
+
+def test_remove_below_ratio_does_not_compact():
+    chunks = make_chunks(20)
+    index = build(chunks)
+    removed = list(chunks)[:int(20 * _COMPACT_RATIO)]
+    index.remove(removed)
+
+    assert len(index._ids) == 20
+    assert len(index) == 20 - len(removed)
+    assert_same_results(index, {k: v for k, v in chunks.items() if k not in removed})
+
+
+def test_compaction_remaps_postings_and_cached_masks():
+    chunks = make_chunks(40)
+    index = build(chunks)
+    # Máscaras cacheadas antes de compactar
+    for tramite in TRAMITES:
+        index.search("pago", where={"tramite": tramite})
+    assert len(index._masks) == len(TRAMITES)
+
+    removed = [f"c{i}" for i in range(0, 40, 3)]
+    index.remove(removed)
+    live = {k: v for k, v in chunks.items() if k not in removed}
+
+    # Compactado: solo quedan los vivos, y las máscaras siguen en caché remapeadas
+    assert len(index._ids) == len(live)
+    assert len(index._masks) == len(TRAMITES)
+    assert index._position == {chunk_id: i for i, chunk_id in enumerate(live)}
+    assert index.stats() == build(live).stats()
+    assert_same_results(index, live)
+    for tramite in TRAMITES:
+        assert_same_results(index, live, where={"tramite": tramite})
+
+    # Las escrituras posteriores extienden las máscaras remapeadas
+    extra = make_chunks(10, seed=1, prefix="n")
+    index.add(list(extra), [text for text, _ in extra.values()], [meta for _, meta in extra.values()])
+    live.update(extra)
+    for tramite in TRAMITES:
+        assert_same_results(index, live, where={"tramite": tramite})
+
+
+def test_replacement_churn_compacts_and_stays_consistent():
+    chunks = make_chunks(30)
+    index = build(chunks)
+    index.search("pago", where={"tramite": "general"})
+
+    # Re-indexar repetidamente los mismos ids deja entradas inactivas que se compactan
+    rng = random.Random(2)
+    for round_ in range(5):
+        ids = rng.sample(sorted(chunks), 10)
+        updated = make_chunks(10, seed=10 + round_)
+        for chunk_id, (text, meta) in zip(ids, updated.values()):
+            chunks[chunk_id] = (text, meta)
+        index.add(ids, [chunks[i][0] for i in ids], [chunks[i][1] for i in ids])
+        index.remove(ids[:2])
+        for chunk_id in ids[:2]:
+            del chunks[chunk_id]
+
+    assert len(index) == len(chunks)
+    assert len(index._ids) < 30 + 5 * 10
+    # El reemplazo mueve el chunk al final: el índice nuevo se arma en el mismo orden
+    live = {chunk_id: chunks[chunk_id] for doc, chunk_id in enumerate(index._ids) if index._alive[doc]}
+    assert_same_results(index, live)
+    assert_same_results(index, live, where={"tramite": "general"})
+
+
+# --------- Metadatos y filtros ---------
+
+def test_update_metadata_keeps_cached_masks_in_sync():
+    chunks = make_chunks(12)
+    index = build(chunks)
+    before = {chunk_id for chunk_id, _ in index.search("pago tasa reclamo plan", 50, where={"tramite": "reclamo"})}
+
+    moved = "c0"
+    assert chunks[moved][1]["tramite"] == "reclamo"
+    chunks[moved] = (chunks[moved][0], {"tramite": "general", "chunk_index": 0})
+    index.update_metadata([moved], [chunks[moved][1]])
+
+    after = {chunk_id for chunk_id, _ in index.search("pago tasa reclamo plan", 50, where={"tramite": "reclamo"})}
+    assert moved not in after
+    assert after == before - {moved}
+    assert_same_results(index, chunks, where={"tramite": "reclamo"})
+    assert_same_results(index, chunks, where={"tramite": "general"})
+
+
+def test_where_forms_and_value_types():
+    chunks = {
+        "a": ("pago de la tasa", {"tramite": "reclamo", "chunk_index": 1}),
+        "b": ("pago del plan", {"tramite": "reclamo", "chunk_index": "1"}),
+        "c": ("pago de la deuda", {"tramite": "general", "chunk_index": 1}),
+    }
+    index = build(chunks)
+
+    def ids(where):
+        return sorted(chunk_id for chunk_id, _ in index.search("pago", 10, where=where))
+
+    assert ids({"tramite": "reclamo"}) == ["a", "b"]
+    assert ids({"tramite": {"$eq": "general"}}) == ["c"]
+    assert ids({"$and": [{"tramite": "reclamo"}, {"chunk_index": 1}]}) == ["a"]
+    # 1 y "1" son valores distintos (la clave de la máscara es el JSON del valor)
+    assert ids({"chunk_index": "1"}) == ["b"]
+    assert ids({"tramite": "otro"}) == []
+    with pytest.raises(ValueError):
+        index.search("pago", where={"tramite": {"$ne": "reclamo"}})
+
+
+def test_mask_cache_is_bounded():
+    chunks = make_chunks(15)
+    index = build(chunks, max_cached_masks=2)
+
+    for tramite in TRAMITES:
+        assert_same_results(index, chunks, where={"tramite": tramite})
+        assert len(index._masks) <= 2
@@ -0,0 +1,823 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import (
+    VECTOR_STORE, CHROMA_PATH, COLLECTION_NAME, NUMPY_STORE_PATH,
+    IVF_LISTS, IVF_NPROBE, IVF_MIN_ROWS, VECTOR_QUANTIZATION, QUANTIZATION_RESCORE_FACTOR,
+    EMBED_MODEL, SNAPSHOT_PATH, SNAPSHOT_VERIFY,
+)
+from quantization import (
+    QUANTIZATIONS, code_width, code_dtype, quantize_int8, quantize_binary, int8_scores, binary_scores,
+)
+
+# ------------------------ LOGGING ------------------------
+import logging
+logger = logging.getLogger("VECTOR_STORE")
+# ---------------------------------------------------------
+
+# Cantidad máxima de parámetros por sentencia SQLite (límite conservador)
+_SQL_BATCH = 900
+
+
+class VectorStore(ABC):
+    """
+    Interfaz del almacenamiento de vectores que usa el pipeline RAG. Un
+    backend que no implementa alguno de los métodos abstractos falla al
+    instanciarse, no en el primer llamado.
+
+    - query devuelve [{"id", "document", "metadata", "similarity"}] ordenado
+      por similitud coseno descendente; con include_embeddings cada hit trae
+      además "embedding" (float32, para re-rankear sin releer el store) y con
+      include_documents=False "document" es None (no se leen los textos).
+    - get devuelve un dict al estilo Chroma: "ids" y, según include,
+      "documents", "metadatas" y "embeddings" (np.ndarray).
+    - where admite igualdad sobre metadatos: {"campo": valor},
+      {"campo": {"$eq": valor}} o {"$and": [...]}.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def add(self, ids: List[str], documents: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        ...
+
+    @abstractmethod
+    def query(self, query_emb: np.ndarray, n_results: int,
+              where: Optional[Dict[str, Any]] = None,
+              include_embeddings: bool = False, include_documents: bool = True) -> List[Dict[str, Any]]:
+        ...
+
+    def query_many(self, query_embs: np.ndarray, n_results: int,
+                   where: Optional[Dict[str, Any]] = None,
+                   include_embeddings: bool = False, include_documents: bool = True) -> List[List[Dict[str, Any]]]:
+        """
+        Varias consultas con el mismo filtro; un resultado de query por fila.
+        """
+        return [self.query(q, n_results, where, include_embeddings, include_documents) for q in query_embs]
+
+    @abstractmethod
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Sequence[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def stats(self) -> Dict[str, float]:
+        return {"chunks": self.count()}
+
+    def warmup(self):
+        """
+        Deja el índice cargado en memoria para que la primera consulta no pague la lectura.
+        """
+
+
+def _where_items(where: Optional[Dict[str, Any]]) -> List[Tuple[str, Any]]:
+    """
+    Normaliza un where de igualdad a [(campo, valor)].
+    """
+    if not where:
+        return []
+
+    items: List[Tuple[str, Any]] = []
+    for key, value in where.items():
+        if key == "$and":
+            for clause in value:
+                items.extend(_where_items(clause))
+        elif isinstance(value, dict):
+            if set(value) != {"$eq"}:
+                raise ValueError(f"Filtro no soportado: {key}={value}")
+            items.append((key, value["$eq"]))
+        else:
+            items.append((key, value))
+    return items
+
+
+# --------- Chroma ---------
+
+class ChromaVectorStore(VectorStore):
+    """
+    Vector store sobre una colección persistente de Chroma (HNSW coseno).
+    """
+
+    name = "chroma"
+
+    def __init__(self, path: str, collection_name: str):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+    def add(self, ids, documents, embeddings, metadatas):
+        self.collection.add(
+            ids=ids,
+            documents=documents,
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+            metadatas=metadatas,
+        )
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def query(self, query_emb, n_results, where=None, include_embeddings=False, include_documents=True):
+        return self.query_many(np.asarray([query_emb], dtype=np.float32), n_results, where,
+                               include_embeddings, include_documents)[0]
+
+    def query_many(self, query_embs, n_results, where=None, include_embeddings=False, include_documents=True):
+        # Una sola llamada a Chroma con todas las consultas
+        include = ["metadatas", "distances"]
+        include += ["documents"] if include_documents else []
+        include += ["embeddings"] if include_embeddings else []
+        result = self.collection.query(
+            query_embeddings=np.asarray(query_embs, dtype=np.float32),
+            n_results=n_results,
+            where=where,
+            include=include,
+        )
+        documents = result["documents"] if include_documents else [[None] * len(ids) for ids in result["ids"]]
+        out = [
+            [
+                {"id": cid, "document": doc, "metadata": meta, "similarity": 1 - dist}
+                for cid, doc, meta, dist in zip(ids, docs, metas, dists)
+            ]
+            for ids, docs, metas, dists in zip(
+                result["ids"], documents, result["metadatas"], result["distances"]
+            )
+        ]
+        if include_embeddings:
+            for hits, embeddings in zip(out, result["embeddings"]):
+                for hit, emb in zip(hits, embeddings):
+                    hit["embedding"] = np.asarray(emb, dtype=np.float32)
+        return out
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        result = self.collection.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset or None)
+        out = {"ids": result["ids"]}
+        for key in include:
+            out[key] = result[key]
+        if "embeddings" in include:
+            out["embeddings"] = np.asarray(result["embeddings"], dtype=np.float32)
+        return out
+
+    def count(self):
+        return self.collection.count()
+
+    def warmup(self):
+        # Chroma carga el segmento HNSW en la primera consulta: se hace una con un vector guardado
+        sample = self.collection.get(limit=1, include=["embeddings"])
+        if len(sample["ids"]):
+            self.collection.query(query_embeddings=np.asarray(sample["embeddings"][:1], dtype=np.float32), n_results=1)
+
+
+# --------- NumPy (memoria mapeada) ---------
+
+class NumpyVectorStore(VectorStore):
+    """
+    Vector store en proceso:
+    - vectors.f32: matriz float32 (filas normalizadas) en memoria mapeada,
+      crece duplicando su capacidad
+    - meta.sqlite3: id, texto y metadatos de cada fila
+
+    La búsqueda exacta es un producto matriz-vector (matriz-matriz para
+    varias consultas) y un top-k con argpartition. Los filtros where se evalúan como máscaras booleanas
+    precalculadas por (campo, valor) que se mantienen en cada escritura.
+    Con IVF activo (ivf_lists > 0 y al menos ivf_min_rows filas) solo se
+    puntúan las filas de las ivf_nprobe listas más cercanas a la consulta.
+    Los borrados marcan la fila como inactiva.
+
+    Con quantization "int8" o "binary" se guarda además una copia compacta
+    de cada vector (vectors.i8 + scales.f32, o vectors.u1 con un bit por
+    dimensión). La búsqueda recorre solo esos códigos y re-puntúa con los
+    float32 los rescore_factor * n_results mejores candidatos, así que de
+    la matriz float32 solo se leen esas filas.
+    """
+
+    name = "numpy"
+
+    def __init__(self, path: str, ivf_lists: int = 0, ivf_nprobe: int = 8, ivf_min_rows: int = 20000,
+                 max_cached_masks: int = 256, quantization: str = "float", rescore_factor: int = 10):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Cuantización desconocida: {quantization} (opciones: {QUANTIZATIONS})")
+        os.makedirs(path, exist_ok=True)
+        self._init_state(path, ivf_lists, ivf_nprobe, ivf_min_rows, max_cached_masks, quantization, rescore_factor)
+
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                alive INTEGER NOT NULL DEFAULT 1
+            )
+            """
+        )
+        self._conn.commit()
+
+        dim = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+        self.dim = int(dim[0]) if dim else None
+
+        self._load()
+
+    def _init_state(self, path: str, ivf_lists: int, ivf_nprobe: int, ivf_min_rows: int,
+                    max_cached_masks: int, quantization: str, rescore_factor: int):
+        """
+        Configuración y estado en memoria de un store vacío; lo comparten este
+        store y SnapshotVectorStore, que después solo aporta sus filas.
+        """
+        self.path = path
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.ivf_lists = ivf_lists
+        self.ivf_nprobe = ivf_nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.max_cached_masks = max_cached_masks
+
+        self._lock = threading.RLock()
+        self.dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._codes: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._capacity = 0
+        self._n = 0
+        self._ids: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of: Dict[str, int] = {}
+        self._masks: Dict[Tuple[str, str], np.ndarray] = {}
+
+        self._ivf_centroids: Optional[np.ndarray] = None
+        self._ivf_assign = np.zeros(0, dtype=np.int32)
+        self._ivf_trained_rows = 0
+
+    # --------- Carga y capacidad ---------
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    def _codes_path(self) -> str:
+        return os.path.join(self.path, "vectors.i8" if self.quantization == "int8" else "vectors.u1")
+
+    def _info(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _load(self):
+        t0 = time.perf_counter()
+        rows = self._conn.execute("SELECT row, id, metadata, alive FROM chunks ORDER BY row").fetchall()
+        if not rows:
+            return
+
+        self._n = rows[-1][0] + 1
+        self._open_vectors(max(self._n, self._file_capacity()))
+        self._ids = [""] * self._n
+        self._metadatas = [{} for _ in range(self._n)]
+        for row, chunk_id, metadata, alive in rows:
+            self._ids[row] = chunk_id
+            self._metadatas[row] = json.loads(metadata)
+            if alive:
+                self._alive[row] = True
+                self._row_of[chunk_id] = row
+
+        # Filas guardadas sin cuantizar (store creado en modo float o con otra cuantización)
+        if self.quantization != "float":
+            encoded = int(self._info(f"encoded_rows_{self.quantization}") or 0)
+            if encoded < self._n:
+                self._encode_rows(encoded, self._n)
+                self._conn.commit()
+
+        logger.info(
+            f"[VECTOR_STORE] Store numpy cargado: {len(self._row_of)} vectores dim={self.dim} "
+            f"cuantización={self.quantization} en {(time.perf_counter() - t0) * 1000:.1f} ms"
+        )
+
+    def _file_capacity(self) -> int:
+        if not self.dim or not os.path.exists(self._vectors_path()):
+            return 0
+        return os.path.getsize(self._vectors_path()) // (4 * self.dim)
+
+    @staticmethod
+    def _memmap(path: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+        with open(path, "ab") as f:
+            f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open_vectors(self, capacity: int):
+        for current in (self._vectors, self._codes, self._scales):
+            if current is not None:
+                current.flush()
+        self._vectors = self._codes = self._scales = None
+
+        self._vectors = self._memmap(self._vectors_path(), np.float32, (capacity, self.dim))
+        if self.quantization != "float":
+            width = code_width(self.quantization, self.dim)
+            self._codes = self._memmap(self._codes_path(), code_dtype(self.quantization), (capacity, width))
+        if self.quantization == "int8":
+            self._scales = self._memmap(os.path.join(self.path, "scales.f32"), np.float32, (capacity,))
+
+        grow = capacity - self._capacity
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+        self._ivf_assign = np.concatenate([self._ivf_assign, np.full(grow, -1, dtype=np.int32)])
+        for key, mask in self._masks.items():
+            self._masks[key] = np.concatenate([mask, np.zeros(grow, dtype=bool)])
+        self._capacity = capacity
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = max(1024, self._capacity)
+        while capacity < rows:
+            capacity *= 2
+        self._open_vectors(capacity)
+
+    # --------- Escritura ---------
+
+    def add(self, ids, documents, embeddings, metadatas):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(ids):
+            return
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(embeddings.shape[1])
+                self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Dimensión {embeddings.shape[1]} distinta de la del store ({self.dim})")
+
+            self._delete_locked([i for i in ids if i in self._row_of])
+
+            start = self._n
+            end = start + len(ids)
+            self._ensure_capacity(end)
+
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            self._vectors[start:end] = embeddings / np.maximum(norms, 1e-12)
+            self._vectors.flush()
+            if self.quantization != "float":
+                self._encode_rows(start, end)
+
+            self._conn.executemany(
+                "INSERT INTO chunks (row, id, document, metadata, alive) VALUES (?, ?, ?, ?, 1)",
+                [
+                    (start + i, chunk_id, doc, json.dumps(meta, ensure_ascii=False))
+                    for i, (chunk_id, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            self._conn.commit()
+
+            self._n = end
+            self._ids.extend(ids)
+            self._metadatas.extend(dict(m) for m in metadatas)
+            self._alive[start:end] = True
+            for i, chunk_id in enumerate(ids):
+                self._row_of[chunk_id] = start + i
+            self._refresh_masks(range(start, end))
+
+            if self._ivf_centroids is not None:
+                self._ivf_assign[start:end] = self._nearest_lists(self._vectors[start:end])
+
+    def _encode_rows(self, start: int, end: int):
+        """
+        Cuantiza las filas [start, end) de la matriz float32 (se confirma con
+        el próximo commit de SQLite).
+        """
+        for block in range(start, end, 65536):
+            stop = min(block + 65536, end)
+            vectors = np.asarray(self._vectors[block:stop])
+            if self.quantization == "int8":
+                self._codes[block:stop], self._scales[block:stop] = quantize_int8(vectors)
+            else:
+                self._codes[block:stop] = quantize_binary(vectors)
+        self._codes.flush()
+        if self._scales is not None:
+            self._scales.flush()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)",
+            (f"encoded_rows_{self.quantization}", str(end)),
+        )
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            updates = [(self._row_of[i], m) for i, m in zip(ids, metadatas) if i in self._row_of]
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE row = ?",
+                [(json.dumps(m, ensure_ascii=False), row) for row, m in updates],
+            )
+            self._conn.commit()
+            for row, meta in updates:
+                self._metadatas[row] = dict(meta)
+            self._refresh_masks([row for row, _ in updates])
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_locked(ids)
+
+    def _delete_locked(self, ids: List[str]):
+        rows = [self._row_of.pop(i) for i in ids if i in self._row_of]
+        if not rows:
+            return
+        self._alive[rows] = False
+        self._conn.executemany("UPDATE chunks SET alive = 0 WHERE row = ?", [(r,) for r in rows])
+        self._conn.commit()
+
+    # --------- Filtros ---------
+
+    @staticmethod
+    def _mask_key(key: str, value: Any) -> Tuple[str, str]:
+        return key, json.dumps(value)
+
+    def _mask(self, key: str, value: Any) -> np.ndarray:
+        cache_key = self._mask_key(key, value)
+        mask = self._masks.get(cache_key)
+        if mask is None:
+            if len(self._masks) >= self.max_cached_masks:
+                self._masks.clear()
+            mask = np.zeros(self._capacity, dtype=bool)
+            mask[:self._n] = np.fromiter(
+                (m.get(key) == value for m in self._metadatas), dtype=bool, count=self._n
+            )
+            self._masks[cache_key] = mask
+        return mask
+
+    def _refresh_masks(self, rows: Iterable[int]):
+        rows = list(rows)
+        for (key, value_json), mask in self._masks.items():
+            value = json.loads(value_json)
+            for row in rows:
+                mask[row] = self._metadatas[row].get(key) == value
+
+    def _filter(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = self._alive[:self._n].copy()
+        for key, value in _where_items(where):
+            mask &= self._mask(key, value)[:self._n]
+        return mask
+
+    # --------- IVF ---------
+
+    def _ivf_active(self) -> bool:
+        return self.ivf_lists > 0 and len(self._row_of) >= self.ivf_min_rows
+
+    def _nearest_lists(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(np.asarray(vectors) @ self._ivf_centroids.T, axis=1).astype(np.int32)
+
+    def _train_ivf(self, iterations: int = 10, seed: int = 0):
+        """
+        k-means esférico sobre una muestra de las filas activas; luego
+        asigna cada fila a su lista más cercana.
+        """
+        t0 = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        live = np.flatnonzero(self._alive[:self._n])
+        sample = rng.choice(live, size=min(len(live), self.ivf_lists * 64), replace=False)
+        data = np.asarray(self._vectors[np.sort(sample)])
+
+        centroids = data[rng.choice(len(data), size=self.ivf_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            for c in range(self.ivf_lists):
+                members = data[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        self._ivf_centroids = centroids
+        for start in range(0, self._n, 65536):
+            end = min(start + 65536, self._n)
+            self._ivf_assign[start:end] = self._nearest_lists(self._vectors[start:end])
+        self._ivf_trained_rows = len(live)
+
+        logger.info(
+            f"[VECTOR_STORE] IVF entrenado: {self.ivf_lists} listas sobre {len(live)} vectores "
+            f"en {(time.perf_counter() - t0) * 1000:.1f} ms"
+        )
+
+    def _candidate_rows(self, q: np.ndarray) -> np.ndarray:
+        if self._ivf_centroids is None or len(self._row_of) > 2 * self._ivf_trained_rows:
+            self._train_ivf()
+        nprobe = min(self.ivf_nprobe, self.ivf_lists)
+        probe = np.argpartition(-(self._ivf_centroids @ q), nprobe - 1)[:nprobe]
+        return np.flatnonzero(np.isin(self._ivf_assign[:self._n], probe))
+
+    # --------- Consulta ---------
+
+    def query(self, query_emb, n_results, where=None, include_embeddings=False, include_documents=True):
+        return self.query_many(np.asarray([query_emb], dtype=np.float32), n_results, where,
+                               include_embeddings, include_documents)[0]
+
+    def query_many(self, query_embs, n_results, where=None, include_embeddings=False, include_documents=True):
+        """
+        Sin IVF, todas las consultas se puntúan con un único producto
+        matriz-matriz y un argpartition por fila.
+        """
+        Q = np.asarray(query_embs, dtype=np.float32)
+        Q = Q / np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            if not self._n or n_results <= 0:
+                return [[] for _ in range(len(Q))]
+            mask = self._filter(where)
+
+            if self._ivf_active():
+                found = [self._top_ivf(q, mask, n_results) for q in Q]
+            elif self.quantization != "float":
+                rows = np.flatnonzero(mask) if where else None
+                found = self._top_rescored(Q, rows, mask, n_results)
+            else:
+                found = self._top_exact(Q, mask, n_results, filtered=bool(where))
+
+            documents = (
+                self._documents(sorted({int(r) for rows, _ in found for r in rows})) if include_documents else {}
+            )
+            out = [
+                [
+                    {
+                        "id": self._ids[r],
+                        "document": documents.get(r),
+                        "metadata": self._metadatas[r],
+                        "similarity": float(s),
+                    }
+                    for r, s in zip(rows.tolist(), scores.tolist())
+                ]
+                for rows, scores in found
+            ]
+            if include_embeddings:
+                # Las filas guardadas ya están normalizadas
+                for hits, (rows, _) in zip(out, found):
+                    for hit, vec in zip(hits, np.asarray(self._vectors[rows])):
+                        hit["embedding"] = vec
+            return out
+
+    def _top_exact(self, Q: np.ndarray, mask: np.ndarray, n_results: int,
+                   filtered: bool) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if filtered:
+            rows = np.flatnonzero(mask)
+            scores = Q @ np.asarray(self._vectors[rows]).T
+        else:
+            rows = None
+            scores = Q @ np.asarray(self._vectors[:self._n]).T
+            scores[:, ~mask] = -np.inf
+
+        k = min(n_results, int(mask.sum()))
+        if k == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(len(Q))]
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if rows is not None:
+            top = rows[top]
+        return list(zip(top, top_scores))
+
+    def _coarse_scores(self, Q: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Scores aproximados sobre los códigos cuantizados (todas las filas si rows es None).
+        """
+        codes = self._codes[:self._n] if rows is None else self._codes[rows]
+        if self.quantization == "int8":
+            scales = self._scales[:self._n] if rows is None else self._scales[rows]
+            return int8_scores(Q, codes, scales)
+        return binary_scores(Q, codes)
+
+    def _top_rescored(self, Q: np.ndarray, rows: Optional[np.ndarray], mask: np.ndarray,
+                      n_results: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Búsqueda en dos pasos: candidatos por score cuantizado y re-puntuación
+        exacta con los float32 de esos candidatos.
+        """
+        k = min(n_results, int(mask.sum()) if rows is None else len(rows))
+        if k == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in range(len(Q))]
+
+        coarse = self._coarse_scores(Q, rows)
+        if rows is None:
+            coarse[:, ~mask] = -np.inf
+            rows = np.arange(self._n)
+        n_candidates = min(len(rows), k * self.rescore_factor)
+        candidates = np.argpartition(-coarse, n_candidates - 1, axis=1)[:, :n_candidates]
+
+        found = []
+        for q, cand in zip(Q, candidates):
+            cand_rows = np.sort(rows[cand])
+            cand_rows = cand_rows[mask[cand_rows]]
+            scores = np.asarray(self._vectors[cand_rows]) @ q
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            found.append((cand_rows[top], scores[top]))
+        return found
+
+    def _top_ivf(self, q: np.ndarray, mask: np.ndarray, n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+        candidates = self._candidate_rows(q)
+        rows = candidates[mask[candidates]]
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.quantization != "float":
+            return self._top_rescored(q[None, :], rows, mask, n_results)[0]
+
+        scores = np.asarray(self._vectors[rows]) @ q
+        k = min(n_results, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def _documents(self, rows: List[int]) -> Dict[int, str]:
+        out: Dict[int, str] = {}
+        for start in range(0, len(rows), _SQL_BATCH):
+            part = rows[start:start + _SQL_BATCH]
+            placeholders = ",".join("?" * len(part))
+            for row, doc in self._conn.execute(
+                f"SELECT row, document FROM chunks WHERE row IN ({placeholders})", part
+            ):
+                out[row] = doc
+        return out
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=0):
+        with self._lock:
+            if ids is not None:
+                rows = [self._row_of[i] for i in ids if i in self._row_of]
+                if where:
+                    mask = self._filter(where)
+                    rows = [r for r in rows if mask[r]]
+            else:
+                rows = np.flatnonzero(self._filter(where)).tolist()
+            rows = rows[offset:offset + limit if limit is not None else None]
+
+            out: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+            if "documents" in include:
+                documents = self._documents(rows)
+                out["documents"] = [documents[r] for r in rows]
+            if "metadatas" in include:
+                out["metadatas"] = [self._metadatas[r] for r in rows]
+            if "embeddings" in include:
+                out["embeddings"] = (
+                    np.asarray(self._vectors[rows]) if rows else np.zeros((0, self.dim or 0), dtype=np.float32)
+                )
+            return out
+
+    def count(self):
+        return len(self._row_of)
+
+    def warmup(self):
+        # Recorre la matriz para traer sus páginas a memoria y entrena IVF si corresponde
+        with self._lock:
+            if self._vectors is None or not self._n:
+                return
+            # Con cuantización la búsqueda recorre los códigos; los float32 se leen por fila
+            scanned = self._codes if self.quantization != "float" else self._vectors
+            for start in range(0, self._n, 65536):
+                float(np.asarray(scanned[start:min(start + 65536, self._n)], dtype=np.float32).sum())
+            if self._ivf_active() and self._ivf_centroids is None:
+                self._train_ivf()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks": len(self._row_of),
+                "rows": self._n,
+                "capacity": self._capacity,
+                "ivf_lists": self.ivf_lists if self._ivf_centroids is not None else 0,
+                "cached_masks": len(self._masks),
+                "quantization": self.quantization,
+                # Bytes que recorre cada búsqueda (códigos cuantizados o la matriz float32)
+                "scan_bytes": self._n * (code_width(self.quantization, self.dim or 0)
+                                         + (4 if self.quantization == "int8" else 0)),
+            }
+
+
+class SnapshotVectorStore(NumpyVectorStore):
+    """
+    Store de solo lectura sobre un snapshot portable del índice (ver
+    snapshot.py): la matriz float32 es una vista np.frombuffer sobre el
+    archivo mapeado y los textos y metadatos se decodifican por fila al
+    pedirlos, así que abrirlo cuesta leer el manifest y los ids.
+
+    Reutiliza la búsqueda exacta, los filtros e IVF del store numpy; no
+    admite escrituras (para un índice editable: python -m snapshot import).
+    """
+
+    name = "snapshot"
+
+    def __init__(self, path: str, ivf_lists: int = 0, ivf_nprobe: int = 8, ivf_min_rows: int = 20000,
+                 max_cached_masks: int = 256, verify: bool = False):
+        from snapshot import SnapshotReader, SnapshotError
+
+        t0 = time.perf_counter()
+        reader = SnapshotReader(path)
+        if reader.embed_model != EMBED_MODEL:
+            reader.close()
+            raise SnapshotError(f"El snapshot {path} usa {reader.embed_model} y el servicio {EMBED_MODEL}")
+        if verify:
+            bad = reader.verify()
+            if bad:
+                reader.close()
+                raise SnapshotError(f"Checksums inválidos en {path}: {', '.join(bad)}")
+
+        self._init_state(path, ivf_lists, ivf_nprobe, ivf_min_rows, max_cached_masks,
+                         quantization="float", rescore_factor=1)
+
+        # Las filas vienen del snapshot: vectores mapeados, ids y metadatos perezosos
+        self._reader = reader
+        self.dim = reader.dim or None
+        self._vectors = reader.vectors
+        self._capacity = self._n = reader.count
+        self._ids = reader.ids()
+        self._metadatas = reader.metadatas()
+        self._alive = np.ones(reader.count, dtype=bool)
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._ivf_assign = np.full(reader.count, -1, dtype=np.int32)
+
+        logger.info(
+            f"[VECTOR_STORE] Snapshot abierto: {self._n} vectores dim={self.dim} "
+            f"modelo={reader.embed_model} creado={reader.manifest.get('created_at')} "
+            f"en {(time.perf_counter() - t0) * 1000:.1f} ms"
+        )
+
+    def _read_only(self, *args, **kwargs):
+        raise RuntimeError(
+            f"El store snapshot ({self.path}) es de solo lectura; "
+            "para indexar usar chroma o numpy (python -m snapshot import)"
+        )
+
+    add = update_metadata = delete = _read_only
+
+    def _documents(self, rows: List[int]) -> Dict[int, str]:
+        return {row: self._reader.document(row) for row in rows}
+
+    def warmup(self):
+        # Decodifica todos los metadatos para que el primer filtro no lo haga en la consulta
+        with self._lock:
+            for _ in self._metadatas:
+                pass
+        super().warmup()
+
+    def stats(self):
+        return {**super().stats(), "decoded_metadatas": self._metadatas.decoded()}
+
+
+# --------- Selección del backend ---------
+
+def copy_vectors(source: VectorStore, target: VectorStore, page_size: int = 1000) -> int:
+    """
+    Copia todos los chunks (texto, metadatos y embeddings) de un store a otro.
+    """
+    copied = 0
+    while True:
+        page = source.get(include=("documents", "metadatas", "embeddings"), limit=page_size, offset=copied)
+        if not page["ids"]:
+            return copied
+        target.add(page["ids"], page["documents"], page["embeddings"], page["metadatas"])
+        copied += len(page["ids"])
+
+
+def create_vector_store(kind: str = VECTOR_STORE) -> VectorStore:
+    if kind == "chroma":
+        if VECTOR_QUANTIZATION != "float":
+            logger.warning("[VECTOR_STORE] VECTOR_QUANTIZATION solo aplica al store numpy; Chroma guarda float32")
+        return ChromaVectorStore(CHROMA_PATH, COLLECTION_NAME)
+
+    if kind == "numpy":
+        store = NumpyVectorStore(
+            NUMPY_STORE_PATH, ivf_lists=IVF_LISTS, ivf_nprobe=IVF_NPROBE, ivf_min_rows=IVF_MIN_ROWS,
+            quantization=VECTOR_QUANTIZATION, rescore_factor=QUANTIZATION_RESCORE_FACTOR,
+        )
+        # Primera vez con el store numpy: se importa lo que ya hay en Chroma
+        if store.count() == 0 and os.path.isdir(CHROMA_PATH):
+            copied = copy_vectors(ChromaVectorStore(CHROMA_PATH, COLLECTION_NAME), store)
+            if copied:
+                logger.info(f"[VECTOR_STORE] {copied} chunks importados desde Chroma ({CHROMA_PATH})")
+        return store
+
+    if kind == "snapshot":
+        return SnapshotVectorStore(
+            SNAPSHOT_PATH, ivf_lists=IVF_LISTS, ivf_nprobe=IVF_NPROBE, ivf_min_rows=IVF_MIN_ROWS,
+            verify=SNAPSHOT_VERIFY,
+        )
+
+    raise ValueError(f"VECTOR_STORE desconocido: {kind}")
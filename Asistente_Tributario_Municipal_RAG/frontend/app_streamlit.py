@@ -1,7 +1,9 @@
+import json
+
 import streamlit as st
 import requests
 
-FASTAPI_URL = "http://127.0.0.1:8000/query"
+FASTAPI_STREAM_URL = "http://127.0.0.1:8000/query/stream"
 
 st.set_page_config(
     page_title="Asistente Tributario Municipal",
@@ -9,6 +11,29 @@ st.set_page_config(
     layout="centered"
 )
 
+
+def stream_answer(response, metadata: dict):
+    """
+    Lee los Server-Sent Events de /query/stream.
+    Devuelve los fragmentos de texto a medida que llegan (para st.write_stream)
+    y guarda el evento final de metadatos en `metadata`.
+    """
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data = json.loads(line[len("data:"):].strip())
+            if event == "token":
+                yield data["text"]
+            elif event == "metadata":
+                metadata.update(data)
+            elif event == "error":
+                metadata["error"] = data.get("detail", "Error en el servicio.")
+
+
 st.title("🤖 Asistente de Orientación Tributaria Municipal")
 st.write("Haz una pregunta sobre trámites, reclamos o pagos municipales y el asistente responderá basado solo en documentos oficiales cargados.")
 
@@ -19,32 +44,39 @@ if st.button("Consultar"):
     if not question.strip():
         st.warning("Por favor escribe una pregunta antes de continuar.")
     else:
-        with st.spinner("Procesando tu consulta..."):
-            try:
-                payload = {"question": question}
-                response = requests.post(FASTAPI_URL, json=payload)
+        try:
+            payload = {"question": question, "priority": "interactive"}
+            with st.spinner("Buscando en los documentos oficiales..."):
+                response = requests.post(FASTAPI_STREAM_URL, json=payload, stream=True)
 
-                if response.status_code == 200:
-                    data = response.json()
+            if response.status_code == 200:
+                metadata = {}
 
-                    st.success("Respuesta generada correctamente")
+                st.subheader("🧠 Respuesta")
+                st.write_stream(stream_answer(response, metadata))
 
-                    st.subheader("🧠 Respuesta")
-                    st.write(data["answer"])
+                if "error" in metadata:
+                    st.error("Error en el servicio. Ver consola FastAPI.")
+                    st.write(metadata["error"])
+                else:
+                    if metadata.get("degraded"):
+                        st.warning("Alta demanda: se muestra el fragmento más relevante sin elaborar la respuesta.")
+                    else:
+                        st.success("Respuesta generada correctamente")
 
                     st.divider()
 
                     col1, col2 = st.columns(2)
-                    col1.metric("Grounded", "Sí" if data["grounded"] else "No")
-                    col2.metric("Similitud", f"{data['similarity_score']:.2f}")
+                    col1.metric("Grounded", "Sí" if metadata.get("grounded") else "No")
+                    col2.metric("Similitud", f"{metadata.get('similarity_score', 0.0):.2f}")
 
                     with st.expander("📚 Ver contexto utilizado"):
-                        st.write(data["context_used"])
+                        st.write(metadata.get("context_used", ""))
 
-                else:
-                    st.error("Error en el servicio. Ver consola FastAPI.")
-                    st.json(response.json())
+            else:
+                st.error("Error en el servicio. Ver consola FastAPI.")
+                st.json(response.json())
 
-            except Exception as e:
-                st.error("No se pudo conectar con la API.")
-                st.write(str(e))
+        except Exception as e:
+            st.error("No se pudo conectar con la API.")
+            st.write(str(e))